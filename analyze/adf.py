@@ -3,12 +3,14 @@
 import os
 import csv
 import math
-import linecache
 import numpy as np
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.tools import call
+from CP2K_kit.tools import neighbor
 from CP2K_kit.lib import geometry_mod
 from CP2K_kit.analyze import check_analyze
 
@@ -54,51 +56,34 @@ def angle(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, f
       atom_id_2 contains atom id of atom_type_2
   '''
 
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
+
   atom_id_1 = []
   atom_id_2 = []
   atom_id_3 = []
   for i in range(atoms_num):
-    line_i = linecache.getline(traj_coord_file, pre_base_block+pre_base+i+1)
-    line_i_split = data_op.split_str(line_i, ' ')
-    if ( line_i_split[0] == atom_type_1 ):
+    if ( atoms[i] == atom_type_1 ):
       atom_id_1.append(i+1)
-    if ( line_i_split[0] == atom_type_2 ):
+    if ( atoms[i] == atom_type_2 ):
       atom_id_2.append(i+1)
-    if ( line_i_split[0] == atom_type_3 ):
+    if ( atoms[i] == atom_type_3 ):
       atom_id_3.append(i+1)
 
-  frame_num_stat = int((end_step-init_step)/each+1)
-
   angle = []
-  for i in range(frame_num_stat):
+  for element, coord, cell, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
     angle_i = []
     for j in atom_id_1:
       for k in atom_id_2:
         for l in atom_id_3:
           if ( l > j ):
-            line_j_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+j+pre_base_block+pre_base
-            line_j = linecache.getline(traj_coord_file, line_j_num)
-            line_j_split = data_op.split_str(line_j, ' ', '\n')
-            line_k_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+k+pre_base_block+pre_base
-            line_k = linecache.getline(traj_coord_file, line_k_num)
-            line_k_split = data_op.split_str(line_k, ' ', '\n')
-            line_l_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+l+pre_base_block+pre_base
-            line_l = linecache.getline(traj_coord_file, line_l_num)
-            line_l_split = data_op.split_str(line_l, ' ', '\n')
-            coord_1 = []
-            coord_2 = []
-            coord_3 = []
-            coord_1.append([float(line_j_split[1]),float(line_j_split[2]),float(line_j_split[3])])
-            coord_2.append([float(line_k_split[1]),float(line_k_split[2]),float(line_k_split[3])])
-            coord_3.append([float(line_l_split[1]),float(line_l_split[2]),float(line_l_split[3])])
-            ang = geometry_mod.geometry.calculate_angle(np.asfortranarray(coord_1, dtype='float32'), \
-                                                        np.asfortranarray(coord_2, dtype='float32'), \
-                                                        np.asfortranarray(coord_3, dtype='float32'))
+            coord_1 = np.asfortranarray(coord[[j-1],:], dtype='float32')
+            coord_2 = np.asfortranarray(coord[[k-1],:], dtype='float32')
+            coord_3 = np.asfortranarray(coord[[l-1],:], dtype='float32')
+            ang = geometry_mod.geometry.calculate_angle(coord_1, coord_2, coord_3)
             angle_i.append(ang[0])
     angle.append(angle_i)
 
-  linecache.clearcache()
-
   return angle
 
 def adf(angle, a_increment, work_dir):
@@ -131,6 +116,166 @@ def adf(angle, a_increment, work_dir):
 
   return adf_file
 
+def get_neighbor_vec(coord, cell, r_cut, atom_id_center, atom_id_neighbor):
+
+  '''
+  get_neighbor_vec: get vectors from center atoms to their neighbors within cutoff.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    r_cut: float
+      r_cut is the cutoff, it is not larger than half of the box.
+    atom_id_center: 1-d int array
+      atom_id_center contains atom id (starting from 1) of center atoms.
+    atom_id_neighbor: 1-d int array
+      atom_id_neighbor contains atom id (starting from 1) of neighbor atoms.
+  Returns:
+    pair_center: 1-d int array
+      pair_center contains the index of center atom in atom_id_center for each pair.
+    pair_neighbor: 1-d int array
+      pair_neighbor contains the index of neighbor atom in atom_id_neighbor for each pair.
+    vec: 2-d float array, dim = (number of pairs)*3
+      vec contains the minimum image vector from center atom to neighbor atom.
+  '''
+
+  pair_center, pair_neighbor, dist = neighbor.get_neighbor_pair(coord, cell, r_cut, atom_id_center, atom_id_neighbor)
+
+  coord = np.array(coord, dtype='float64')
+  vec = coord[atom_id_neighbor[pair_neighbor]-1]-coord[atom_id_center[pair_center]-1]
+  frac = np.dot(vec, np.linalg.inv(cell))
+  vec = np.dot(frac-np.round(frac), cell)
+
+  return pair_center, pair_neighbor, vec
+
+def get_adf_hist(coord, atom_id_1, atom_id_2, atom_id_3, cell, r_cut, a_increment, data_num):
+
+  '''
+  get_adf_hist: count angles of neighbor triplets of one frame in angle bins.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id (starting from 1) of atom_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id (starting from 1) of atom_2, it is the vertex of angles.
+    atom_id_3: 1-d int array
+      atom_id_3 contains atom id (starting from 1) of atom_3.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    r_cut: 1-d float list, dim = 2
+      r_cut contains the cutoff of atom_1-atom_2 and atom_3-atom_2.
+    a_increment: float
+      a_increment is the increment of angle.
+    data_num: int
+      data_num is the number of bins.
+  Returns:
+    adf_hist: 1-d int array, dim = data_num+1
+      The bin k counts angles in (k*a_increment, (k+1)*a_increment], it is same
+      as geometry_mod.adf. The bin 0 is not counted.
+    angles_num: int
+      angles_num is the number of angles in the frame.
+  '''
+
+  #Neighbors of each vertex are found by cell list, then every atom_1 neighbor
+  #is combined with every atom_3 neighbor of the same vertex.
+  center_1, neighbor_1, vec_1 = get_neighbor_vec(coord, cell, r_cut[0], atom_id_2, atom_id_1)
+  center_3, neighbor_3, vec_3 = get_neighbor_vec(coord, cell, r_cut[1], atom_id_2, atom_id_3)
+
+  order_3 = np.argsort(center_3, kind='stable')
+  count_3 = np.bincount(center_3, minlength=len(atom_id_2))
+  start_3 = np.cumsum(count_3)-count_3
+
+  count_13 = count_3[center_1]
+  triplet_1 = np.repeat(np.arange(len(center_1)), count_13)
+  triplet_start = np.repeat(np.cumsum(count_13)-count_13, count_13)
+  triplet_3 = order_3[np.repeat(start_3[center_1], count_13)+np.arange(np.sum(count_13))-triplet_start]
+
+  #If atom_1 and atom_3 are the same type, each pair of neighbors is one angle.
+  id_1 = atom_id_1[neighbor_1[triplet_1]]
+  id_3 = atom_id_3[neighbor_3[triplet_3]]
+  if ( np.array_equal(atom_id_1, atom_id_3) ):
+    choose = id_3 > id_1
+  else:
+    choose = id_3 != id_1
+  vec_1 = vec_1[triplet_1[choose]]
+  vec_3 = vec_3[triplet_3[choose]]
+
+  norm = np.sqrt(np.sum(vec_1**2, axis=1)*np.sum(vec_3**2, axis=1))
+  with np.errstate(divide='ignore', invalid='ignore'):
+    angle = np.degrees(np.arccos(np.clip(np.sum(vec_1*vec_3, axis=1)/norm, -1.0, 1.0)))
+  angle = angle[np.isfinite(angle)]
+
+  bin_id = np.ceil(angle/a_increment).astype('int64')-1
+  bin_id = bin_id[(bin_id >= 1) & (bin_id <= data_num)]
+  adf_hist = np.bincount(bin_id, minlength=data_num+1)
+
+  return adf_hist, len(angle)
+
+def adf_neighbor(init_step, end_step, atom_type_1, atom_type_2, atom_type_3, a_vec, b_vec, c_vec, \
+                 r_cut, a_increment, traj_coord_file, work_dir):
+
+  '''
+  adf_neighbor: get adf of neighbor triplets, the angles are counted frame by frame.
+
+  Args:
+    init_step: int
+      init_step is the initial step frame id.
+    end_step: int
+      end_step is the ending step frame id.
+    atom_type_1: string
+      atom_type_1 is the name of atom 1.
+    atom_type_2: string
+      atom_type_2 is the name of atom 2, it is the vertex of angles.
+    atom_type_3: string
+      atom_type_3 is the name of atom 3.
+    a_vec: 1-d float list, dim = 3
+      a_vec is the cell vector a.
+    b_vec: 1-d float list, dim = 3
+      b_vec is the cell vector b.
+    c_vec: 1-d float list, dim = 3
+      c_vec is the cell vector c.
+    r_cut: 1-d float list, dim = 2
+      r_cut contains the cutoff of atom_1-atom_2 and atom_3-atom_2.
+    a_increment: float
+      a_increment is the increment of angle.
+    traj_coord_file: string
+      traj_coord_file is the name of coordination trajectory file.
+    work_dir: string
+      work_dir is the working directory of CP2K_kit.
+  Returns:
+    adf_file: string
+      adf_file contains adf information.
+  '''
+
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = np.array(traj_reader.read_elements(traj_coord_file, frame_index, 0))
+  atom_id_1 = np.nonzero(atoms == atom_type_1)[0]+1
+  atom_id_2 = np.nonzero(atoms == atom_type_2)[0]+1
+  atom_id_3 = np.nonzero(atoms == atom_type_3)[0]+1
+  cell = np.array([a_vec, b_vec, c_vec], dtype='float64')
+
+  data_num = int(180.0/a_increment)
+  adf_hist = np.zeros(data_num+1, dtype='int64')
+  angles_num = 0
+  for element, coord, cell_i, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
+    adf_hist_i, angles_num_i = get_adf_hist(coord, atom_id_1, atom_id_2, atom_id_3, cell, r_cut, a_increment, data_num)
+    adf_hist = adf_hist+adf_hist_i
+    angles_num = angles_num+angles_num_i
+
+  #The adf is normalized by the number of angles of all frames.
+  adf_file = ''.join((work_dir, '/adf.csv'))
+  with open(adf_file ,'w') as csvfile:
+    writer = csv.writer(csvfile)
+    writer.writerow(['angle(degree)', 'adf'])
+    for i in range(data_num-1):
+      writer.writerow([a_increment*(i+1), adf_hist[i+1]/max(1, angles_num)])
+
+  return adf_file
+
 def adf_run(adf_param, work_dir):
 
   '''
@@ -164,9 +309,16 @@ def adf_run(adf_param, work_dir):
 
   print ('ADF'.center(80, '*'), flush=True)
   print ('Analyze distribution of angular between %s and %s and %s' %(atom_1, atom_2, atom_3), flush=True)
-  angle_whole = angle(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, \
-                      init_step, end_step, atom_1, atom_2, atom_3,  traj_coord_file, work_dir)
+  if ( 'r_cut' in adf_param.keys() ):
+    a_vec = adf_param['box']['A']
+    b_vec = adf_param['box']['B']
+    c_vec = adf_param['box']['C']
+    adf_file = adf_neighbor(init_step, end_step, atom_1, atom_2, atom_3, a_vec, b_vec, c_vec, \
+                            adf_param['r_cut'], a_increment, traj_coord_file, work_dir)
+  else:
+    angle_whole = angle(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, \
+                        init_step, end_step, atom_1, atom_2, atom_3,  traj_coord_file, work_dir)
+    adf_file = adf(angle_whole, a_increment, work_dir)
 
-  adf_file = adf(angle_whole, a_increment, work_dir)
   str_print = 'The adf file is written in %s' %(adf_file)
   print (data_op.str_wrap(str_print, 80), flush=True)
@@ -2,6 +2,7 @@
 
 import sys
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_tools
 from CP2K_kit.tools import read_input
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
@@ -18,6 +19,8 @@ from CP2K_kit.analyze import v_hartree
 from CP2K_kit.analyze import free_energy
 from CP2K_kit.analyze import arrange_data
 from CP2K_kit.analyze import time_correlation
+from CP2K_kit.analyze import traj_cache
+from CP2K_kit.analyze import follow
 
 #We add a new keyword: analyze_job. We will use this keyword to assign job. 
 work_dir = str(sys.argv[1])
@@ -36,6 +39,15 @@ job_type_param = read_input.dump_info(work_dir, inp_file, [analyze_job])
 #basis information of the trajectory.
 if ( analyze_job == 'traj_info' ):
   traj_info_param = job_type_param[0]
+  traj_summary = traj_info.get_traj_summary(traj_info_param['traj_coord_file'], 'coord_xyz')
+  if ( traj_summary['incomplete'] and 'truncate' in traj_info_param.keys() ):
+    if ( data_op.str_to_bool(traj_info_param['truncate']) == True ):
+      break_frame = traj_tools.find_breakpoint(traj_info_param['traj_coord_file'], 'coord_xyz', True)
+      str_print = 'Truncate %s at the incomplete frame %d (byte %d)' \
+                  %(traj_info_param['traj_coord_file'], break_frame, traj_summary['frame_index']['offset'][-1])
+      print (data_op.str_wrap(str_print, 80), flush=True)
+  if ( traj_summary['duplicate_num'] != 0 ):
+    print ('There are %d duplicate frames in the trajectory, they will be deleted' %(traj_summary['duplicate_num']), flush=True)
   atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
   traj_info.get_traj_info(traj_info_param['traj_coord_file'], 'coord_xyz')
   print ('The number of atoms is %d' % (atoms_num), flush=True)
@@ -45,6 +57,12 @@ if ( analyze_job == 'traj_info' ):
   print ('The endding frame is %d' % (end_frame_id), flush=True)
   print ('The time step is %f fs' % (time_step), flush=True)
 
+elif ( analyze_job == 'traj_cache' ):
+  traj_cache.traj_cache_run(job_type_param[0], work_dir)
+
+elif ( analyze_job == 'follow' ):
+  follow.follow_run(job_type_param[0], work_dir)
+
 elif ( analyze_job == 'center' ):
   center.center_run(job_type_param[0], work_dir)
 
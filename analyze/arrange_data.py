@@ -10,6 +10,8 @@ from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
 from CP2K_kit.tools import traj_tools
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.tools import numeric
 from CP2K_kit.lib import statistic_mod
 from CP2K_kit.analyze import free_energy
@@ -44,13 +46,11 @@ def arrange_temp(frames_num, pre_base, time_step, traj_ener_file, work_dir, each
   time = []
   temp = []
 
+  frame_index = traj_index.get_frame_index(traj_ener_file, 'ener')
+  ener_data = traj_reader.read_lines_data(traj_ener_file, frame_index, list(range(frames_num)))
   for i in range(frames_num):
     time.append(time_step*i*each)
-    line_i = linecache.getline(traj_ener_file, i+pre_base+1)
-    line_i_split = data_op.split_str(line_i, ' ')
-    temp.append(float(line_i_split[3])) #The temperature is in 4th row in energy file.
-
-  linecache.clearcache()
+    temp.append(float(ener_data[i][3])) #The temperature is in 4th row in energy file.
 
   temp_file = ''.join((work_dir, '/temperature.csv'))
   with open(temp_file, 'w') as csvfile:
@@ -87,13 +87,11 @@ def arrange_pot(frames_num, pre_base, time_step, traj_ener_file, work_dir, each=
   time = []
   pot = []
 
+  frame_index = traj_index.get_frame_index(traj_ener_file, 'ener')
+  ener_data = traj_reader.read_lines_data(traj_ener_file, frame_index, list(range(frames_num)))
   for i in range(frames_num):
     time.append(time_step*i*each)
-    line_i = linecache.getline(traj_ener_file, i+pre_base+1)
-    line_i_split = data_op.split_str(line_i, ' ')
-    pot.append(float(line_i_split[4])) #The potential energy is in 5th row in energy file. 
-
-  linecache.clearcache()
+    pot.append(float(ener_data[i][4])) #The potential energy is in 5th row in energy file. 
 
   pot_file = ''.join((work_dir, '/potential.csv')) #The energy unit is Hartree.
   with open(pot_file, 'w') as csvfile:
@@ -1,18 +1,119 @@
 #!/usr/bin/env python
 
 import os
-import linecache
+import multiprocessing
 import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from CP2K_kit.tools import atom
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.tools import data_op
 from CP2K_kit.lib import geometry_mod
 from CP2K_kit.analyze import geometry
 from CP2K_kit.analyze import check_analyze
 
+shared_center = {}
+
+def center_frame(coord, a_vec, b_vec, c_vec, center_type, center_id, trans_type, group_atom_1_id, \
+                 group_atoms_mass, id_list_len, mass_list_len, atoms_mass):
+
+  '''
+  center_frame: center one frame.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    a_vec, b_vec, c_vec, center_type, center_id, trans_type: same as center.
+    group_atom_1_id: 2-d int array
+      group_atom_1_id is the expanded id of first atoms in the molecules in the group.
+    group_atoms_mass: 2-d float array
+      group_atoms_mass is the expanded atoms mass for each group.
+    id_list_len: 1-d int list
+      id_list_len is the number of first atoms of each group.
+    mass_list_len: 1-d int list
+      mass_list_len is the number of atoms of each group.
+    atoms_mass: 1-d float list
+      atoms_mass contains mass of all atoms.
+  Returns:
+    new_coord: 2-d float array, dim = (number of atoms)*3
+      new_coord is the centered coordinates.
+  '''
+
+  coord = np.asfortranarray(coord, dtype='float32')
+  a_vec = np.asfortranarray(a_vec, dtype='float32')
+  b_vec = np.asfortranarray(b_vec, dtype='float32')
+  c_vec = np.asfortranarray(c_vec, dtype='float32')
+  group_atom_1_id = np.asfortranarray(group_atom_1_id, dtype='int32')
+  group_atoms_mass = np.asfortranarray(group_atoms_mass, dtype='float32')
+  id_list_len = np.asfortranarray(id_list_len, dtype='int32')
+  mass_list_len = np.asfortranarray(mass_list_len, dtype='int32')
+
+  #We translate the atoms in the box at first, and then image for center_image.
+  new_coord = geometry_mod.geometry.periodic_center_box(coord, a_vec, b_vec, c_vec, trans_type, group_atom_1_id, \
+                                                        group_atoms_mass, id_list_len, mass_list_len)
+  if ( center_type == "center_image" ):
+    center_coord = np.asfortranarray(new_coord[center_id-1], dtype='float32')
+    new_coord = geometry_mod.geometry.periodic_center_image(new_coord, a_vec, b_vec, c_vec, center_coord, \
+                                                            trans_type, group_atom_1_id, group_atoms_mass, \
+                                                            id_list_len, mass_list_len)
+
+  new_coord = geometry_mod.geometry.trans_box_center(new_coord, np.asfortranarray(atoms_mass, dtype='float32'), \
+                                                     a_vec, b_vec, c_vec)
+
+  return new_coord
+
+def init_shared_center(center_param):
+
+  '''
+  init_shared_center: initialize a worker process of center.
+
+  Args:
+    center_param: dictionary
+      center_param contains the trajectory and the parameters of center_frame.
+  Returns:
+    none
+  '''
+
+  shared_center.update(center_param)
+
+def center_block(frame_list):
+
+  '''
+  center_block: center a block of frames and format them as xyz text.
+
+  Args:
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+  Returns:
+    block_text: string
+      block_text is the xyz text of centered frames.
+  '''
+
+  traj_coord_file = shared_center['traj_coord_file']
+  frame_index = shared_center['frame_index']
+  coord = traj_reader.read_frames(traj_coord_file, frame_index, frame_list)
+  header = traj_reader.read_headers(traj_coord_file, frame_index, frame_list)
+
+  #One frame is formatted by one string operation.
+  atoms = shared_center['atoms']
+  line_format = '%3s%21.10f%20.10f%20.10f\n'*len(atoms)
+  block_text = []
+  for i in range(len(frame_list)):
+    new_coord = center_frame(coord[i], *shared_center['frame_param'])
+    line_value = np.empty((len(atoms), 4), dtype=object)
+    line_value[:,0] = atoms
+    line_value[:,1:] = new_coord
+    block_text.append(header[i])
+    block_text.append(line_format %tuple(line_value.ravel()))
+
+  return ''.join(block_text)
+
 def center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_vec, b_vec, c_vec, center_type, center_id, \
-           traj_coord_file, work_dir, file_name, trans_type=1, group_atom_1_id=[[]], group_atoms_mass=[[]]):
+           traj_coord_file, work_dir, file_name, trans_type=1, group_atom_1_id=[[]], group_atoms_mass=[[]], \
+           proc_num=0, parallel_frames_num=200):
 
   #Reference literature: Computer simulation of liquids, Oxford University press.
 
@@ -58,6 +159,10 @@ def center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_ve
       group_atom_1_id is the id of first atoms in the molecules in the group.
     group_atoms_mass: 2-d float list
       group_atoms_mass contains the atoms mass for each group.
+    proc_num: int
+      proc_num is the number of processes. If it is 0, all cores are used.
+    parallel_frames_num: int
+      If there are less frames than parallel_frames_num, frames are centered in serial.
   Return:
     center_file_name: string
       center_file_name is the name of centered file.
@@ -74,67 +179,50 @@ def center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_ve
   group_atom_1_id = data_op.expand_2d_list(group_atom_1_id, max(id_list_len), 0)
   group_atoms_mass = data_op.expand_2d_list(group_atoms_mass, max(mass_list_len), 0)
 
+  #Dump atoms and atoms_mass from the first frame, the mass of each element is
+  #resolved once.
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
+  element_mass = {}
+  for element in data_op.list_replicate(atoms):
+    element_mass[element] = atom.get_atom_mass(element)[1]
+  atoms_mass = [element_mass[x] for x in atoms]
+
+  center_param = {'traj_coord_file': traj_coord_file, 'frame_index': frame_index, 'atoms': atoms, \
+                  'frame_param': (a_vec, b_vec, c_vec, center_type, center_id, trans_type, group_atom_1_id, \
+                                  group_atoms_mass, id_list_len, mass_list_len, atoms_mass)}
+
+  #Frames are independent, so blocks of frames are centered by a process pool
+  #and written in order. Each block is read by the worker, and the memory does
+  #not depend on the trajectory size.
+  if ( proc_num == 0 ):
+    proc_num = multiprocessing.cpu_count()
+  chunk_size = traj_reader.get_chunk_size(atoms_num)
+  block_size = max(1, min(chunk_size, int(np.ceil(frames_num/(proc_num*4)))))
+  block_list = []
+  for i in range(0, frames_num, block_size):
+    block_list.append(list(range(i, min(i+block_size, frames_num))))
+
   center_file_name = ''.join((work_dir, '/', file_name))
-  center_file = open(center_file_name, 'w')
-
-  for i in range(frames_num):
-    #Dump atoms, atoms_mass and coordinates from trajectory file.
-    coord = np.asfortranarray(np.zeros((atoms_num, 3)),dtype='float32')
-    line_1 = linecache.getline(traj_coord_file, i*(pre_base_block+atoms_num+end_base_block)+1)
-    line_2 = linecache.getline(traj_coord_file, i*(pre_base_block+atoms_num+end_base_block)+2)
-    atoms = []
-    atoms_mass = []
-    for j in range(atoms_num):
-      line_ij = linecache.getline(traj_coord_file, i*(pre_base_block+atoms_num+end_base_block)+j+1+pre_base_block+pre_base)
-      line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-      atoms.append(line_ij_split[0])
-      atoms_mass.append(atom.get_atom_mass(line_ij_split[0])[1])
-      coord[j,0] = float(line_ij_split[1])
-      coord[j,1] = float(line_ij_split[2])
-      coord[j,2] = float(line_ij_split[3])
-
-    if ( center_type == "center_box" ):
-      new_coord = geometry_mod.geometry.periodic_center_box(coord, np.asfortranarray(a_vec, dtype='float32'), \
-                                                            np.asfortranarray(b_vec, dtype='float32'), \
-                                                            np.asfortranarray(c_vec, dtype='float32'), \
-                                                            trans_type, np.asfortranarray(group_atom_1_id, dtype='int32'), \
-                                                            np.asfortranarray(group_atoms_mass, dtype='float32'), \
-                                                            np.asfortranarray(id_list_len, dtype='int32'), \
-                                                            np.asfortranarray(mass_list_len, dtype='int32'))
-    elif ( center_type == "center_image" ):
-      #We translate the atoms in the box at first, and then image
-      new_coord_box = geometry_mod.geometry.periodic_center_box(coord, np.asfortranarray(a_vec, dtype='float32'), \
-                                                                np.asfortranarray(b_vec, dtype='float32'), \
-                                                                np.asfortranarray(c_vec, dtype='float32'), \
-                                                                trans_type, np.asfortranarray(group_atom_1_id, dtype='int32'), \
-                                                                np.asfortranarray(group_atoms_mass, dtype='float32'), \
-                                                                np.asfortranarray(id_list_len, dtype='int32'), \
-                                                                np.asfortranarray(mass_list_len, dtype='int32'))
-
-      center_coord = np.asfortranarray(new_coord_box[center_id-1], dtype='float32')
-
-      new_coord = geometry_mod.geometry.periodic_center_image(new_coord_box, np.asfortranarray(a_vec, dtype='float32'), \
-                                                              np.asfortranarray(b_vec, dtype='float32'), \
-                                                              np.asfortranarray(c_vec, dtype='float32'), center_coord, \
-                                                              trans_type, np.asfortranarray(group_atom_1_id, dtype='int32'), \
-                                                              np.asfortranarray(group_atoms_mass, dtype='float32'), \
-                                                              np.asfortranarray(id_list_len, dtype='int32'), \
-                                                              np.asfortranarray(mass_list_len, dtype='int32'))
-
-    new_coord = geometry_mod.geometry.trans_box_center(new_coord, np.asfortranarray(atoms_mass,dtype='float32'), \
-                                                       np.asfortranarray(a_vec, dtype='float32'), \
-                                                       np.asfortranarray(b_vec, dtype='float32'), \
-                                                       np.asfortranarray(c_vec, dtype='float32'))
-
-    center_file.write(line_1)
-    center_file.write(line_2)
-
-    for j in range(atoms_num):
-      center_file.write('%3s%21.10f%20.10f%20.10f\n' \
-                        %(atoms[j], new_coord[j,0], new_coord[j,1], new_coord[j,2]))
-
-  linecache.clearcache()
-  center_file.close()
+  fork_exist = 'fork' in multiprocessing.get_all_start_methods()
+  with open(center_file_name, 'w') as center_file:
+    if ( proc_num == 1 or frames_num < parallel_frames_num or not fork_exist or \
+         traj_index.is_compressed(traj_coord_file) ):
+      init_shared_center(center_param)
+      for frame_list in block_list:
+        center_file.write(center_block(frame_list))
+    else:
+      #If a worker dies (such as an abort in Fortran), the executor raises
+      #BrokenProcessPool, while multiprocessing.Pool would wait for the lost block.
+      fork_context = multiprocessing.get_context('fork')
+      try:
+        with ProcessPoolExecutor(proc_num, mp_context=fork_context, initializer=init_shared_center, \
+                                 initargs=(center_param,)) as executor:
+          for block_text in executor.map(center_block, block_list):
+            center_file.write(block_text)
+      except BrokenProcessPool:
+        log_info.log_error('Running error: a process centering %s terminated abruptly, please check the trajectory or center_type' %(traj_coord_file))
+        exit()
 
   return center_file_name
 
@@ -183,7 +271,7 @@ def center_run(center_param, work_dir):
     center_file = center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_vec, b_vec, c_vec, center_type, \
                          center_id, traj_coord_file, work_dir, 'center.xyz', 0, group_atom_1_id, group_atoms_mass)
   else:
-    center_file = center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_vec, b_vec, \
+    center_file = center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_vec, b_vec, c_vec, \
                          center_type, center_id, traj_coord_file, work_dir, 'center.xyz')
 
   print (data_op.str_wrap('The centered trajectory is written in %s' %(center_file), 80), flush=True)
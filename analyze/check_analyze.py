@@ -6,6 +6,8 @@ from collections import OrderedDict
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import neighbor
 
 def check_step(init_step, end_step, start_frame_id, end_frame_id):
 
@@ -78,8 +80,8 @@ def check_center_inp(center_dic):
 
   if ( 'traj_coord_file' in new_center_dic.keys() ):
     traj_coord_file = new_center_dic['traj_coord_file']
-    if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-      new_center_dic['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+    if ( traj_index.traj_exists(traj_coord_file) ):
+      new_center_dic['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
     else:
       log_info.log_error('%s file does not exist' %(traj_coord_file))
       exit()
@@ -185,10 +187,10 @@ def check_diffusion_inp(diffusion_dic):
   if ( method == 'einstein_sum' ):
     if ( 'traj_coord_file' in diffusion_dic.keys() ):
       traj_coord_file = diffusion_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        diffusion_dic['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        diffusion_dic['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(traj_coord_file, 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
         exit()
@@ -208,10 +210,10 @@ def check_diffusion_inp(diffusion_dic):
   elif ( method == 'green_kubo' ):
     if ( 'traj_vel_file' in diffusion_dic.keys() ):
       traj_vel_file = diffusion_dic['traj_vel_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_vel_file))) ):
-        diffusion_dic['traj_vel_file'] = os.path.abspath(os.path.expanduser(traj_vel_file))
+      if ( traj_index.traj_exists(traj_vel_file) ):
+        diffusion_dic['traj_vel_file'] = traj_index.get_traj_path(traj_vel_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(traj_vel_file, 'vel')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_vel_file), 'vel')
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_vel_file))
         exit()
@@ -226,6 +228,16 @@ def check_diffusion_inp(diffusion_dic):
     log_info.log_error('Input error: no atom_id, please set analyze/diffusion/atom_id')
     exit()
 
+  if ( 'engine' in diffusion_dic.keys() ):
+    engine = diffusion_dic['engine']
+    if ( engine == 'fft' or engine == 'direct' or engine == 'multi_tau' ):
+      pass
+    else:
+      log_info.log_error('Input error: only fft, direct or multi_tau are supported for engine, please check or reset analyze/diffusion/engine')
+      exit()
+  else:
+    diffusion_dic['engine'] = 'fft'
+
   if ( 'init_step' in diffusion_dic.keys() ):
     init_step = diffusion_dic['init_step']
     if ( data_op.eval_str(init_step) == 1 ):
@@ -250,11 +262,18 @@ def check_diffusion_inp(diffusion_dic):
   end_step = diffusion_dic['end_step']
   check_step(init_step, end_step, start_frame_id, end_frame_id)
 
+  #The fft and multi_tau engines cost the same for any correlation window, so the
+  #window could be as long as the analyzed trajectory.
+  if ( diffusion_dic['engine'] == 'fft' or diffusion_dic['engine'] == 'multi_tau' ):
+    max_frame_corr_limit = int((end_step-init_step)/each)+1
+  else:
+    max_frame_corr_limit = int(frames_num/2)
+
   if ( 'max_frame_corr' in diffusion_dic.keys() ):
     max_frame_corr = diffusion_dic['max_frame_corr']
     if ( data_op.eval_str(max_frame_corr) == 1 ):
-      if ( int(max_frame_corr) > int(frames_num/2) ):
-        log_info.log_error('Input error: max_frame_corr should be less than frames_num/2, please check or reset analyze/diffusion/max_frame_corr')
+      if ( int(max_frame_corr) > max_frame_corr_limit ):
+        log_info.log_error('Input error: max_frame_corr should be less than %d, please check or reset analyze/diffusion/max_frame_corr' %(max_frame_corr_limit))
         exit()
       else:
         diffusion_dic['max_frame_corr'] = int(max_frame_corr)
@@ -326,38 +345,6 @@ def check_file_trans_inp(file_trans_dic):
       exit()
 
   if ( trans_type == 'pdb2xyz' ):
-    if ( 'pre_base' in file_trans_dic.keys() ):
-      pre_base = file_trans_dic['pre_base']
-      if ( data_op.eval_str(pre_base) == 1 ):
-        file_trans_dic['pre_base'] = int(pre_base)
-      else:
-        log_info.log_error('Input error: pre_base must be integer, please set analzye/file_trans/pre_base')
-    else:
-      file_trans_dic['pre_base'] = 0
-    if ( 'end_base' in file_trans_dic.keys() ):
-      end_base = file_trans_dic['end_base']
-      if ( data_op.eval_str(end_base) == 1 ):
-        file_trans_dic['end_base'] = int(end_base)
-      else:
-        log_info.log_error('Input error: end_base must be integer, please set analzye/file_trans/end_base')
-    else:
-      file_trans_dic['end_base'] = 0
-    if ( 'block_pre_base' in file_trans_dic.keys() ):
-      block_pre_base = file_trans_dic['block_pre_base']
-      if ( data_op.eval_str(block_pre_base) == 1 ):
-        file_trans_dic['block_pre_base'] = int(block_pre_base)
-      else:
-        log_info.log_error('Input error: block_pre_base must be integer, please set analzye/file_trans/block_pre_base')
-    else:
-      file_trans_dic['block_pre_base'] = 0
-    if ( 'block_end_base' in file_trans_dic.keys() ):
-      block_end_base = file_trans_dic['block_end_base']
-      if ( data_op.eval_str(block_end_base) == 1 ):
-        file_trans_dic['block_end_base'] = int(block_end_base)
-      else:
-        log_info.log_error('Input error: block_end_base must be integer, please set analzye/file_trans/block_end_base')
-    else:
-      file_trans_dic['block_end_base'] = 0
     if ( 'time_step' in file_trans_dic.keys() ):
       time_step = file_trans_dic['time_step']
       if ( data_op.eval_str(time_step) == 1 or data_op.eval_str(time_step) == 2 ):
@@ -395,10 +382,10 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_coord_file' in coord_num_dic.keys() ):
       traj_coord_file = coord_num_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        geometry_dic['coord_num']['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        geometry_dic['coord_num']['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_coord_file)), 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s does not exist' %(traj_coord_file))
         exit()
@@ -480,10 +467,10 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_coord_file' in neighbor_dic.keys() ):
       traj_coord_file = neighbor_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        geometry_dic['neighbor']['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        geometry_dic['neighbor']['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_coord_file)), 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s does not exist' %(traj_coord_file))
         exit()
@@ -565,10 +552,10 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_coord_file' in bond_length_dic.keys() ):
       traj_coord_file = bond_length_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        geometry_dic['bond_length']['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        geometry_dic['bond_length']['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_coord_file)), 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
         exit()
@@ -665,10 +652,10 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_coord_file' in bond_angle_dic.keys() ):
       traj_coord_file = bond_angle_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        geometry_dic['bond_angle']['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        geometry_dic['bond_angle']['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(traj_coord_file, 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s does not exist' %(traj_coord_file))
     else:
@@ -730,10 +717,10 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_coord_file' in first_shell_dic.keys() ):
       traj_coord_file = first_shell_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        geometry_dic['first_shell']['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        geometry_dic['first_shell']['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_coord_file)), 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s does not exist' %(traj_coord_file))
         exit()
@@ -847,10 +834,10 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_file' in choose_str_dic.keys() ):
       traj_file = choose_str_dic['traj_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_file))) ):
-        geometry_dic['choose_structure']['traj_file'] = os.path.abspath(os.path.expanduser(traj_file))
+      if ( traj_index.traj_exists(traj_file) ):
+        geometry_dic['choose_structure']['traj_file'] = traj_index.get_traj_path(traj_file)
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-        traj_info.get_traj_info(traj_file, 'coord_xyz')
+        traj_info.get_traj_info(traj_index.get_traj_path(traj_file), 'coord_xyz')
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_file))
         exit()
@@ -894,8 +881,8 @@ def check_geometry_inp(geometry_dic):
 
     if ( 'traj_coord_file' in order_str_dic.keys() ):
       traj_coord_file = order_str_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        new_geometry_dic['order_structure']['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        new_geometry_dic['order_structure']['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
         exit()
@@ -1110,10 +1097,10 @@ def check_rdf_inp(rdf_dic):
 
   if ( 'traj_coord_file' in rdf_dic.keys() ):
     traj_coord_file = rdf_dic['traj_coord_file']
-    if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-      rdf_dic['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+    if ( traj_index.traj_exists(traj_coord_file) ):
+      rdf_dic['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
       atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-      traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_coord_file)), 'coord_xyz')
+      traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
     else:
       log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
       exit()
@@ -1121,12 +1108,21 @@ def check_rdf_inp(rdf_dic):
     log_info.log_error('Input error: no coordination trajectroy file, please set analyze/rdf/traj_coord_file')
     exit()
 
+  #atom_type_pair could be several pairs, such as O O O H, or all.
   if ( 'atom_type_pair' in rdf_dic.keys() ):
     atom_type_pair = rdf_dic['atom_type_pair']
-    if ( len(atom_type_pair) == 2 and all(data_op.eval_str(x) == 0 for x in atom_type_pair) ):
+    if ( atom_type_pair == 'all' ):
       pass
+    elif ( isinstance(atom_type_pair, list) and len(atom_type_pair)%2 == 0 and \
+           all(data_op.eval_str(x) == 0 for x in atom_type_pair) ):
+      atom_type_pair_list = []
+      for i in range(int(len(atom_type_pair)/2)):
+        atom_type_pair_i = atom_type_pair[2*i:2*i+2]
+        if ( atom_type_pair_i not in atom_type_pair_list ):
+          atom_type_pair_list.append(atom_type_pair_i)
+      rdf_dic['atom_type_pair'] = atom_type_pair_list
     else:
-      log_info.log_error('Input error: atom_type_pair should be 2 string, please check or reset analyze/rdf/atom_type_pair')
+      log_info.log_error('Input error: atom_type_pair should be pairs of string or all, please check or reset analyze/rdf/atom_type_pair')
       exit()
   else:
     log_info.log_error('Input error: no atom type, please set analyze/rdf/atom_type_pair')
@@ -1163,6 +1159,23 @@ def check_rdf_inp(rdf_dic):
   else:
     rdf_dic['r_increment'] = 0.1
 
+  #The analyzed frames are split into block_num blocks to get standard error.
+  if ( 'block_num' in rdf_dic.keys() ):
+    block_num = rdf_dic['block_num']
+    if ( data_op.eval_str(block_num) == 1 and int(block_num) >= 1 ):
+      rdf_dic['block_num'] = int(block_num)
+    else:
+      log_info.log_error('Input error: block_num should be positive integer, please check or reset analyze/rdf/block_num')
+      exit()
+  else:
+    rdf_dic['block_num'] = 1
+
+  frames_num_stat = int((end_step-init_step)/max(1, each))+1
+  if ( rdf_dic['block_num'] > frames_num_stat ):
+    log_info.log_error('Input error: block_num should not be larger than the number of analyzed frames (%d), please check or reset analyze/rdf/block_num' \
+                       %(frames_num_stat))
+    exit()
+
   if ( 'box' in rdf_dic.keys() ):
     A_exist = 'A' in rdf_dic['box'].keys()
     B_exist = 'B' in rdf_dic['box'].keys()
@@ -1197,6 +1210,21 @@ def check_rdf_inp(rdf_dic):
     log_info.log_error('Input error: C vector of box wrong, please check analyze/rdf/box/C')
     exit()
 
+  #With r_cut, rdf is only calculated within r_cut by cell list. The pairs are
+  #the same as the minimum image only if r_cut is not larger than half of the box.
+  if ( 'r_cut' in rdf_dic.keys() ):
+    r_cut = rdf_dic['r_cut']
+    if ( data_op.eval_str(r_cut) == 1 or data_op.eval_str(r_cut) == 2 ):
+      rdf_dic['r_cut'] = float(r_cut)
+    else:
+      log_info.log_error('Input error: r_cut should be float, please check or reset analyze/rdf/r_cut')
+      exit()
+    height = neighbor.get_cell_height([rdf_dic['box']['A'], rdf_dic['box']['B'], rdf_dic['box']['C']])
+    if ( rdf_dic['r_cut'] <= 0.0 or rdf_dic['r_cut'] > min(height)/2.0 ):
+      log_info.log_error('Input error: r_cut should be positive and not larger than half of the box (%f), please check or reset analyze/rdf/r_cut' \
+                         %(min(height)/2.0))
+      exit()
+
   return rdf_dic
 
 def check_adf_inp(adf_dic):
@@ -1216,10 +1244,10 @@ def check_adf_inp(adf_dic):
 
   if ( 'traj_coord_file' in adf_dic.keys() ):
     traj_coord_file = adf_dic['traj_coord_file']
-    if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-      adf_dic['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+    if ( traj_index.traj_exists(traj_coord_file) ):
+      adf_dic['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
       atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-      traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_coord_file)), 'coord_xyz')
+      traj_info.get_traj_info(traj_index.get_traj_path(traj_coord_file), 'coord_xyz')
     else:
       log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
       exit()
@@ -1269,6 +1297,58 @@ def check_adf_inp(adf_dic):
   else:
     adf_dic['a_increment'] = 0.1
 
+  #With r_cut, only angles of neighbors are calculated. The first value is the
+  #cutoff between atom 1 and atom 2, and the second is between atom 3 and atom 2.
+  if ( 'r_cut' in adf_dic.keys() ):
+    r_cut = adf_dic['r_cut']
+    if ( not isinstance(r_cut, list) ):
+      r_cut = [r_cut, r_cut]
+    if ( len(r_cut) == 2 and all(data_op.eval_str(x) == 1 or data_op.eval_str(x) == 2 for x in r_cut) ):
+      adf_dic['r_cut'] = [float(x) for x in r_cut]
+    else:
+      log_info.log_error('Input error: r_cut should be 1 or 2 float, please check or reset analyze/adf/r_cut')
+      exit()
+
+    if ( 'box' in adf_dic.keys() ):
+      A_exist = 'A' in adf_dic['box'].keys()
+      B_exist = 'B' in adf_dic['box'].keys()
+      C_exist = 'C' in adf_dic['box'].keys()
+    else:
+      log_info.log_error('Input error: no box, please set analyze/adf/box')
+      exit()
+
+    if ( A_exist and B_exist and C_exist ):
+      box_A = adf_dic['box']['A']
+      box_B = adf_dic['box']['B']
+      box_C = adf_dic['box']['C']
+    else:
+      log_info.log_error('Input error: box setting error, please check analyze/adf/box')
+      exit()
+
+    if ( len(box_A) == 3 and all(data_op.eval_str(i) == 1 or data_op.eval_str(i) == 2 for i in box_A) ):
+      adf_dic['box']['A'] = [float(x) for x in box_A]
+    else:
+      log_info.log_error('Input error: A vector of box wrong, please check analyze/adf/box/A')
+      exit()
+
+    if ( len(box_B) == 3 and all(data_op.eval_str(i) == 1 or data_op.eval_str(i) == 2 for i in box_B) ):
+      adf_dic['box']['B'] = [float(x) for x in box_B]
+    else:
+      log_info.log_error('Input error: B vector of box wrong, please check analyze/adf/box/B')
+      exit()
+
+    if ( len(box_C) == 3 and all(data_op.eval_str(i) == 1 or data_op.eval_str(i) == 2 for i in box_C) ):
+      adf_dic['box']['C'] = [float(x) for x in box_C]
+    else:
+      log_info.log_error('Input error: C vector of box wrong, please check analyze/adf/box/C')
+      exit()
+
+    height = neighbor.get_cell_height([adf_dic['box']['A'], adf_dic['box']['B'], adf_dic['box']['C']])
+    if ( min(adf_dic['r_cut']) <= 0.0 or max(adf_dic['r_cut']) > min(height)/2.0 ):
+      log_info.log_error('Input error: r_cut should be positive and not larger than half of the box (%f), please check or reset analyze/adf/r_cut' \
+                         %(min(height)/2.0))
+      exit()
+
   return adf_dic
 
 def check_spectrum_inp(spectrum_dic):
@@ -1298,10 +1378,10 @@ def check_spectrum_inp(spectrum_dic):
 
   if ( 'traj_vel_file' in spectrum_dic.keys() ):
     traj_vel_file = spectrum_dic['traj_vel_file']
-    if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_vel_file))) ):
-      spectrum_dic['traj_vel_file'] = os.path.abspath(os.path.expanduser(traj_vel_file))
+    if ( traj_index.traj_exists(traj_vel_file) ):
+      spectrum_dic['traj_vel_file'] = traj_index.get_traj_path(traj_vel_file)
       atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-      traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_vel_file)), 'vel')
+      traj_info.get_traj_info(traj_index.get_traj_path(traj_vel_file), 'vel')
     else:
       log_info.log_error('Input error: %s file does not exist' %(traj_vel_file))
       exit()
@@ -1313,8 +1393,8 @@ def check_spectrum_inp(spectrum_dic):
   if ( spec_type == 'water_mode' or spec_type == 'hydration_mode' ):
     if ( 'traj_coord_file' in spectrum_dic.keys() ):
       traj_coord_file = spectrum_dic['traj_coord_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-        spectrum_dic['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+      if ( traj_index.traj_exists(traj_coord_file) ):
+        spectrum_dic['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
         exit()
@@ -1376,6 +1456,16 @@ def check_spectrum_inp(spectrum_dic):
   else:
     spectrum_dic['end_wave'] = 0
 
+  if ( 'increment_wave' in spectrum_dic.keys() ):
+    increment_wave = spectrum_dic['increment_wave']
+    if ( ( data_op.eval_str(increment_wave) == 1 or data_op.eval_str(increment_wave) == 2 ) and float(increment_wave) > 0.0 ):
+      spectrum_dic['increment_wave'] = float(increment_wave)
+    else:
+      log_info.log_error('Input error: increment_wave should be positive float, please check or reset analyze/power_spectrum/increment_wave')
+      exit()
+  else:
+    spectrum_dic['increment_wave'] = 1.0
+
   if ( 'normalize' in spectrum_dic.keys() ):
     normalize = spectrum_dic['normalize']
     if ( data_op.eval_str(normalize) == 1 ):
@@ -1390,6 +1480,26 @@ def check_spectrum_inp(spectrum_dic):
   else:
     spectrum_dic['normalize'] = 1
 
+  if ( 'engine' in spectrum_dic.keys() ):
+    engine = spectrum_dic['engine']
+    if ( engine == 'fft' or engine == 'direct' ):
+      pass
+    else:
+      log_info.log_error('Input error: only fft or direct are supported for engine, please check or reset analyze/power_spectrum/engine')
+      exit()
+  else:
+    spectrum_dic['engine'] = 'fft'
+
+  if ( 'window' in spectrum_dic.keys() ):
+    window = spectrum_dic['window']
+    if ( window == 'none' or window == 'hann' or window == 'blackman' or window == 'gauss' ):
+      pass
+    else:
+      log_info.log_error('Input error: only none, hann, blackman or gauss are supported for window, please check or reset analyze/power_spectrum/window')
+      exit()
+  else:
+    spectrum_dic['window'] = 'none'
+
   if ( spec_type == 'general' or spec_type == 'water_mode' ):
     if ( 'atom_id' in spectrum_dic.keys() ):
       atom_id_list = data_op.get_id_list(spectrum_dic['atom_id'])
@@ -1524,8 +1634,8 @@ def check_arrange_data_inp(arrange_data_dic):
 
     if ( 'traj_ener_file' in temp_dic.keys() ):
       traj_ener_file = temp_dic['traj_ener_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_ener_file))) ):
-        arrange_data_dic['temperature']['traj_ener_file'] = os.path.abspath(os.path.expanduser(traj_ener_file))
+      if ( traj_index.traj_exists(traj_ener_file) ):
+        arrange_data_dic['temperature']['traj_ener_file'] = traj_index.get_traj_path(traj_ener_file)
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_ener_file))
         exit()
@@ -1539,8 +1649,8 @@ def check_arrange_data_inp(arrange_data_dic):
 
     if ( 'traj_ener_file' in pot_dic.keys() ):
       traj_ener_file = pot_dic['traj_ener_file']
-      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_ener_file))) ):
-        arrange_data_dic['potential']['traj_ener_file'] = os.path.abspath(os.path.expanduser(traj_ener_file))
+      if ( traj_index.traj_exists(traj_ener_file) ):
+        arrange_data_dic['potential']['traj_ener_file'] = traj_index.get_traj_path(traj_ener_file)
       else:
         log_info.log_error('Input error: %s file does not exist' %(traj_ener_file))
         exit()
@@ -1776,8 +1886,8 @@ def check_rmsd_inp(rmsd_dic):
 
   if ( 'traj_coord_file' in rmsd_dic.keys() ):
     traj_coord_file = rmsd_dic['traj_coord_file']
-    if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_coord_file))) ):
-      rmsd_dic['traj_coord_file'] = os.path.abspath(os.path.expanduser(traj_coord_file))
+    if ( traj_index.traj_exists(traj_coord_file) ):
+      rmsd_dic['traj_coord_file'] = traj_index.get_traj_path(traj_coord_file)
     else:
       log_info.log_error('Input error: %s file does not exist' %(traj_coord_file))
       exit()
@@ -1809,6 +1919,16 @@ def check_rmsd_inp(rmsd_dic):
     log_info.log_error('Input error: no compare frame, please set analyze/rmsd/compare_frame')
     exit()
 
+  if ( 'rotate_matrix' in rmsd_dic.keys() ):
+    rotate_matrix = data_op.str_to_bool(rmsd_dic['rotate_matrix'])
+    if ( isinstance(rotate_matrix, bool) ):
+      rmsd_dic['rotate_matrix'] = rotate_matrix
+    else:
+      log_info.log_error('Input error: rotate_matrix must be bool, please check or reset analyze/rmsd/rotate_matrix')
+      exit()
+  else:
+    rmsd_dic['rotate_matrix'] = False
+
   return rmsd_dic
 
 def check_time_correlation_inp(time_corr_dic):
@@ -1826,10 +1946,10 @@ def check_time_correlation_inp(time_corr_dic):
 
   if ( 'traj_file' in time_corr_dic.keys() ):
     traj_file = time_corr_dic['traj_file']
-    if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_file))) ):
-      time_corr_dic['traj_file'] = os.path.abspath(os.path.expanduser(traj_file))
+    if ( traj_index.traj_exists(traj_file) ):
+      time_corr_dic['traj_file'] = traj_index.get_traj_path(traj_file)
       atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, end_frame_id, time_step = \
-      traj_info.get_traj_info(os.path.abspath(os.path.expanduser(traj_file)), 'coord_xyz')
+      traj_info.get_traj_info(traj_index.get_traj_path(traj_file), 'coord_xyz')
     else:
       log_info.log_error('Input error: %s file does not exists' %(traj_file))
       exit()
@@ -1892,4 +2012,205 @@ def check_time_correlation_inp(time_corr_dic):
   else:
     time_corr_dic['normalize'] = 1
 
+  if ( 'engine' in time_corr_dic.keys() ):
+    engine = time_corr_dic['engine']
+    if ( engine == 'fft' or engine == 'direct' or engine == 'multi_tau' ):
+      pass
+    else:
+      log_info.log_error('Input error: only fft, direct or multi_tau are supported for engine, please check or reset analyze/time_correlation/engine')
+      exit()
+  else:
+    time_corr_dic['engine'] = 'fft'
+
   return time_corr_dic
+
+def check_traj_cache_inp(traj_cache_dic):
+
+  '''
+  check_traj_cache_inp: check the input of traj_cache.
+
+  Args:
+    traj_cache_dic: dictionary
+      traj_cache_dic contains parameters for traj_cache.
+  Returns:
+    traj_cache_dic: dictionary
+      traj_cache_dic is the revised traj_cache_dic.
+  '''
+
+  file_key = ['traj_coord_file', 'traj_vel_file', 'traj_frc_file', 'traj_cell_file', 'traj_ener_file']
+  if not any(key in traj_cache_dic.keys() for key in file_key):
+    log_info.log_error('Input error: no trajectory file, please set analyze/traj_cache/traj_coord_file')
+    exit()
+
+  for key in file_key:
+    if ( key in traj_cache_dic.keys() ):
+      traj_file = traj_cache_dic[key]
+      if ( os.path.exists(os.path.abspath(os.path.expanduser(traj_file))) ):
+        traj_cache_dic[key] = os.path.abspath(os.path.expanduser(traj_file))
+      else:
+        log_info.log_error('Input error: %s file does not exist' %(traj_file))
+        exit()
+
+  if ( 'chunk_size' in traj_cache_dic.keys() ):
+    chunk_size = traj_cache_dic['chunk_size']
+    if ( data_op.eval_str(chunk_size) == 1 and int(chunk_size) > 0 ):
+      traj_cache_dic['chunk_size'] = int(chunk_size)
+    else:
+      log_info.log_error('Input error: chunk_size should be positive integer, please check or reset analyze/traj_cache/chunk_size')
+      exit()
+  else:
+    traj_cache_dic['chunk_size'] = 1000
+
+  if ( 'box' in traj_cache_dic.keys() ):
+    for vec in ['A', 'B', 'C']:
+      if ( vec in traj_cache_dic['box'].keys() ):
+        box_vec = traj_cache_dic['box'][vec]
+        if ( len(box_vec) == 3 and all(data_op.eval_str(i) == 1 or data_op.eval_str(i) == 2 for i in box_vec) ):
+          traj_cache_dic['box'][vec] = [float(x) for x in box_vec]
+        else:
+          log_info.log_error('Input error: %s vector of box wrong, please check analyze/traj_cache/box/%s' %(vec, vec))
+          exit()
+      else:
+        log_info.log_error('Input error: box setting error, please check analyze/traj_cache/box')
+        exit()
+  else:
+    traj_cache_dic['box'] = {}
+
+  return traj_cache_dic
+
+def check_follow_inp(follow_dic):
+
+  '''
+  check_follow_inp: check the input of follow.
+
+  Args:
+    follow_dic: dictionary
+      follow_dic contains parameters for follow.
+  Returns:
+    follow_dic: dictionary
+      follow_dic is the revised follow_dic.
+  '''
+
+  follow_dic = copy.deepcopy(follow_dic)
+
+  file_key = ['traj_coord_file', 'traj_ener_file']
+  if not any(key in follow_dic.keys() for key in file_key):
+    log_info.log_error('Input error: no trajectory file, please set analyze/follow/traj_coord_file or traj_ener_file')
+    exit()
+
+  #The trajectory is still written by md, so we only check its existence here.
+  for key in file_key:
+    if ( key in follow_dic.keys() ):
+      traj_file = follow_dic[key]
+      if ( traj_index.traj_exists(traj_file) ):
+        follow_dic[key] = traj_index.get_traj_path(traj_file)
+      else:
+        log_info.log_error('Input error: %s file does not exist' %(traj_file))
+        exit()
+
+  if ( 'interval' in follow_dic.keys() ):
+    interval = follow_dic['interval']
+    if ( ( data_op.eval_str(interval) == 1 or data_op.eval_str(interval) == 2 ) and float(interval) > 0.0 ):
+      follow_dic['interval'] = float(interval)
+    else:
+      log_info.log_error('Input error: interval should be positive float, please check or reset analyze/follow/interval')
+      exit()
+  else:
+    follow_dic['interval'] = 60.0
+
+  if ( 'max_idle' in follow_dic.keys() ):
+    max_idle = follow_dic['max_idle']
+    if ( ( data_op.eval_str(max_idle) == 1 or data_op.eval_str(max_idle) == 2 ) and float(max_idle) >= 0.0 ):
+      follow_dic['max_idle'] = float(max_idle)
+    else:
+      log_info.log_error('Input error: max_idle should be non-negative float, please check or reset analyze/follow/max_idle')
+      exit()
+  else:
+    follow_dic['max_idle'] = 0.0
+
+  if ( 'checkpoint_file' in follow_dic.keys() ):
+    follow_dic['checkpoint_file'] = os.path.abspath(os.path.expanduser(follow_dic['checkpoint_file']))
+
+  if ( 'rdf' in follow_dic.keys() or 'adf' in follow_dic.keys() or 'msd' in follow_dic.keys() ):
+    if ( 'traj_coord_file' not in follow_dic.keys() ):
+      log_info.log_error('Input error: rdf, adf and msd need coordination trajectory, please set analyze/follow/traj_coord_file')
+      exit()
+
+  if ( 'rdf' in follow_dic.keys() ):
+    rdf_dic = follow_dic['rdf']
+    if ( 'atom_type_pair' in rdf_dic.keys() ):
+      atom_type_pair = rdf_dic['atom_type_pair']
+      if ( len(atom_type_pair) != 2 or any(data_op.eval_str(x) != 0 for x in atom_type_pair) ):
+        log_info.log_error('Input error: atom_type_pair should be 2 string, please check or reset analyze/follow/rdf/atom_type_pair')
+        exit()
+    else:
+      log_info.log_error('Input error: no atom type, please set analyze/follow/rdf/atom_type_pair')
+      exit()
+
+    if ( 'r_increment' in rdf_dic.keys() ):
+      r_increment = rdf_dic['r_increment']
+      if ( data_op.eval_str(r_increment) == 2 ):
+        follow_dic['rdf']['r_increment'] = float(r_increment)
+      else:
+        log_info.log_error('Input error: r_increment should be float, please check or reset analyze/follow/rdf/r_increment')
+        exit()
+    else:
+      follow_dic['rdf']['r_increment'] = 0.1
+
+    if ( 'box' not in follow_dic.keys() ):
+      log_info.log_error('Input error: rdf needs box, please set analyze/follow/box')
+      exit()
+
+  if ( 'adf' in follow_dic.keys() ):
+    adf_dic = follow_dic['adf']
+    if ( 'atom_type_pair' in adf_dic.keys() ):
+      atom_type_pair = adf_dic['atom_type_pair']
+      if ( len(atom_type_pair) != 3 or any(data_op.eval_str(x) != 0 for x in atom_type_pair) ):
+        log_info.log_error('Input error: atom_type_pair should be 3 string, please check or reset analyze/follow/adf/atom_type_pair')
+        exit()
+    else:
+      log_info.log_error('Input error: no atom type, please set analyze/follow/adf/atom_type_pair')
+      exit()
+
+    if ( 'a_increment' in adf_dic.keys() ):
+      a_increment = adf_dic['a_increment']
+      if ( data_op.eval_str(a_increment) == 1 or data_op.eval_str(a_increment) == 2 ):
+        follow_dic['adf']['a_increment'] = float(a_increment)
+      else:
+        log_info.log_error('Input error: a_increment should be float, please check or reset analyze/follow/adf/a_increment')
+        exit()
+    else:
+      follow_dic['adf']['a_increment'] = 0.1
+
+  if ( 'msd' in follow_dic.keys() ):
+    msd_dic = follow_dic['msd']
+    if ( 'atom_id' in msd_dic.keys() ):
+      follow_dic['msd']['atom_id'] = data_op.get_id_list(msd_dic['atom_id'])
+    else:
+      log_info.log_error('Input error: no atom_id, please set analyze/follow/msd/atom_id')
+      exit()
+
+    if ( 'max_frame_corr' in msd_dic.keys() ):
+      max_frame_corr = msd_dic['max_frame_corr']
+      if ( data_op.eval_str(max_frame_corr) == 1 and int(max_frame_corr) > 0 ):
+        follow_dic['msd']['max_frame_corr'] = int(max_frame_corr)
+      else:
+        log_info.log_error('Input error: max_frame_corr should be positive integer, please check or reset analyze/follow/msd/max_frame_corr')
+        exit()
+    else:
+      follow_dic['msd']['max_frame_corr'] = 100
+
+  if ( 'box' in follow_dic.keys() ):
+    for vec in ['A', 'B', 'C']:
+      if ( vec in follow_dic['box'].keys() ):
+        box_vec = follow_dic['box'][vec]
+        if ( len(box_vec) == 3 and all(data_op.eval_str(i) == 1 or data_op.eval_str(i) == 2 for i in box_vec) ):
+          follow_dic['box'][vec] = [float(x) for x in box_vec]
+        else:
+          log_info.log_error('Input error: %s vector of box wrong, please check analyze/follow/box/%s' %(vec, vec))
+          exit()
+      else:
+        log_info.log_error('Input error: box setting error, please check analyze/follow/box')
+        exit()
+
+  return follow_dic
@@ -2,17 +2,101 @@
 
 import os
 import csv
-import linecache
 import numpy as np
 from CP2K_kit.tools import atom
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.tools import correlator
 from CP2K_kit.lib import dynamic_mod
 from CP2K_kit.analyze import check_analyze
+from CP2K_kit.analyze import time_correlation
+
+def get_msd_fft(coord, max_frame_corr, atoms_block=0):
+
+  '''
+  get_msd_fft: get mean square displacement by fast fourier transform.
+
+  Args:
+    coord: 3-d float array, dim = (number of frames)*(number of atoms)*3
+      coord is the coordinates of choosed atoms.
+    max_frame_corr: int
+      max_frame_corr is the max number of correlation frames.
+    atoms_block: int
+      atoms_block is the number of atoms transformed together, 0 means auto.
+  Returns:
+    msd: 1-d float array, dim = max_frame_corr
+      msd is the mean square displacement averaged over time origins and atoms.
+  '''
+
+  #For lag m, sum_k (x_{k+m}-x_k)^2 = sum_k x_{k+m}^2 + sum_k x_k^2 - 2*sum_k x_k*x_{k+m}.
+  #The first two sums are running sums of x^2, and the last one is the autocorrelation
+  #which is got by fft of the zero padded data, so the cost is frames*log(frames).
+  frames_num = coord.shape[0]
+  atoms_num = coord.shape[1]
+  fft_num = 2*frames_num
+  if ( atoms_block == 0 ):
+    atoms_block = max(int(2**24/(fft_num*3)), 1)
+
+  lag = np.arange(max_frame_corr)
+  msd = np.zeros(max_frame_corr)
+  for i in range(0, atoms_num, atoms_block):
+    x = np.array(coord[:,i:i+atoms_block,:], dtype='float64')
+    x_sq = np.sum(x**2, axis=2)
+    x_sq_cum = np.concatenate((np.zeros((1, x_sq.shape[1])), np.cumsum(x_sq, axis=0)))
+    #sum_{k=0}^{N-m-1} x_k^2 + sum_{k=m}^{N-1} x_k^2
+    s_1 = x_sq_cum[frames_num-lag]+x_sq_cum[frames_num]-x_sq_cum[lag]
+    x_fft = np.fft.rfft(x, n=fft_num, axis=0)
+    s_2 = np.sum(np.fft.irfft(x_fft*np.conj(x_fft), n=fft_num, axis=0)[0:max_frame_corr], axis=2)
+    msd = msd+np.sum(s_1-2.0*s_2, axis=1)
+
+  return msd/(frames_num-lag)/atoms_num
+
+def get_msd_multi_tau(traj_coord_file, init_step, end_step, max_frame_corr, atom_id, atom_mass=[]):
+
+  '''
+  get_msd_multi_tau: get mean square displacement by multiple-tau correlator, frames
+                     are read from trajectory file chunk by chunk.
+
+  Args:
+    traj_coord_file: string
+      traj_coord_file is the name of coordination trajectory file.
+    init_step: int
+      init_step is the initial step frame id.
+    end_step: int
+      end_step is the ending step frame id.
+    max_frame_corr: int
+      max_frame_corr is the max number of correlation frames.
+    atom_id: 1-d int list
+      atom_id is the id of atoms.
+    atom_mass: 1-d float list
+      atom_mass is the mass of choosed atoms. If it is not empty, the center of mass
+      is removed in each frame.
+  Returns:
+    lag: 1-d int array
+      lag contains the lags (in frames) of the mean square displacement.
+    msd: 1-d float array
+      msd is the mean square displacement at lag.
+  '''
+
+  atom_mass = np.array(atom_mass, dtype='float64')
+  corr = correlator.init_multi_tau((len(atom_id), 3), max_frame_corr, 'msd')
+  for element, coord, cell, step, time in traj_reader.iter_chunks(traj_coord_file, 'coord_xyz', init_step, end_step, 1, atom_id):
+    for i in range(len(step)):
+      if ( len(atom_mass) != 0 ):
+        coord_com = np.dot(atom_mass, coord[i])/np.sum(atom_mass)
+        correlator.add_multi_tau(corr, coord[i]-coord_com)
+      else:
+        correlator.add_multi_tau(corr, coord[i])
+
+  lag, msd = correlator.get_multi_tau(corr, max_frame_corr)
+
+  return lag, msd/len(atom_id)
 
 def diffusion_msd(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, \
-                  init_step, end_step, max_frame_corr, atom_id, traj_coord_file, remove_com, work_dir, file_name):
+                  init_step, end_step, max_frame_corr, atom_id, traj_coord_file, remove_com, work_dir, file_name, engine='fft'):
 
   '''
   diffusion_msd: calculate diffusion coefficient for choosed atoms via mean square displacement.
@@ -48,49 +132,51 @@ def diffusion_msd(atoms_num, pre_base_block, end_base_block, pre_base, each, sta
       work_dir is the working directory of CP2K_kit.
     file_name: string
       file_name is the name of generated file.
+    engine: string
+      engine is the method to correlate frames, fft, direct or multi_tau.
   Returns:
     msd_file: string
       msd_file is the file_name of mean square displacement.
   '''
 
-  frames_num_stat = int((end_step-init_step)/each+1)
-  coord = np.asfortranarray(np.zeros((frames_num_stat, len(atom_id), 3)), dtype='float32')
-
-  #Dump coordinate
-  for i in range(frames_num_stat):
-    for j in range(len(atom_id)):
-      line_ij_num = (pre_base_block+atoms_num+end_base_block)*(int((init_step-start_frame_id)/each)+i)+pre_base+pre_base_block++atom_id[j]
-      line_ij = linecache.getline(traj_coord_file, line_ij_num)
-      line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-      coord[i,j,0] = float(line_ij_split[1])
-      coord[i,j,1] = float(line_ij_split[2])
-      coord[i,j,2] = float(line_ij_split[3])
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
 
+  atom_mass = []
   if remove_com:
     #Dump atom mass
-    atom_mass = []
+    element = traj_reader.read_elements(traj_coord_file, frame_index, 0)
     for i in range(len(atom_id)):
-      line_i = linecache.getline(traj_coord_file, atom_id[i]+pre_base+pre_base_block)
-      line_i_split = data_op.split_str(line_i, ' ')
-      atom_mass.append(atom.get_atom_mass(line_i_split[0])[1])
-    atom_mass_array = np.asfortranarray(atom_mass, dtype='float32')
-    coord = dynamic_mod.dynamic.remove_coord_com(coord,atom_mass_array)
+      atom_mass.append(atom.get_atom_mass(element[atom_id[i]-1])[1])
+
+  if ( engine == 'multi_tau' ):
+    lag, einstein_sum = get_msd_multi_tau(traj_coord_file, init_step, end_step, max_frame_corr, atom_id, atom_mass)
+  else:
+    frame_list = traj_reader.get_frame_list(frame_index, init_step, end_step)
+
+    #Dump coordinate
+    coord = traj_reader.read_frames_parallel(traj_coord_file, frame_index, frame_list, atom_id)
 
-  linecache.clearcache()
+    if remove_com:
+      atom_mass_array = np.asfortranarray(atom_mass, dtype='float32')
+      coord = dynamic_mod.dynamic.remove_coord_com(coord,atom_mass_array)
 
-  einstein_sum = dynamic_mod.dynamic.diffusion_einstein_sum(coord, max_frame_corr)
+    if ( engine == 'fft' ):
+      einstein_sum = get_msd_fft(coord, max_frame_corr)
+    else:
+      einstein_sum = dynamic_mod.dynamic.diffusion_einstein_sum(coord, max_frame_corr)
+    lag = np.arange(len(einstein_sum))
 
   msd_file = ''.join((work_dir, '/', file_name))
   with open(msd_file, 'w') as csvfile:
     writer = csv.writer(csvfile)
     writer.writerow(['time(fs)', 'msd(Angstrom^2)'])
     for i in range(len(einstein_sum)):
-      writer.writerow([i*time_step*each, einstein_sum[i]])
+      writer.writerow([lag[i]*time_step*each, einstein_sum[i]])
 
   return msd_file
 
 def diffusion_tcf(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, \
-                  time_step, init_step, end_step, max_frame_corr, atom_id, traj_vel_file):
+                  time_step, init_step, end_step, max_frame_corr, atom_id, traj_vel_file, engine='fft'):
 
   '''
   diffusion_tcf: calculate diffusion coefficient for choosed atoms via velocity time correlation function.
@@ -120,6 +206,8 @@ def diffusion_tcf(atoms_num, pre_base_block, end_base_block, pre_base, each, sta
       atom_id is the id of atoms.
     traj_vel_file: string
       traj_vel_file is the name of velocity trajectory file.
+    engine: string
+      engine is the method to correlate frames, fft, direct or multi_tau.
   Returns:
     diff_coeff: float
       diff_coeff is the diffusion coefficient.
@@ -127,28 +215,26 @@ def diffusion_tcf(atoms_num, pre_base_block, end_base_block, pre_base, each, sta
 
   #Do we need to substract com velocity?
 
-  frames_num_stat = int((end_step-init_step)/each+1)
-  vel = np.asfortranarray(np.zeros((frames_num_stat, len(atom_id), 3)), dtype='float32')
-  #Dump velocity
-  for i in range(frames_num_stat):
-    for j in range(len(atom_id)):
-      line_ij_num = (pre_base_block+atoms_num+end_base_block)*(int((init_step-start_frame_id)/each)+i)+pre_base+pre_base_block+atom_id[j]
-      line_ij = linecache.getline(traj_vel_file, line_ij_num)
-      line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-      vel[i,j,0] = float(line_ij_split[1])
-      vel[i,j,1] = float(line_ij_split[2])
-      vel[i,j,2] = float(line_ij_split[3])
-
-  linecache.clearcache()
-
   #Here we use non-normalized velocity time correlation function.
   normalize = 0
 
-  vel_tcf = dynamic_mod.dynamic.time_correlation(vel, max_frame_corr, normalize)
+  if ( engine == 'multi_tau' ):
+    lag, vel_tcf = time_correlation.get_tcf_multi_tau(traj_vel_file, init_step, end_step, max_frame_corr, atom_id, normalize)
+  else:
+    frame_index = traj_index.get_frame_index(traj_vel_file, 'vel')
+    frame_list = traj_reader.get_frame_list(frame_index, init_step, end_step)
+
+    #Dump velocity
+    vel = traj_reader.read_frames_parallel(traj_vel_file, frame_index, frame_list, atom_id)
+
+    vel_tcf = time_correlation.get_tcf(vel, max_frame_corr, normalize, engine)
+    lag = np.arange(len(vel_tcf))
 
+  #The lags of multi_tau are not uniform, each value is weighted by its lag interval.
+  lag_width = np.append(np.diff(lag), 1)
   sum_value = 0.0
   for i in range(len(vel_tcf)):
-    sum_value = sum_value+vel_tcf[i]*time_step*each*1.0E-15
+    sum_value = sum_value+vel_tcf[i]*lag_width[i]*time_step*each*1.0E-15
   diff_coeff = sum_value/3.0
 
   return diff_coeff
@@ -174,6 +260,7 @@ def diffusion_run(diffusion_param, work_dir):
   init_step = diffusion_param['init_step']
   end_step = diffusion_param['end_step']
   max_frame_corr = diffusion_param['max_frame_corr']
+  engine = diffusion_param['engine']
 
   if ( method == 'einstein_sum' ):
     traj_coord_file = diffusion_param['traj_coord_file']
@@ -187,7 +274,7 @@ def diffusion_run(diffusion_param, work_dir):
 
     remove_com = diffusion_param['remove_com']
     msd_file = diffusion_msd(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, \
-                             end_step, max_frame_corr, atom_id, traj_coord_file, remove_com, work_dir, 'msd.csv')
+                             end_step, max_frame_corr, atom_id, traj_coord_file, remove_com, work_dir, 'msd.csv', engine)
 
     str_tmp = 'The mean square displacement file is written in %s' %(msd_file)
     print (data_op.str_wrap(str_tmp, 80), flush=True)
@@ -206,7 +293,7 @@ def diffusion_run(diffusion_param, work_dir):
     print ('Diffusion coefficient is calculated by %s' %(method), flush=True)
 
     diff_coeff = diffusion_tcf(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, \
-                 end_step, max_frame_corr, atom_id, traj_vel_file)
+                 end_step, max_frame_corr, atom_id, traj_vel_file, engine)
 
     print ("The diffusion coefficient calculated by vel_tcf is %f cm^2/s" %diff_coeff, flush=True)
 
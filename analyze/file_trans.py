@@ -1,8 +1,10 @@
 #! /usr/env/bin python
 
 import linecache
+import numpy as np
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.analyze import check_analyze
 from CP2K_kit.deepff import gen_lammps_task
 
@@ -74,14 +76,18 @@ def xyz2pdb(transd_file, work_dir, file_name):
 
   return pdb_file_name
 
-def pdb2xyz(transd_file, pre_base, end_base, block_pre_base, block_end_base, time_step, print_freq, work_dir, file_name):
+def pdb2xyz(transd_file, time_step, print_freq, work_dir, file_name):
 
   '''
-  pdb2xyz: transform xyz file to pdb file
+  pdb2xyz: transform pdb file to xyz file
 
   Args:
     transd_file: string
-      transd_file is the name of transformed xyz file.
+      transd_file is the name of transformed pdb file.
+    time_step: float
+      time_step is time step of md. Its unit is fs in CP2K_kit.
+    print_freq: int
+      print_freq is printing frequency of md.
     work_dir: string
       work_dir is the working directory of CP2K_kit.
     file_name: string
@@ -91,35 +97,22 @@ def pdb2xyz(transd_file, pre_base, end_base, block_pre_base, block_end_base, tim
       xyz_file_name is the name of transformed xyz file.
   '''
 
-  line_num = len(open(transd_file).readlines())
-  atoms_num = 0
-  ter_num = 0
-  for i in range(line_num-pre_base-block_pre_base):
-    line = linecache.getline(transd_file, i+1+pre_base+block_pre_base)
-    line_split = data_op.split_str(line, ' ')
-    if ( line_split[0] == 'ATOM' and line_split[0] != 'TER' ):
-      atoms_num = atoms_num+1
-    elif ( line_split[0] == 'TER' ):
-      ter_num = ter_num+1
-    else:
-      break
-
-  frames_num = int((line_num-pre_base-end_base)/(block_pre_base+block_end_base+atoms_num))
+  #Frames are found by frame index and decoded in chunks, the coordinates in pdb
+  #have 3 decimals, so float32 values are rounded back.
   xyz_file_name = ''.join((work_dir, '/', file_name))
   xyz_file = open(xyz_file_name, 'w')
 
-  for i in range(frames_num):
-    xyz_file.write('%d\n'%(atoms_num))
-    xyz_file.write('%s%9d%s%13.3f%s%21.10f\n' %(' i =', i*print_freq, ', time =', i*time_step*print_freq, ', E =', 0.0))
-    for j in range(atoms_num+ter_num):
-      line = linecache.getline(transd_file, i*(block_pre_base+block_end_base+atoms_num)+j+1+pre_base+block_pre_base)
-      line_split = data_op.split_str(line, ' ', '\n')
-      if ( len(line_split) == 11 ):
-        xyz_file.write('%3s%21.10s%20.10s%20.10s\n' %(line_split[10].strip('\n'), line_split[5], line_split[6], line_split[7]))
-      elif ( len(line_split) == 12 ):
-        xyz_file.write('%3s%21.10s%20.10s%20.10s\n' %(line_split[11].strip('\n'), line_split[6], line_split[7], line_split[8]))
+  i = 0
+  for element, coord, cell, step, time in traj_reader.iter_chunks(transd_file, 'coord_pdb'):
+    coord = np.round(np.array(coord, dtype='float64'), 3)
+    for j in range(len(step)):
+      frame_str = [''.join(('%d\n' %(len(element)), '%s%9d%s%13.3f%s%21.10f\n' \
+                   %(' i =', i*print_freq, ', time =', i*time_step*print_freq, ', E =', 0.0)))]
+      for k in range(len(element)):
+        frame_str.append('%3s%21.10f%20.10f%20.10f\n' %(element[k], coord[j,k,0], coord[j,k,1], coord[j,k,2]))
+      xyz_file.write(''.join(frame_str))
+      i = i+1
 
-  linecache.clearcache()
   xyz_file.close()
 
   return xyz_file_name
@@ -149,14 +142,9 @@ def file_trans_run(file_trans_param, work_dir):
     str_print = 'The %s pdb file will be transfered to xyz type file' %(transd_file)
     print (data_op.str_wrap(str_print, 80), flush=True)
 
-    pre_base = file_trans_param['pre_base']
-    block_pre_base = file_trans_param['block_pre_base']
-    block_end_base = file_trans_param['block_end_base']
-    end_base = file_trans_param['end_base']
     time_step = file_trans_param['time_step']
     print_freq = file_trans_param['print_freq']
-    xyz_file_name = pdb2xyz(transd_file, pre_base, end_base, block_pre_base, \
-                            block_end_base, time_step, print_freq, work_dir, 'coord.xyz')
+    xyz_file_name = pdb2xyz(transd_file, time_step, print_freq, work_dir, 'coord.xyz')
 
     str_print = 'The xyz type file is written in %s' %(xyz_file_name)
     print (data_op.str_wrap(str_print, 80), flush=True)
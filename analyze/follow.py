@@ -0,0 +1,438 @@
+#!/usr/bin/env python
+
+import os
+import csv
+import json
+import time
+import numpy as np
+from CP2K_kit.tools import log_info
+from CP2K_kit.tools import data_op
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.analyze import rdf
+from CP2K_kit.analyze import check_analyze
+
+#Follow mode analyzes a trajectory while md is still writing it. Each check
+#indexes only the new complete frames, and adds them to the accumulators of
+#rdf, adf, msd and energy. The accumulators are saved in a checkpoint file, so
+#a follow session could be stopped and resumed.
+
+follow_version = 1
+
+def init_follow_state(follow_param, param_str):
+
+  '''
+  init_follow_state: initialize the accumulators of follow mode.
+
+  Args:
+    follow_param: dictionary
+      follow_param contains keywords used in follow functions.
+    param_str: string
+      param_str is the json string of parameters, it is saved in checkpoint.
+  Returns:
+    state: dictionary
+      state contains the accumulators.
+  '''
+
+  state = {}
+  state['version'] = np.array(follow_version, dtype='int64')
+  state['param'] = np.array(param_str)
+  state['coord_step'] = np.array(-1, dtype='int64')
+  state['coord_frames'] = np.array(0, dtype='int64')
+  state['ener_step'] = np.array(-1, dtype='int64')
+  state['ener_frames'] = np.array(0, dtype='int64')
+
+  if ( 'box' in follow_param.keys() ):
+    box = follow_param['box']
+    vec = np.array(box['A'])+np.array(box['B'])+np.array(box['C'])
+    r_max = np.sqrt(np.dot(vec, vec))/2.0
+
+  if ( 'rdf' in follow_param.keys() ):
+    data_num = int(r_max/follow_param['rdf']['r_increment'])
+    state['rdf_hist'] = np.zeros(data_num, dtype='int64')
+
+  if ( 'adf' in follow_param.keys() ):
+    data_num = int(180.0/follow_param['adf']['a_increment'])
+    state['adf_hist'] = np.zeros(data_num+1, dtype='int64')
+    state['adf_angles_num'] = np.array(0, dtype='int64')
+
+  if ( 'msd' in follow_param.keys() ):
+    max_frame_corr = follow_param['msd']['max_frame_corr']
+    state['msd_sum'] = np.zeros(max_frame_corr, dtype='float64')
+    state['msd_count'] = np.zeros(max_frame_corr, dtype='int64')
+    state['msd_buffer'] = np.zeros((0, len(follow_param['msd']['atom_id']), 3), dtype='float64')
+    state['lag_time'] = np.array(0.0, dtype='float64')
+
+  if ( 'traj_ener_file' in follow_param.keys() ):
+    state['ener_mean'] = np.zeros(4, dtype='float64')
+    state['ener_m2'] = np.zeros(4, dtype='float64')
+
+  return state
+
+def load_follow_state(checkpoint_file, param_str):
+
+  '''
+  load_follow_state: load the accumulators from checkpoint file.
+
+  Args:
+    checkpoint_file: string
+      checkpoint_file is the name of checkpoint file.
+    param_str: string
+      param_str is the json string of parameters.
+  Returns:
+    state: dictionary or None
+      If there is no checkpoint file, None is returned.
+  '''
+
+  if not os.path.exists(checkpoint_file):
+    return None
+
+  checkpoint_data = np.load(checkpoint_file)
+  state = {}
+  for name in checkpoint_data.files:
+    state[name] = checkpoint_data[name]
+
+  if ( int(state['version']) != follow_version or str(state['param']) != param_str ):
+    log_info.log_error('Input error: the parameters are different from checkpoint file %s, please remove it to start a new follow' \
+                       %(checkpoint_file))
+    exit()
+
+  return state
+
+def dump_follow_state(checkpoint_file, state):
+
+  '''
+  dump_follow_state: write the accumulators to checkpoint file.
+
+  Args:
+    checkpoint_file: string
+      checkpoint_file is the name of checkpoint file.
+    state: dictionary
+      state contains the accumulators.
+  Returns:
+    none
+  '''
+
+  #The old checkpoint is replaced at last, so a stopped follow never breaks it.
+  checkpoint_file_tmp = ''.join((checkpoint_file, '.', str(os.getpid())))
+  with open(checkpoint_file_tmp, 'wb') as f:
+    np.savez(f, **state)
+  os.replace(checkpoint_file_tmp, checkpoint_file)
+
+def update_rdf(state, coord, atom_id_1, atom_id_2, cell, r_increment):
+
+  '''
+  update_rdf: add distances of one frame to rdf histogram.
+
+  Args:
+    state: dictionary
+      state contains the accumulators.
+    coord: 2-d float array, dim = (number of atoms)*3
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id of atom_type_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id of atom_type_2.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    r_increment: float
+      r_increment is the increment of r.
+  Returns:
+    none
+  '''
+
+  data_num = len(state['rdf_hist'])
+  state['rdf_hist'] = state['rdf_hist']+rdf.get_rdf_hist(coord, atom_id_1, atom_id_2, cell, r_increment, data_num)
+
+def update_adf(state, coord, atom_id_1, atom_id_2, atom_id_3, a_increment):
+
+  '''
+  update_adf: add angles of one frame to adf histogram.
+
+  Args:
+    state: dictionary
+      state contains the accumulators.
+    coord: 2-d float array, dim = (number of atoms)*3
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id of atom_type_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id of atom_type_2, it is the vertex of angles.
+    atom_id_3: 1-d int array
+      atom_id_3 contains atom id of atom_type_3.
+    a_increment: float
+      a_increment is the increment of angle.
+  Returns:
+    none
+  '''
+
+  #The triplets are same as adf.angle: atom 3 id is larger than atom 1 id.
+  vec_1 = coord[atom_id_1-1][:,np.newaxis,:]-coord[atom_id_2-1][np.newaxis,:,:]
+  vec_2 = coord[atom_id_3-1][np.newaxis,:,:]-coord[atom_id_2-1][:,np.newaxis,:]
+  dot = np.einsum('jkx,klx->jkl', vec_1, vec_2)
+  norm = np.sqrt(np.sum(vec_1**2, axis=2))[:,:,np.newaxis]*np.sqrt(np.sum(vec_2**2, axis=2))[np.newaxis,:,:]
+  choose = np.broadcast_to((atom_id_3[np.newaxis,:] > atom_id_1[:,np.newaxis])[:,np.newaxis,:], dot.shape)
+  with np.errstate(divide='ignore', invalid='ignore'):
+    angle = np.degrees(np.arccos(dot[choose]/norm[choose]))
+  angle = angle[np.isfinite(angle)]
+
+  data_num = len(state['adf_hist'])-1
+  bin_id = np.ceil(angle/a_increment).astype('int64')-1
+  bin_id = bin_id[(bin_id >= 1) & (bin_id <= data_num)]
+  state['adf_hist'] = state['adf_hist']+np.bincount(bin_id, minlength=data_num+1)
+  state['adf_angles_num'] = np.array(int(np.count_nonzero(choose)), dtype='int64')
+
+def update_msd(state, coord):
+
+  '''
+  update_msd: add one frame to mean square displacement accumulators.
+
+  Args:
+    state: dictionary
+      state contains the accumulators.
+    coord: 2-d float array, dim = (number of choosed atoms)*3
+  Returns:
+    none
+  '''
+
+  #The last max_frame_corr-1 frames are kept as time origins, so every frame
+  #is correlated with the frames before it, same as diffusion_einstein_sum.
+  buffer = state['msd_buffer']
+  max_frame_corr = len(state['msd_sum'])
+  lag_num = len(buffer)
+  if ( lag_num > 0 ):
+    disp = coord[np.newaxis,:,:]-buffer[::-1]
+    state['msd_sum'][1:lag_num+1] = state['msd_sum'][1:lag_num+1]+np.mean(np.sum(disp**2, axis=2), axis=1)
+  state['msd_count'][0:lag_num+1] = state['msd_count'][0:lag_num+1]+1
+  state['msd_buffer'] = np.concatenate((buffer, coord[np.newaxis,:,:]))[-(max_frame_corr-1):] \
+                        if max_frame_corr > 1 else buffer
+
+def update_ener(state, ener_data):
+
+  '''
+  update_ener: add energies of new frames to running mean and variance.
+
+  Args:
+    state: dictionary
+      state contains the accumulators.
+    ener_data: 2-d float array
+      ener_data contains the lines of ener file, columns are step, time, kinetic
+      energy, temperature, potential energy, conserved quantity and used time.
+  Returns:
+    none
+  '''
+
+  if ( ener_data.shape[1] < 6 ):
+    log_info.log_error('File error: ener file should contain step, time, kinetic energy, temperature, potential energy and conserved quantity')
+    exit()
+
+  #Mean and variance of new frames are merged into the old ones.
+  data = ener_data[:,2:6]
+  old_num = int(state['ener_frames'])
+  new_num = len(data)
+  new_mean = np.mean(data, axis=0)
+  new_m2 = np.sum((data-new_mean)**2, axis=0)
+  whole_num = old_num+new_num
+  delta = new_mean-state['ener_mean']
+  state['ener_mean'] = state['ener_mean']+delta*new_num/whole_num
+  state['ener_m2'] = state['ener_m2']+new_m2+delta**2*old_num*new_num/whole_num
+  state['ener_frames'] = np.array(whole_num, dtype='int64')
+  state['ener_step'] = np.array(int(ener_data[new_num-1,0]), dtype='int64')
+
+def write_follow_result(state, follow_param, atom_num_info, work_dir):
+
+  '''
+  write_follow_result: write rdf, adf, msd and energy statistics from accumulators.
+
+  Args:
+    state: dictionary
+      state contains the accumulators.
+    follow_param: dictionary
+      follow_param contains keywords used in follow functions.
+    atom_num_info: dictionary
+      atom_num_info contains the number of atoms used for normalization.
+    work_dir: string
+      work_dir is the working directory of CP2K_kit.
+  Returns:
+    result_file: 1-d string list
+      result_file contains the names of written files.
+  '''
+
+  result_file = []
+  frames_num = int(state['coord_frames'])
+
+  if ( 'rdf' in follow_param.keys() and frames_num > 0 ):
+    box = follow_param['box']
+    vol = np.dot(box['A'], np.cross(box['B'], box['C']))
+    r_increment = follow_param['rdf']['r_increment']
+    data_num = len(state['rdf_hist'])
+    density = atom_num_info['rdf_2']/vol
+    count = state['rdf_hist']/(frames_num*atom_num_info['rdf_1'])
+    rdf_file = ''.join((work_dir, '/rdf_integral.csv'))
+    with open(rdf_file, 'w') as csvfile:
+      writer = csv.writer(csvfile)
+      writer.writerow(['distance(Ang)', 'rdf', 'int'])
+      integral_value = 0.0
+      for i in range(1, data_num):
+        r_value = r_increment*i
+        integral_value = integral_value+count[i]
+        writer.writerow([r_value, count[i]/(4.0*np.pi*density*r_value**2*r_increment), integral_value])
+    result_file.append(rdf_file)
+
+  if ( 'adf' in follow_param.keys() and frames_num > 0 and int(state['adf_angles_num']) > 0 ):
+    a_increment = follow_param['adf']['a_increment']
+    data_num = len(state['adf_hist'])-1
+    adf_file = ''.join((work_dir, '/adf.csv'))
+    with open(adf_file, 'w') as csvfile:
+      writer = csv.writer(csvfile)
+      writer.writerow(['angle(degree)', 'adf'])
+      for i in range(data_num-1):
+        writer.writerow([a_increment*(i+1), state['adf_hist'][i+1]/(frames_num*int(state['adf_angles_num']))])
+    result_file.append(adf_file)
+
+  if ( 'msd' in follow_param.keys() and frames_num > 0 ):
+    msd_file = ''.join((work_dir, '/msd.csv'))
+    with open(msd_file, 'w') as csvfile:
+      writer = csv.writer(csvfile)
+      writer.writerow(['time(fs)', 'msd(Angstrom^2)'])
+      for i in range(len(state['msd_sum'])):
+        if ( state['msd_count'][i] > 0 ):
+          writer.writerow([i*float(state['lag_time']), state['msd_sum'][i]/state['msd_count'][i]])
+    result_file.append(msd_file)
+
+  if ( 'traj_ener_file' in follow_param.keys() and int(state['ener_frames']) > 0 ):
+    ener_frames = int(state['ener_frames'])
+    ener_std = np.sqrt(state['ener_m2']/ener_frames)
+    ener_file = ''.join((work_dir, '/ener_stat.csv'))
+    with open(ener_file, 'w') as csvfile:
+      writer = csv.writer(csvfile)
+      writer.writerow(['quantity', 'average', 'sigma', 'frames'])
+      ener_name = ['kinetic(a.u.)', 'temperature(K)', 'potential(a.u.)', 'conserved(a.u.)']
+      for i in range(len(ener_name)):
+        writer.writerow([ener_name[i], state['ener_mean'][i], ener_std[i], ener_frames])
+    result_file.append(ener_file)
+
+  return result_file
+
+def follow_run(follow_param, work_dir):
+
+  '''
+  follow_run: the kernel function to run follow function.
+
+  Args:
+    follow_param: dictionary
+      follow_param contains keywords used in follow functions.
+    work_dir: string
+      work_dir is the working directory of CP2K_kit.
+  Returns:
+    none
+  '''
+
+  follow_param = check_analyze.check_follow_inp(follow_param)
+
+  interval = follow_param['interval']
+  max_idle = follow_param['max_idle']
+  if ( 'checkpoint_file' in follow_param.keys() ):
+    checkpoint_file = follow_param['checkpoint_file']
+  else:
+    checkpoint_file = ''.join((work_dir, '/follow_checkpoint.npz'))
+
+  param_key = ['traj_coord_file', 'traj_ener_file', 'box', 'rdf', 'adf', 'msd']
+  param_str = json.dumps({key: follow_param[key] for key in param_key if key in follow_param.keys()}, sort_keys=True)
+
+  state = load_follow_state(checkpoint_file, param_str)
+  print ('FOLLOW'.center(80, '*'), flush=True)
+  if ( state is None ):
+    state = init_follow_state(follow_param, param_str)
+  else:
+    str_print = 'Resume from %s, %d frames have been analyzed' %(checkpoint_file, int(state['coord_frames']))
+    print (data_op.str_wrap(str_print, 80), flush=True)
+
+  atom_num_info = {}
+  if ( 'traj_coord_file' in follow_param.keys() ):
+    traj_coord_file = follow_param['traj_coord_file']
+    coord_index = traj_index.update_frame_index(traj_coord_file, 'coord_xyz')
+    if ( len(coord_index['step']) == 0 ):
+      log_info.log_error('File error: there is no complete frame in %s, please check' %(traj_coord_file))
+      exit()
+    atoms = np.array(traj_reader.read_elements(traj_coord_file, coord_index, 0))
+    atom_type = data_op.list_replicate(list(atoms))
+
+    if ( 'box' in follow_param.keys() ):
+      cell = np.array([follow_param['box']['A'], follow_param['box']['B'], follow_param['box']['C']])
+
+    if ( 'rdf' in follow_param.keys() ):
+      atom_1, atom_2 = follow_param['rdf']['atom_type_pair']
+      for atom_i in [atom_1, atom_2]:
+        if atom_i not in atom_type:
+          log_info.log_error('Input error: %s atom type is not in the system' %(atom_i))
+          exit()
+      rdf_id_1 = np.nonzero(atoms == atom_1)[0]+1
+      rdf_id_2 = np.nonzero(atoms == atom_2)[0]+1
+      atom_num_info['rdf_1'] = len(rdf_id_1)
+      atom_num_info['rdf_2'] = len(rdf_id_2)-1 if atom_1 == atom_2 else len(rdf_id_2)
+
+    if ( 'adf' in follow_param.keys() ):
+      for atom_i in follow_param['adf']['atom_type_pair']:
+        if atom_i not in atom_type:
+          log_info.log_error('Input error: %s atom type is not in the system' %(atom_i))
+          exit()
+      adf_id = [np.nonzero(atoms == atom_i)[0]+1 for atom_i in follow_param['adf']['atom_type_pair']]
+
+    if ( 'msd' in follow_param.keys() ):
+      msd_atom_id = follow_param['msd']['atom_id']
+      if ( max(msd_atom_id) > len(atoms) ):
+        log_info.log_error('Input error: atom_id is larger than the number of atoms, please check analyze/follow/msd/atom_id')
+        exit()
+
+  if ( 'traj_ener_file' in follow_param.keys() ):
+    traj_ener_file = follow_param['traj_ener_file']
+    ener_index = traj_index.update_frame_index(traj_ener_file, 'ener')
+
+  idle_time = 0.0
+  while True:
+    new_frames_num = 0
+
+    if ( 'traj_coord_file' in follow_param.keys() ):
+      coord_index = traj_index.update_frame_index(traj_coord_file, 'coord_xyz', coord_index)
+      step = coord_index['step']
+      if ( 'msd' in follow_param.keys() and float(state['lag_time']) == 0.0 and len(step) > 1 ):
+        state['lag_time'] = np.array(coord_index['time'][1]-coord_index['time'][0], dtype='float64')
+      #Frames of a restarted md may repeat old steps, they are skipped.
+      frame_list = np.nonzero(step > int(state['coord_step']))[0]
+      chunk_size = traj_reader.get_chunk_size(len(atoms))
+      for i in range(0, len(frame_list), chunk_size):
+        frame_list_i = frame_list[i:i+chunk_size]
+        coord = np.array(traj_reader.read_frames(traj_coord_file, coord_index, frame_list_i), dtype='float64')
+        for j in range(len(frame_list_i)):
+          if ( 'rdf' in follow_param.keys() ):
+            update_rdf(state, coord[j], rdf_id_1, rdf_id_2, cell, follow_param['rdf']['r_increment'])
+          if ( 'adf' in follow_param.keys() ):
+            update_adf(state, coord[j], adf_id[0], adf_id[1], adf_id[2], follow_param['adf']['a_increment'])
+          if ( 'msd' in follow_param.keys() ):
+            update_msd(state, coord[j][np.array(msd_atom_id)-1])
+        state['coord_step'] = np.array(step[frame_list_i[-1]], dtype='int64')
+        state['coord_frames'] = np.array(int(state['coord_frames'])+len(frame_list_i), dtype='int64')
+      new_frames_num = new_frames_num+len(frame_list)
+
+    if ( 'traj_ener_file' in follow_param.keys() ):
+      ener_index = traj_index.update_frame_index(traj_ener_file, 'ener', ener_index)
+      frame_list = np.nonzero(ener_index['step'] > int(state['ener_step']))[0]
+      if ( len(frame_list) != 0 ):
+        update_ener(state, traj_reader.read_lines_data(traj_ener_file, ener_index, frame_list))
+      new_frames_num = new_frames_num+len(frame_list)
+
+    if ( new_frames_num != 0 ):
+      dump_follow_state(checkpoint_file, state)
+      result_file = write_follow_result(state, follow_param, atom_num_info, work_dir)
+      str_print = 'Analyze %d new frames, %d frames in total. Results are written in %s' \
+                  %(new_frames_num, int(state['coord_frames'])+int(state['ener_frames']), ' '.join(result_file))
+      print (data_op.str_wrap(str_print, 80), flush=True)
+      idle_time = 0.0
+    else:
+      idle_time = idle_time+interval
+
+    if ( idle_time >= max_idle ):
+      break
+    time.sleep(interval)
+
+  str_print = 'Stop follow, the accumulators are saved in %s' %(checkpoint_file)
+  print (data_op.str_wrap(str_print, 80), flush=True)
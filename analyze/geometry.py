@@ -2,7 +2,6 @@
 
 import os
 import csv
-import linecache
 import numpy as np
 from collections import OrderedDict
 from CP2K_kit.tools import call
@@ -11,11 +10,50 @@ from CP2K_kit.tools import get_cell
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
 from CP2K_kit.tools import traj_tools
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.tools import neighbor
 from CP2K_kit.analyze import rdf
-from CP2K_kit.analyze import center
 from CP2K_kit.analyze import check_analyze
 from CP2K_kit.lib import geometry_mod
-from CP2K_kit.lib import statistic_mod
+
+def get_neighbor_num(coord, a_vec, b_vec, c_vec, r_cut, atom_id_1, atom_id_2):
+
+  '''
+  get_neighbor_num: get the number of atom_2 within cutoff around each atom_1.
+
+  Args:
+    coord: 2-d float list, dim = (atoms_num)*3
+      coord is the coordinations of atoms.
+    a_vec: 1-d float list, dim = 3
+      a_vec is the cell vector a.
+    b_vec: 1-d float list, dim = 3
+      b_vec is the cell vector b.
+    c_vec: 1-d float list, dim = 3
+      c_vec is the cell vector c.
+    r_cut: float
+      r_cut is the cutoff value.
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id (starting from 1) of atom_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id (starting from 1) of atom_2.
+  Returns:
+    neighbor_num: 1-d int array, dim = len(atom_id_1)
+      neighbor_num contains the number of atom_2 (distance < r_cut) around each atom_1.
+  '''
+
+  #If r_cut is not larger than half of the box, the minimum image is the only
+  #image within r_cut, and cell list gives the same neighbors in linear cost.
+  cell = np.array([a_vec, b_vec, c_vec], dtype='float64')
+  neighbor_num = np.zeros(len(atom_id_1), dtype='int64')
+  if ( r_cut <= min(neighbor.get_cell_height(cell))/2.0 ):
+    pair_1, pair_2, dist = neighbor.get_neighbor_pair(coord, cell, r_cut, atom_id_1, atom_id_2)
+    neighbor_num = np.bincount(pair_1[dist < r_cut], minlength=len(atom_id_1))
+  else:
+    for atom_id_1_i, dist in rdf.get_pair_distance(coord, atom_id_1, atom_id_2, cell):
+      neighbor_num[np.searchsorted(atom_id_1, atom_id_1_i)] = np.sum((dist >= 0.0) & (dist < r_cut), axis=1)
+
+  return neighbor_num
 
 def get_coord_num(atoms, coord, a_vec, b_vec, c_vec, r_cut):
 
@@ -47,32 +85,12 @@ def get_coord_num(atoms, coord, a_vec, b_vec, c_vec, r_cut):
   '''
 
   atoms_type = data_op.list_replicate(atoms)
-  coord_num = []
-
-  for i in range(len(atoms_type)):
-    coord_num_i = []
-    for j in range(len(atoms)):
-      coord_1 = []
-      coord_2 = []
-      if ( atoms[j] == atoms_type[i] ):
-        for k in range(len(atoms)):
-          if ( j != k ):
-            coord_1.append(coord[j])
-            coord_2.append(coord[k])
-
-      if ( coord_1 != [] ):
-        dist = geometry_mod.geometry.calculate_distance(np.asfortranarray(coord_1, dtype='float32'), \
-                                                        np.asfortranarray(coord_2, dtype='float32'), \
-                                                        np.asfortranarray(a_vec, dtype='float32'), \
-                                                        np.asfortranarray(b_vec, dtype='float32'), \
-                                                        np.asfortranarray(c_vec, dtype='float32'))
-        coord_num_tmp = data_op.list_num_stat(dist, r_cut, 'less')
-        coord_num_i.append(coord_num_tmp)
-    coord_num.append(coord_num_i)
+  atom_id = np.arange(1, len(atoms)+1)
+  coord_num = get_neighbor_num(coord, a_vec, b_vec, c_vec, r_cut, atom_id, atom_id)
 
   coord_num_avg = []
-  for i in range(len(coord_num)):
-    coord_num_tmp = float(sum(coord_num[i])/len(coord_num[i]))
+  for i in range(len(atoms_type)):
+    coord_num_tmp = float(np.mean(coord_num[np.array(atoms) == atoms_type[i]]))
     coord_num_avg.append(coord_num_tmp)
 
   return atoms_type, coord_num_avg
@@ -102,42 +120,18 @@ def get_neighbor(atoms, coord, a_vec, b_vec, c_vec, r_cut):
   Returns:
     atoms_type: 1-d string list
       atoms_type is the list of atom types.
-    coord_num_avg: 1-d int list, dim = len(atoms_type)
-      coord_num_avg contains the averaged coordination number for each atom type.
+    neighbor_max: 1-d int list, dim = len(atoms_type)
+      neighbor_max contains the max number of neighbors of each atom type around one atom.
   '''
 
   atoms_type = data_op.list_replicate(atoms)
-
-  neighbor = []
-
-  for i in range(len(atoms)):
-    neighbor_i = []
-    for j in range(len(atoms_type)):
-      coord_1 = []
-      coord_2 = []
-      for k in range(len(atoms)):
-        if ( i != k and atoms[k] == atoms_type[j] ):
-          coord_1.append(coord[i])
-          coord_2.append(coord[k])
-
-      if ( len(coord_1) != 0 ):
-        dist = geometry_mod.geometry.calculate_distance(np.asfortranarray(coord_1, dtype='float32'), \
-                                                        np.asfortranarray(coord_2, dtype='float32'), \
-                                                        np.asfortranarray(a_vec, dtype='float32'), \
-                                                        np.asfortranarray(b_vec, dtype='float32'), \
-                                                        np.asfortranarray(c_vec, dtype='float32'))
-        coord_num_tmp = data_op.list_num_stat(dist, r_cut, 'less')
-        neighbor_i.append(coord_num_tmp)
-      else:
-        neighbor_i.append(0)
-    neighbor.append(neighbor_i)
+  atom_id = np.arange(1, len(atoms)+1)
 
   neighbor_max = []
   for i in range(len(atoms_type)):
-    neighbor_i = []
-    for j in range(len(atoms)):
-      neighbor_i.append(neighbor[j][i])
-    neighbor_max.append(max(neighbor_i))
+    atom_id_i = atom_id[np.array(atoms) == atoms_type[i]]
+    neighbor_num = get_neighbor_num(coord, a_vec, b_vec, c_vec, r_cut, atom_id, atom_id_i)
+    neighbor_max.append(int(max(neighbor_num)))
 
   return atoms_type, neighbor_max
 
@@ -175,17 +169,9 @@ def expand_cell(atoms_num, pre_base_block, end_base_block, pre_base, file_name,
     none
   '''
 
-  atom = []
-  coord_atom = np.asfortranarray(np.zeros((atoms_num,3)),dtype='float32')
-  for i in range(atoms_num):
-    line_i = linecache.getline(file_name, i+pre_base_block+pre_base+1)
-    line_i_split = data_op.split_str(line_i, ' ', '\n')
-    coord_atom[i,0] = float(line_i_split[1])
-    coord_atom[i,1] = float(line_i_split[2])
-    coord_atom[i,2] = float(line_i_split[3])
-    atom.append(line_i_split[0])
-
-  linecache.clearcache()
+  frame_index = traj_index.get_frame_index(file_name, 'coord_xyz')
+  atom = traj_reader.read_elements(file_name, frame_index, 0)
+  coord_atom = traj_reader.read_frames(file_name, frame_index, [0])[0]
 
   coord_atom_exp = geometry_mod.geometry.expand_cell(np.asfortranarray(coord_atom, dtype='float32'), \
                                                      np.asfortranarray(a_vec, dtype='float32'), \
@@ -203,11 +189,68 @@ def expand_cell(atoms_num, pre_base_block, end_base_block, pre_base, file_name,
     coord_atom_exp[i], coord_atom_exp[i], coord_atom_exp[i]))
 
 
+def get_data_stat(data, increment):
+
+  '''
+  get_data_stat: get average, standard deviation, variance and histogram of data.
+
+  Args:
+    data: 2-d float array, dim = (number of frames)*(number of data sets)
+      data contains data sets along frames.
+    increment: float
+      increment is the bin width of histogram.
+  Returns:
+    data_avg: 1-d float array, dim = number of data sets
+      data_avg is the averaged value of each data set.
+    sigma: 1-d float array, dim = number of data sets
+      sigma is the standard deviation of each data set.
+    data_var: 1-d float array, dim = number of data sets
+      data_var is the variance of each data set.
+    hist: 1-d list, dim = number of data sets
+      hist contains (bin center, probability density) arrays of each data set.
+  '''
+
+  data = np.array(data, dtype='float64')
+  data_avg = np.mean(data, axis=0)
+  data_var = np.var(data, axis=0)
+  sigma = np.sqrt(data_var)
+
+  hist = []
+  for i in range(data.shape[1]):
+    bin_start = np.floor(np.min(data[:,i])/increment)*increment
+    bins_num = max(1, int(np.ceil((np.max(data[:,i])-bin_start)/increment)))
+    count, bin_edge = np.histogram(data[:,i], bins_num, (bin_start, bin_start+bins_num*increment))
+    hist.append((bin_edge[:-1]+increment/2.0, count/(len(data)*increment)))
+
+  return data_avg, sigma, data_var, hist
+
+def write_hist(hist, x_label, hist_file):
+
+  '''
+  write_hist: write histogram to a csv file.
+
+  Args:
+    hist: tuple
+      hist contains bin center and probability density arrays.
+    x_label: string
+      x_label is the header of bin center.
+    hist_file: string
+      hist_file is the name of histogram file.
+  Returns:
+    none
+  '''
+
+  with open(hist_file, 'w') as csvfile:
+    writer = csv.writer(csvfile)
+    writer.writerow([x_label, 'probability'])
+    for i in range(len(hist[0])):
+      writer.writerow([hist[0][i], hist[1][i]])
+
 def bond_length_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, init_step, \
-                     end_step, time_step, traj_coord_file, a_vec, b_vec, c_vec, atom_1_id, atom_2_id, work_dir):
+                     end_step, time_step, traj_coord_file, a_vec, b_vec, c_vec, atom_pair, work_dir):
 
   '''
-  bond_length_stat: get the bond length between two atoms over different frames.
+  bond_length_stat: get the bond lengths between atom pairs over different frames.
 
   Args:
     atoms_num: int
@@ -241,66 +284,53 @@ def bond_length_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_
     c_vec: 1-d float list, dim = 3
       c_vec is the cell vector c.
       Example : [0.0, 0.0, 12.42]
-    atom_1_id: int
-      atom_1_id is the id for atom 1.
-    atom_2_id: int
-      atom_2_id is the id for atom 2.
+    atom_pair: 2-d int list, dim = (number of pairs)*2
+      atom_pair contains atom id of atom 1 and atom 2 of each pair.
+      Example: [[1, 2], [1, 3]]
     work_dir: string
       work_dir is working directory of CP2K_kit.
   Returns:
     time: 1-d float list
       time contains time for different frames.
-    distance: 1-d float array
+    distance: 2-d float array, dim = (number of frames)*(number of pairs)
       distance contains distance between atom 1 and atom 2 for different frames.
-    distance_avg: float
+    distance_avg: 1-d float array, dim = number of pairs
       ditance_avg is the averaged distance between atom 1 and atom 2.
+    sigma: 1-d float array, dim = number of pairs
+      sigma is the standard deviation of distance.
+    distance_var: 1-d float array, dim = number of pairs
+      distance_var is the variance of distance.
+    distance_hist: 1-d list, dim = number of pairs
+      distance_hist contains the histogram of distance of each pair.
   '''
 
-  a_vec = np.asfortranarray(a_vec, dtype='float32')
-  b_vec = np.asfortranarray(b_vec, dtype='float32')
-  c_vec = np.asfortranarray(c_vec, dtype='float32')
-
-  center_file = center.center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, \
-                a_vec, b_vec, c_vec, 'center_box', 0, traj_coord_file, work_dir, 'center.xyz')
-
-  frame_stat_num = int((end_step-init_step)/each+1)
-  coord_atom_1 = np.asfortranarray(np.zeros((frame_stat_num,3)),dtype='float32')
-  coord_atom_2 = np.asfortranarray(np.zeros((frame_stat_num,3)),dtype='float32')
+  #The atoms of all pairs are read together, and all bond lengths of all frames
+  #are calculated in one call with minimum image, so no centering is needed.
+  atom_pair = np.array(atom_pair, dtype='int64')
+  atom_id = np.unique(atom_pair)
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  frame_list = traj_reader.get_frame_list(frame_index, init_step, end_step)
+  coord = np.array(traj_reader.read_frames(traj_coord_file, frame_index, frame_list, list(atom_id)), dtype='float64')
   time = []
-
-  for i in range(frame_stat_num):
+  for i in range(len(frame_list)):
     time.append(time_step*each*i)
-    line_i_1_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+atom_1_id+pre_base+pre_base_block
-    line_i_1 = linecache.getline(center_file, line_i_1_num)
-    line_i_1_split = data_op.split_str(line_i_1, ' ', '\n')
-    coord_atom_1[i,0] = float(line_i_1_split[1])
-    coord_atom_1[i,1] = float(line_i_1_split[2])
-    coord_atom_1[i,2] = float(line_i_1_split[3])
-
-    line_i_2_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+atom_2_id+pre_base+pre_base_block
-    line_i_2 = linecache.getline(center_file, line_i_2_num)
-    line_i_2_split = data_op.split_str(line_i_2, ' ', '\n')
-    coord_atom_2[i,0] = float(line_i_2_split[1])
-    coord_atom_2[i,1] = float(line_i_2_split[2])
-    coord_atom_2[i,2] = float(line_i_2_split[3])
-
-  linecache.clearcache()
 
-  distance = geometry_mod.geometry.calculate_distance(coord_atom_1, coord_atom_2, a_vec, b_vec, c_vec)
-  distance_avg, sigma = statistic_mod.statistic.numerical_average(distance)
+  cell = np.array([a_vec, b_vec, c_vec], dtype='float64')
+  vec = coord[:,np.searchsorted(atom_id, atom_pair[:,1]),:]-coord[:,np.searchsorted(atom_id, atom_pair[:,0]),:]
+  frac = np.dot(vec, np.linalg.inv(cell))
+  distance = np.sqrt(np.sum(np.dot(frac-np.round(frac), cell)**2, axis=2))
 
-  cmd = 'rm %s' %(center_file)
-  call.call_simple_shell(work_dir, cmd)
+  distance_avg, sigma, distance_var, distance_hist = get_data_stat(distance, 0.01)
 
-  return time, distance, distance_avg, sigma
+  return time, distance, distance_avg, sigma, distance_var, distance_hist
 
 def bond_angle_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, \
-                    init_step, end_step, time_step, traj_coord_file, atom_1_id, atom_2_id, atom_3_id):
+                    init_step, end_step, time_step, traj_coord_file, atom_pair):
 
-  #atom_2_id is the center atom for bond angle analysis.
+  #The second atom of each pair is the center atom for bond angle analysis.
 
   '''
-  bond_angle_stat: get the bond angle between three atoms over different frames.
+  bond_angle_stat: get the bond angles of atom triplets over different frames.
 
   Args:
     atoms_num: int
@@ -325,68 +355,45 @@ def bond_angle_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_f
       time_step is time step of md. Its unit is fs in CP2K_kit.
     traj_coord_file: string
       traj_coord_file is the name of coordination trajectory file.
-    atom_1_id: int
-      atom_1_id is the id for atom 1.
-    atom_2_id: int
-      atom_2_id is the id for atom 2.
-    atom_3_id: int
-      atom_3_id is the id for atom 3.
+    atom_pair: 2-d int list, dim = (number of triplets)*3
+      atom_pair contains atom id of atom 1, atom 2 and atom 3 of each triplet.
+      Example: [[2, 1, 3]]
   Returns:
     time: 1-d float list
       time contains time for different frames.
-    angle: 1-d float array
+    angle: 2-d float array, dim = (number of frames)*(number of triplets)
       angle contains angle between three atoms for different frames.
-    angle_avg: float
+    angle_avg: 1-d float array, dim = number of triplets
       angle_avg is the averaged angle between three atoms.
+    sigma: 1-d float array, dim = number of triplets
+      sigma is the standard deviation of angle.
+    angle_var: 1-d float array, dim = number of triplets
+      angle_var is the variance of angle.
+    angle_hist: 1-d list, dim = number of triplets
+      angle_hist contains the histogram of angle of each triplet.
   '''
 
-  frame_stat_num = int((end_step-init_step)/each+1)
-  coord_atom_1 = np.asfortranarray(np.zeros((frame_stat_num,3)),dtype='float32')
-  coord_atom_2 = np.asfortranarray(np.zeros((frame_stat_num,3)),dtype='float32')
-  coord_atom_3 = np.asfortranarray(np.zeros((frame_stat_num,3)),dtype='float32')
+  atom_pair = np.array(atom_pair, dtype='int64')
+  atom_id = np.unique(atom_pair)
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  frame_list = traj_reader.get_frame_list(frame_index, init_step, end_step)
+  coord = np.array(traj_reader.read_frames(traj_coord_file, frame_index, frame_list, list(atom_id)), dtype='float64')
   time = []
-
-  for i in range(frame_stat_num):
+  for i in range(len(frame_list)):
     time.append(time_step*i*each)
-    a_atom_1_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+atom_1_id+pre_base+pre_base_block
-    a_atom_1 = linecache.getline(traj_coord_file, a_atom_1_num)
-    b_atom_1 = a_atom_1.split(' ')
-    c_atom_1 = []
-    for j in range(len(b_atom_1)):
-      if (b_atom_1[j] != ''):
-        c_atom_1.append(b_atom_1[j])
-    coord_atom_1[i,0] = float(c_atom_1[1])
-    coord_atom_1[i,1] = float(c_atom_1[2])
-    coord_atom_1[i,2] = float(c_atom_1[3].strip('\n'))
-
-    a_atom_2_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+atom_2_id+pre_base+pre_base_block
-    a_atom_2 = linecache.getline(traj_coord_file, a_atom_2_num)
-    b_atom_2 = a_atom_2.split(' ')
-    c_atom_2 = []
-    for j in range(len(b_atom_2)):
-      if (b_atom_2[j] != ''):
-        c_atom_2.append(b_atom_2[j])
-    coord_atom_2[i,0] = float(c_atom_2[1])
-    coord_atom_2[i,1] = float(c_atom_2[2])
-    coord_atom_2[i,2] = float(c_atom_2[3].strip('\n'))
-
-    a_atom_3_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+atom_3_id+pre_base+pre_base_block
-    a_atom_3 = linecache.getline(traj_coord_file, a_atom_3_num)
-    b_atom_3 = a_atom_3.split(' ')
-    c_atom_3 = []
-    for j in range(len(b_atom_3)):
-      if (b_atom_3[j] != ''):
-        c_atom_3.append(b_atom_3[j])
-    coord_atom_3[i,0] = float(c_atom_3[1])
-    coord_atom_3[i,1] = float(c_atom_3[2])
-    coord_atom_3[i,2] = float(c_atom_3[3].strip('\n'))
-
-  linecache.clearcache()
-
-  angle = geometry_mod.geometry.calculate_angle(coord_atom_1, coord_atom_2, coord_atom_3)
-  angle_avg, sigma = statistic_mod.statistic.numerical_average(angle)
-
-  return time, angle, angle_avg, sigma
+
+  #Same as geometry_mod.calculate_angle, the angles are from raw coordinates.
+  coord_atom_1 = coord[:,np.searchsorted(atom_id, atom_pair[:,0]),:]
+  coord_atom_2 = coord[:,np.searchsorted(atom_id, atom_pair[:,1]),:]
+  coord_atom_3 = coord[:,np.searchsorted(atom_id, atom_pair[:,2]),:]
+  vec_1 = coord_atom_1-coord_atom_2
+  vec_2 = coord_atom_3-coord_atom_2
+  norm = np.sqrt(np.sum(vec_1**2, axis=2)*np.sum(vec_2**2, axis=2))
+  angle = np.arccos(np.clip(np.sum(vec_1*vec_2, axis=2)/norm, -1.0, 1.0))
+
+  angle_avg, sigma, angle_var, angle_hist = get_data_stat(angle, 0.01)
+
+  return time, angle, angle_avg, sigma, angle_var, angle_hist
 
 def order_struct(atoms_num, frames_num, pre_base_block, end_base_block, pre_base, group_atom, \
                  atom_id, traj_coord_file, a_vec, b_vec, c_vec, work_dir, file_name):
@@ -435,6 +442,10 @@ def order_struct(atoms_num, frames_num, pre_base_block, end_base_block, pre_base
       order_list is the order.
   '''
 
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
+  coord_first = traj_reader.read_frames(traj_coord_file, frame_index, [0])[0]
+
   order_list = []
 
   #Get the order list from the first frame
@@ -458,10 +469,8 @@ def order_struct(atoms_num, frames_num, pre_base_block, end_base_block, pre_base
           group_coord_j = []
           group_atom_id_j = []
           for k in atom_id_i:
-            line_k = linecache.getline(traj_coord_file, pre_base+pre_base_block+k)
-            line_k_split = data_op.split_str(line_k, ' ', '\n')
-            if ( line_k_split[0] == group_atom_type[j] ):
-              group_coord_j.append([float(line_k_split[1]), float(line_k_split[2]), float(line_k_split[3])])
+            if ( atoms[k-1] == group_atom_type[j] ):
+              group_coord_j.append([float(x) for x in coord_first[k-1]])
               group_atom_id_j.append(k)
           group_coord.append(group_coord_j)
           group_atom_id.append(group_atom_id_j)
@@ -494,17 +503,16 @@ def order_struct(atoms_num, frames_num, pre_base_block, end_base_block, pre_base
 
   new_file_name = ''.join((work_dir, '/', file_name))
   new_traj_file = open(new_file_name, 'w')
+  order_id = []
+  for j in range(len(order_list)):
+    order_id = order_id+order_list[j]
   for i in range(frames_num):
-    line_i_1 = linecache.getline(traj_coord_file, (pre_base_block+atoms_num+end_base_block)*i+1+pre_base)
-    line_i_2 = linecache.getline(traj_coord_file, (pre_base_block+atoms_num+end_base_block)*i+2+pre_base)
-    new_traj_file.write(line_i_1)
-    new_traj_file.write(line_i_2)
-    for j in range(len(order_list)):
-      for k in order_list[j]:
-        line_ijk = linecache.getline(traj_coord_file, (pre_base_block+atoms_num+end_base_block)*i+pre_base_block+k+pre_base)
-        new_traj_file.write(line_ijk)
-
-  linecache.clearcache()
+    frame_lines = traj_index.read_frame_lines(traj_coord_file, frame_index, i)
+    new_traj_file.write(frame_lines[0])
+    new_traj_file.write(frame_lines[1])
+    for k in order_id:
+      new_traj_file.write(frame_lines[pre_base_block+k-1])
+  new_traj_file.close()
 
   return new_file_name, order_list
 
@@ -563,27 +571,24 @@ def first_shell(atoms_num, pre_base_block, end_base_block, pre_base, start_frame
       dist is the list of distance of the first shell.
   '''
 
-  #distance is 3-d float list (frames_num*(number of atom_1)*(number of atom_2)).
-  distance, atom_1, atom_2 = rdf.distance(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, \
-                                          init_step, end_step, atom_type_1, atom_type_2, a_vec, b_vec, c_vec, traj_coord_file, work_dir)
-
-  dim1, dim2, dim3 = np.array(distance).shape
+  #Minimum image distances are calculated frame by frame from the raw trajectory,
+  #so no centered copy is written and the distances of all frames are not kept.
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
+  atom_id_1 = rdf.get_atom_id(atoms, atom_type_1)
+  atom_id_2 = rdf.get_atom_id(atoms, atom_type_2)
+  cell = np.array([a_vec, b_vec, c_vec], dtype='float64')
 
   first_shell = []
   dist = []
-  for i in range(dim1):
+  for atoms_i, coord, cell_i, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
     first_shell_i = []
     dist_i = []
-    for j in range(dim2):
-      first_shell_i_j = [atom_1[j]]
-      dist_i_j = []
-      for k in range(dim3):
-        if ( abs((distance[i][j][k]-dist_first_shell)) < dist_conv ):
-          first_shell_i_j.append(atom_2[k])
-          dist_i_j.append(distance[i][j][k])
-      first_shell_i.append(first_shell_i_j)
-      dist_i.append(dist_i_j)
-
+    for atom_id_1_j, distance in rdf.get_pair_distance(coord, atom_id_1, atom_id_2, cell):
+      for k in range(len(atom_id_1_j)):
+        in_shell = (distance[k] >= 0.0) & (abs(distance[k]-dist_first_shell) < dist_conv)
+        first_shell_i.append([int(atom_id_1_j[k])]+[int(x) for x in atom_id_2[in_shell]])
+        dist_i.append(list(distance[k][in_shell]))
     first_shell.append(first_shell_i)
     dist.append(dist_i)
 
@@ -609,17 +614,11 @@ def order_angle(center_atom_id, sur_atom_id, frame_id, each, traj_coord_file):
       order is the order.
   '''
 
-  atoms_num, pre_base, pre_base_block, end_base_block, start_frame_id = traj_tools.get_block_base(traj_coord_file, 'coord_xyz')
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  frame_list = traj_reader.get_frame_list(frame_index, frame_id, frame_id)
+  coord = traj_reader.read_frames(traj_coord_file, frame_index, frame_list)[0]
 
-  sur_atom_id_o = []
-
-  coord_atom_1 = np.asfortranarray(np.zeros((1,3)),dtype='float32')
-  a_atom_1_num = int((frame_id-start_frame_id)/each)*(pre_base_block+atoms_num+end_base_block)+center_atom_id+pre_base_block+pre_base
-  a_atom_1 = linecache.getline(traj_coord_file, a_atom_1_num)
-  c = data_op.split_str(a_atom_1, ' ', '\n')
-  coord_atom_1[0,0] = float(c[1])
-  coord_atom_1[0,1] = float(c[2])
-  coord_atom_1[0,2] = float(c[3])
+  coord_atom_1 = np.asfortranarray(coord[[center_atom_id-1],:], dtype='float32')
 
   pattern_1 = []
   pattern_2 = []
@@ -628,23 +627,11 @@ def order_angle(center_atom_id, sur_atom_id, frame_id, each, traj_coord_file):
     pattern_1.append(sur_atom_id[i])
     angle_list = []
     id_list = []
-    coord_atom_2 = np.asfortranarray(np.zeros((1,3)),dtype='float32')
-    a_atom_2_num = int((frame_id-start_frame_id)/each)*(pre_base_block+atoms_num+end_base_block)+sur_atom_id[i]+pre_base_block+pre_base
-    a_atom_2 = linecache.getline(traj_coord_file, a_atom_2_num)
-    c = data_op.split_str(a_atom_2, ' ', '\n')
-    coord_atom_2[0,0] = float(c[1])
-    coord_atom_2[0,1] = float(c[2])
-    coord_atom_2[0,2] = float(c[3])
+    coord_atom_2 = np.asfortranarray(coord[[sur_atom_id[i]-1],:], dtype='float32')
 
     for j in range(len(sur_atom_id)):
       if (j != i):
-        coord_atom_3 = np.asfortranarray(np.zeros((1,3)),dtype='float32')
-        a_atom_3_num = int((frame_id-start_frame_id)/each)*(pre_base_block+atoms_num+end_base_block)+sur_atom_id[j]+pre_base_block+pre_base
-        a_atom_3 = linecache.getline(traj_coord_file, a_atom_3_num)
-        c = data_op.split_str(a_atom_3, ' ', '\n')
-        coord_atom_3[0,0] = float(c[1])
-        coord_atom_3[0,1] = float(c[2])
-        coord_atom_3[0,2] = float(c[3])
+        coord_atom_3 = np.asfortranarray(coord[[sur_atom_id[j]-1],:], dtype='float32')
         angle = geometry_mod.geometry.calculate_angle(coord_atom_3,coord_atom_1,coord_atom_2)
         angle_list.append(angle[0])
         id_list.append(sur_atom_id[j])
@@ -653,8 +640,6 @@ def order_angle(center_atom_id, sur_atom_id, frame_id, each, traj_coord_file):
     pattern_2.append(id_list_sort[0])
     pattern_3.append(id_list_sort[1])
 
-  linecache.clearcache()
-
   order = []
   order.append(pattern_1[0])
   order.append(pattern_2[0])
@@ -703,44 +688,25 @@ def geometry_run(geometry_param, work_dir):
 
     log_info.log_traj_info(atoms_num, frames_num, each, start_frame_id, end_frame_id, time_step)
 
-    center_file = center.center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, \
-                                a_vec, b_vec, c_vec, 'center_box', 0, traj_coord_file, work_dir, 'center.xyz')
-
     print ('GEOMETRY'.center(80, '*'), flush=True)
     print ('Analyze coordination number of each atom type', flush=True)
 
     frames_num_stat = int((end_step-init_step)/each+1)
 
-    atoms = []
-    for i in range(atoms_num):
-      line_i = linecache.getline(center_file, pre_base+pre_base_block+i+1)
-      line_i_split = data_op.split_str(line_i, ' ')
-      atoms.append(line_i_split[0])
+    frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+    atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
 
     atoms_type = data_op.list_replicate(atoms)
     coord_num_tot = [0]*len(atoms_type)
 
-    for i in range(frames_num_stat):
-      atoms = []
-      coord = []
-      for j in range(atoms_num):
-        line_ij_num = (pre_base_block+atoms_num+end_base_block)*(int((init_step-start_frame_id)/each)+i)+pre_base+pre_base_block+j+1
-        line_ij = linecache.getline(center_file, line_ij_num)
-        line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-        atoms.append(line_ij_split[0])
-        coord.append([float(line_ij_split[1]), float(line_ij_split[2]), float(line_ij_split[3])])
+    for atoms, coord, cell, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
       atoms_type_i, coord_num_i = get_coord_num(atoms, coord, a_vec, b_vec, c_vec, r_cut)
       for j in range(len(atoms_type)):
         coord_num_tot[j] = coord_num_tot[j] + coord_num_i[j]
 
-    linecache.clearcache()
-
     for i in range(len(atoms_type)):
       print ('The coordination number of atom type %s is: %d' %(atoms_type[i], int(coord_num_tot[i]/frames_num_stat)), flush=True)
 
-    cmd = 'rm %s' %(center_file)
-    call.call_simple_shell(work_dir, cmd)
-
   if ( 'neighbor' in geometry_param ):
     neighbor_param = geometry_param['neighbor']
 
@@ -757,32 +723,18 @@ def geometry_run(geometry_param, work_dir):
 
     log_info.log_traj_info(atoms_num, frames_num, each, start_frame_id, end_frame_id, time_step)
 
-    center_file = center.center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, \
-                                a_vec, b_vec, c_vec, 'center_box', 0, traj_coord_file, work_dir, 'center.xyz')
-
     print ('GEOMETRY'.center(80, '*'), flush=True)
     print ('Analyze neighbor list of each atom type', flush=True)
 
     frames_num_stat = int((end_step-init_step)/each+1)
 
-    atoms = []
-    for i in range(atoms_num):
-      line_i = linecache.getline(center_file, pre_base+pre_base_block+i+1)
-      line_i_split = data_op.split_str(line_i, ' ')
-      atoms.append(line_i_split[0])
+    frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+    atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
 
     atoms_type = data_op.list_replicate(atoms)
     neighbor_list_tot = []
 
-    for i in range(frames_num_stat):
-      atoms = []
-      coord = []
-      for j in range(atoms_num):
-        line_ij_num = (pre_base_block+atoms_num+end_base_block)*(int((init_step-start_frame_id)/each)+i)+pre_base+pre_base_block+j+1
-        line_ij = linecache.getline(center_file, line_ij_num)
-        line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-        atoms.append(line_ij_split[0])
-        coord.append([float(line_ij_split[1]), float(line_ij_split[2]), float(line_ij_split[3])])
+    for atoms, coord, cell, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
       atoms_type_i, neighbor_list_i = get_neighbor(atoms, coord, a_vec, b_vec, c_vec, r_cut)
       neighbor_list_tot.append(neighbor_list_i)
 
@@ -792,16 +744,10 @@ def geometry_run(geometry_param, work_dir):
       for j in range(frames_num_stat):
         neighbor_list_i.append(neighbor_list_tot[j][i])
       neighbor_list.append(max(neighbor_list_i))
-    linecache.clearcache()
 
     for i in range(len(atoms_type)):
       print ('The max neighbors of atom type %s is: %d' %(atoms_type[i], neighbor_list[i]), flush=True)
 
-    cmd = 'rm %s' %(center_file)
-    call.call_simple_shell(work_dir, cmd)
-
-    linecache.clearcache()
-
   elif ( 'bond_length' in geometry_param ):
     bond_length_param = geometry_param['bond_length']
 
@@ -823,33 +769,41 @@ def geometry_run(geometry_param, work_dir):
     b_vec = geometry_param['bond_length']['box']['B']
     c_vec = geometry_param['bond_length']['box']['C']
 
-    print ('GEOMETRY'.center(80, '*'), flush=True)
+    atom_pair = []
     for i in range(atom_pair_num):
       if ( atom_pair_num > 1 ):
-        atom_pair = bond_length_param[''.join(('atom_pair', str(i)))]
+        atom_pair.append(bond_length_param[''.join(('atom_pair', str(i)))])
       else:
-        atom_pair = bond_length_param['atom_pair']
-      atom_1 = atom_pair[0]
-      atom_2 = atom_pair[1]
-      print ('Analyze bond length between %d and %d' %(atom_1, atom_2), flush=True)
+        atom_pair.append(bond_length_param['atom_pair'])
+
+    print ('GEOMETRY'.center(80, '*'), flush=True)
+    for i in range(atom_pair_num):
+      print ('Analyze bond length between %d and %d' %(atom_pair[i][0], atom_pair[i][1]), flush=True)
 
-      time, distance, distance_avg, sigma = \
-      bond_length_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, init_step, \
-                     end_step, time_step, traj_coord_file, a_vec, b_vec, c_vec, atom_1, atom_2, work_dir)
+    time, distance, distance_avg, sigma, distance_var, distance_hist = \
+    bond_length_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, init_step, \
+                     end_step, time_step, traj_coord_file, a_vec, b_vec, c_vec, atom_pair, work_dir)
 
+    for i in range(atom_pair_num):
       if ( atom_pair_num > 1 ):
         dist_file = ''.join((work_dir, '/distance', str(i), '.csv'))
+        hist_file = ''.join((work_dir, '/distance_hist', str(i), '.csv'))
       else:
         dist_file = ''.join((work_dir, '/distance.csv'))
+        hist_file = ''.join((work_dir, '/distance_hist.csv'))
       with open(dist_file, 'w') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['time(fs)', 'distance(Ang)'])
         for j in range(len(distance)):
-          writer.writerow([time[j], distance[j]])
+          writer.writerow([time[j], distance[j][i]])
+      write_hist(distance_hist[i], 'distance(Ang)', hist_file)
 
       str_print = 'The file containing bond length (unit: angstrom) vs time (unit: fs) is written in %s' %(dist_file)
       print (data_op.str_wrap(str_print, 80), flush=True)
-      print ("The averaged bond length is %f (A) and standard error is %f (A)" %(distance_avg, sigma), flush=True)
+      str_print = 'The histogram of bond length is written in %s' %(hist_file)
+      print (data_op.str_wrap(str_print, 80), flush=True)
+      print ("The averaged bond length is %f (A) and standard error is %f (A)" %(distance_avg[i], sigma[i]), flush=True)
+      print ("The variance of bond length is %f (A^2)" %(distance_var[i]), flush=True)
 
   elif ( 'bond_angle' in geometry_param ):
     bond_angle_param = geometry_param['bond_angle']
@@ -869,36 +823,41 @@ def geometry_run(geometry_param, work_dir):
 
     end_step = bond_angle_param['end_step']
 
-    print ('GEOMETRY'.center(80, '*'), flush=True)
-
+    atom_pair = []
     for i in range(atom_pair_num):
       if ( atom_pair_num > 1 ):
-        atom_pair = bond_angle_param[''.join(('atom_pair', str(i)))]
+        atom_pair.append(bond_angle_param[''.join(('atom_pair', str(i)))])
       else:
-        atom_pair = bond_angle_param['atom_pair']
-      atom_1 = atom_pair[0]
-      atom_2 = atom_pair[1]
-      atom_3 = atom_pair[2]
+        atom_pair.append(bond_angle_param['atom_pair'])
 
-      print ('Analyze bond angle between %d and %d and %d' %(atom_1, atom_2, atom_3), flush=True)
+    print ('GEOMETRY'.center(80, '*'), flush=True)
+    for i in range(atom_pair_num):
+      print ('Analyze bond angle between %d and %d and %d' %(atom_pair[i][0], atom_pair[i][1], atom_pair[i][2]), flush=True)
 
-      time, angle, angle_avg, sigma = \
-      bond_angle_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, \
-                      each, init_step, end_step, time_step, traj_coord_file, atom_1, atom_2, atom_3)
+    time, angle, angle_avg, sigma, angle_var, angle_hist = \
+    bond_angle_stat(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, \
+                    each, init_step, end_step, time_step, traj_coord_file, atom_pair)
 
+    for i in range(atom_pair_num):
       if ( atom_pair_num > 1 ):
         angle_file = ''.join((work_dir, '/angle', str(i), '.csv'))
+        hist_file = ''.join((work_dir, '/angle_hist', str(i), '.csv'))
       else:
         angle_file = ''.join((work_dir, '/angle.csv'))
+        hist_file = ''.join((work_dir, '/angle_hist.csv'))
       with open(angle_file, 'w') as csvfile:
         writer = csv.writer(csvfile)
         writer.writerow(['time(fs)', 'angle(rad)'])
         for j in range(len(angle)):
-          writer.writerow([time[j], angle[j]])
+          writer.writerow([time[j], angle[j][i]])
+      write_hist(angle_hist[i], 'angle(rad)', hist_file)
 
       str_print = 'The file containing bond angle (unit: rad) vs time (unit: fs) is written in %s' %(angle_file)
       print (data_op.str_wrap(str_print, 80), flush=True)
-      print ("The averaged angle is %f (rad) and standard error is %f (rad)" %(angle_avg, sigma), flush=True)
+      str_print = 'The histogram of bond angle is written in %s' %(hist_file)
+      print (data_op.str_wrap(str_print, 80), flush=True)
+      print ("The averaged angle is %f (rad) and standard error is %f (rad)" %(angle_avg[i], sigma[i]), flush=True)
+      print ("The variance of angle is %f (rad^2)" %(angle_var[i]), flush=True)
 
   elif (  'first_shell' in geometry_param ):
     first_shell_param = geometry_param['first_shell']
@@ -3,16 +3,153 @@
 import os
 import csv
 import math
-import linecache
 import numpy as np
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
-from CP2K_kit.tools import call
-from CP2K_kit.lib import geometry_mod
-from CP2K_kit.analyze import center
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.tools import neighbor
 from CP2K_kit.analyze import check_analyze
 
+def get_pair_distance(coord, atom_id_1, atom_id_2, cell, pair_block=1024**2):
+
+  '''
+  get_pair_distance: calculate minimum image distances between atom_1 and atom_2 in one frame.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id (starting from 1) of atom_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id (starting from 1) of atom_2.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    pair_block: int
+      pair_block is the upper bound of pairs calculated at once.
+  Returns:
+    dist_block: generator
+      dist_block gives atom id of atom_1 in the block and the distance array, dim
+      = (atoms in block)*len(atom_id_2). The distance of an atom to itself is -1.0.
+  '''
+
+  #Distances are calculated in fractional coordinates with minimum image, so
+  #the trajectory does not need to be centered or wrapped.
+  coord = np.array(coord, dtype='float64')
+  inv_cell = np.linalg.inv(cell)
+  coord_2 = coord[atom_id_2-1]
+  block_num = max(1, int(pair_block/max(1, len(atom_id_2))))
+  for i in range(0, len(atom_id_1), block_num):
+    atom_id_1_i = atom_id_1[i:i+block_num]
+    vec = coord[atom_id_1_i-1][:,np.newaxis,:]-coord_2[np.newaxis,:,:]
+    frac = np.dot(vec, inv_cell)
+    frac = frac-np.round(frac)
+    dist = np.sqrt(np.sum(np.dot(frac, cell)**2, axis=2))
+    dist[atom_id_1_i[:,np.newaxis] == atom_id_2[np.newaxis,:]] = -1.0
+    yield atom_id_1_i, dist
+
+def get_rdf_hist_pair(coord, atom_id_1, atom_id_2, type_1, type_2, pair_index, cell, r_increment, data_num, cell_list=False):
+
+  '''
+  get_rdf_hist_pair: count pairs of several atom type pairs of one frame in distance bins.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id (starting from 1) of atom_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id (starting from 1) of atom_2.
+    type_1: 1-d int array, dim = len(atom_id_1)
+      type_1 contains the type index of atom_1.
+    type_2: 1-d int array, dim = len(atom_id_2)
+      type_2 contains the type index of atom_2.
+    pair_index: 2-d int array
+      pair_index[i][j] is the index of the type pair of type i and type j, and
+      it is -1 if the type pair is not counted.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    r_increment: float
+      r_increment is the increment of r.
+    data_num: int
+      data_num is the number of bins.
+    cell_list: bool
+      cell_list is whether only pairs within data_num*r_increment are searched
+      by cell list. It is used if the cutoff is much smaller than the box.
+  Returns:
+    rdf_hist: 2-d int array, dim = (number of type pairs)*data_num
+      The bin k counts distances in (k*r_increment, (k+1)*r_increment], it is
+      same as geometry_mod.rdf. The bin 0 is not counted.
+  '''
+
+  #The distances of all type pairs are calculated together, and the type pair
+  #and the bin are combined into one index of a flat histogram.
+  pairs_num = np.max(pair_index)+1
+  rdf_hist = np.zeros(pairs_num*data_num, dtype='int64')
+  if cell_list:
+    pair_1, pair_2, dist = neighbor.get_neighbor_pair(coord, cell, data_num*r_increment, atom_id_1, atom_id_2)
+    dist_block = [(pair_index[type_1[pair_1], type_2[pair_2]], dist)]
+  else:
+    dist_block = ((pair_index[type_1[np.searchsorted(atom_id_1, atom_id_1_i)]][:,type_2], dist) \
+                  for atom_id_1_i, dist in get_pair_distance(coord, atom_id_1, atom_id_2, cell))
+
+  for pair_id, dist in dist_block:
+    bin_id = np.ceil(dist/r_increment).astype('int64')-1
+    valid = (bin_id >= 1) & (bin_id < data_num) & (pair_id >= 0)
+    rdf_hist = rdf_hist+np.bincount(pair_id[valid]*data_num+bin_id[valid], minlength=pairs_num*data_num)
+
+  return rdf_hist.reshape(pairs_num, data_num)
+
+def get_rdf_hist(coord, atom_id_1, atom_id_2, cell, r_increment, data_num, cell_list=False):
+
+  '''
+  get_rdf_hist: count pairs between atom_1 and atom_2 of one frame in distance bins.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id (starting from 1) of atom_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id (starting from 1) of atom_2.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    r_increment: float
+      r_increment is the increment of r.
+    data_num: int
+      data_num is the number of bins.
+    cell_list: bool
+      cell_list is whether pairs are searched by cell list.
+  Returns:
+    rdf_hist: 1-d int array, dim = data_num
+      rdf_hist is the number of pairs in each bin.
+  '''
+
+  type_1 = np.zeros(len(atom_id_1), dtype='int64')
+  type_2 = np.zeros(len(atom_id_2), dtype='int64')
+  pair_index = np.zeros((1, 1), dtype='int64')
+
+  return get_rdf_hist_pair(coord, atom_id_1, atom_id_2, type_1, type_2, pair_index, cell, \
+                           r_increment, data_num, cell_list)[0]
+
+def get_atom_id(atoms, atom_type):
+
+  '''
+  get_atom_id: get atom id of an atom type.
+
+  Args:
+    atoms: 1-d string list
+      atoms contains element names of atoms.
+    atom_type: string
+      atom_type is the name of atom type.
+  Returns:
+    atom_id: 1-d int array
+      atom_id contains atom id (starting from 1) of the atom type.
+  '''
+
+  return np.nonzero(np.array(atoms) == atom_type)[0]+1
+
 def distance(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, \
              init_step, end_step, atom_type_1, atom_type_2, a_vec, b_vec, c_vec, traj_coord_file, work_dir):
 
@@ -56,68 +193,126 @@ def distance(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id
     work_dir: string
       work_dir is the working directory of CP2K_kit.
   Returns:
-    distance: 3-d float list, dim = frames_num*(number of atom_1)*(number of atom_2)
-              if atom_type_1 = atom_type_2, dim = frames_num*(number of atom_1 - 1)*(number of atom_2 - 1)
+    distance: 3-d float array, dim = frames_num*(number of atom_1)*(number of atom_2)
+              if atom_type_1 = atom_type_2, dim = frames_num*(number of atom_1)*(number of atom_2 - 1)
     atom_id_1: 1-d int list
       atom_id_1 contains atom id of atom_type_1.
     atom_id_2: 1-d int list
       atom_id_2 contains atom id of atom_type_2
   '''
 
-  center_file = center.center(atoms_num, pre_base_block, end_base_block, pre_base, frames_num, a_vec, \
-                              b_vec, c_vec, 'center_box', 0, traj_coord_file, work_dir, 'center.xyz')
-
-  atom_id_1 = []
-  atom_id_2 = []
-  for i in range(atoms_num):
-    line_i = linecache.getline(center_file, pre_base_block+pre_base+i+1)
-    line_i_split = data_op.split_str(line_i, ' ')
-    if ( line_i_split[0] == atom_type_1 ):
-      atom_id_1.append(i+1)
-    if ( line_i_split[0] == atom_type_2 ):
-      atom_id_2.append(i+1)
-
-  frame_num_stat = int((end_step-init_step)/each+1)
+  #Minimum image distances do not need centering, so the raw trajectory is read
+  #directly and no centered copy is written.
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
+  atom_id_1 = get_atom_id(atoms, atom_type_1)
+  atom_id_2 = get_atom_id(atoms, atom_type_2)
+  cell = np.array([a_vec, b_vec, c_vec], dtype='float64')
 
+  #The distance of an atom to itself is removed from each row.
   distance = []
-  for i in range(frame_num_stat):
+  for element, coord, cell_i, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
     distance_i = []
-    for j in range(atoms_num):
-      line_j_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+j+pre_base_block+pre_base+1
-      line_j = linecache.getline(center_file, line_j_num)
-      line_j_split = data_op.split_str(line_j, ' ', '\n')
-      if ( line_j_split[0] == atom_type_1 ):
-        coord_1 = []
-        coord_2 = []
-        for k in range(atoms_num):
-          line_k_num = (int((init_step-start_frame_id)/each)+i)*(pre_base_block+atoms_num+end_base_block)+k+pre_base_block+pre_base+1
-          line_k = linecache.getline(center_file, line_k_num)
-          line_k_split = data_op.split_str(line_k, ' ', '\n')
-          if ( line_k_split[0] == atom_type_2 and j != k ):
-            coord_1.append([float(line_j_split[1]),float(line_j_split[2]),float(line_j_split[3])])
-            coord_2.append([float(line_k_split[1]),float(line_k_split[2]),float(line_k_split[3])])
-        dist = geometry_mod.geometry.calculate_distance(np.asfortranarray(coord_1, dtype='float32'), \
-                                                        np.asfortranarray(coord_2, dtype='float32'), \
-                                                        np.asfortranarray(a_vec, dtype='float32'), \
-                                                        np.asfortranarray(b_vec, dtype='float32'), \
-                                                        np.asfortranarray(c_vec, dtype='float32'))
-        distance_i.append(list(dist))
+    for atom_id_1_j, dist in get_pair_distance(coord, atom_id_1, atom_id_2, cell):
+      for k in range(len(atom_id_1_j)):
+        distance_i.append(dist[k][dist[k] >= 0.0])
     distance.append(distance_i)
 
-  linecache.clearcache()
+  return np.array(distance), list(atom_id_1), list(atom_id_2)
 
-  cmd = 'rm %s' %(center_file)
-  call.call_simple_shell(work_dir, cmd)
+def rdf_count(init_step, end_step, atom_type_pair, a_vec, b_vec, c_vec, r_increment, data_num, traj_coord_file, \
+              cell_list=False, block_num=1):
 
-  return distance, atom_id_1, atom_id_2
+  '''
+  rdf_count: count pairs of atom type pairs over frames in running histograms.
+
+  Args:
+    init_step: int
+      init_step is the initial step frame id.
+    end_step: int
+      end_step is the ending step frame id.
+    atom_type_pair: 2-d string list
+      atom_type_pair contains the atom type pairs.
+      Example: [['O', 'O'], ['O', 'H']]
+    a_vec: 1-d float list, dim = 3
+      a_vec is the cell vector a.
+    b_vec: 1-d float list, dim = 3
+      b_vec is the cell vector b.
+    c_vec: 1-d float list, dim = 3
+      c_vec is the cell vector c.
+    r_increment: float
+      r_increment is the increment of r.
+    data_num: int
+      data_num is the number of bins.
+    traj_coord_file: string
+      traj_coord_file is the name of coordination trajectory file.
+    cell_list: bool
+      cell_list is whether pairs are searched by cell list.
+    block_num: int
+      block_num is the number of blocks, the analyzed frames are split into
+      continuous blocks with nearly same number of frames.
+  Returns:
+    rdf_hist: 3-d int array, dim = len(atom_type_pair)*block_num*data_num
+      rdf_hist is the number of pairs in each bin summed over frames of each block.
+    frames_num: 1-d int array, dim = block_num
+      frames_num is the number of analyzed frames in each block.
+    atom_1_num: 1-d int list, dim = len(atom_type_pair)
+      atom_1_num is the number of atom_1 of each type pair.
+    atom_2_num: 1-d float list, dim = len(atom_type_pair)
+      atom_2_num is the number of atom_2 around one atom_1 of each type pair.
+  '''
 
-def rdf(distance, a_vec, b_vec, c_vec, r_increment, work_dir):
+  #Each frame is read once as an array, and the distances of all type pairs go
+  #to the histograms directly, so the memory does not grow with frames.
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = np.array(traj_reader.read_elements(traj_coord_file, frame_index, 0))
+  atom_type = data_op.list_replicate(list(atoms))
+  atom_type_id = np.array([atom_type.index(x) for x in atoms])
+  cell = np.array([a_vec, b_vec, c_vec], dtype='float64')
+
+  pair_index = np.full((len(atom_type), len(atom_type)), -1, dtype='int64')
+  atom_1_num = []
+  atom_2_num = []
+  for i in range(len(atom_type_pair)):
+    pair_index[atom_type.index(atom_type_pair[i][0]), atom_type.index(atom_type_pair[i][1])] = i
+    atom_id_1_i = get_atom_id(atoms, atom_type_pair[i][0])
+    atom_id_2_i = get_atom_id(atoms, atom_type_pair[i][1])
+    atom_1_num.append(len(atom_id_1_i))
+    atom_2_num.append(len(atom_id_2_i)-len(np.intersect1d(atom_id_1_i, atom_id_2_i))/max(1, len(atom_id_1_i)))
+
+  atom_id_1 = np.nonzero(np.any(pair_index >= 0, axis=1)[atom_type_id])[0]+1
+  atom_id_2 = np.nonzero(np.any(pair_index >= 0, axis=0)[atom_type_id])[0]+1
+  type_1 = atom_type_id[atom_id_1-1]
+  type_2 = atom_type_id[atom_id_2-1]
+
+  #Each block has its own histograms, they are filled in the same pass.
+  frames_num_tot = len(traj_reader.get_frame_list(frame_index, init_step, end_step))
+  rdf_hist = np.zeros((len(atom_type_pair), block_num, data_num), dtype='int64')
+  frames_num = np.zeros(block_num, dtype='int64')
+  frame_num = 0
+  for element, coord, cell_i, step, time in traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step):
+    block_id = min(int(frame_num*block_num/frames_num_tot), block_num-1)
+    rdf_hist[:,block_id,:] = rdf_hist[:,block_id,:]+get_rdf_hist_pair(coord, atom_id_1, atom_id_2, type_1, type_2, \
+                                                                      pair_index, cell, r_increment, data_num, cell_list)
+    frames_num[block_id] = frames_num[block_id]+1
+    frame_num = frame_num+1
+
+  return rdf_hist, frames_num, atom_1_num, atom_2_num
+
+def rdf(rdf_hist, frames_num, atom_1_num, atom_2_num, a_vec, b_vec, c_vec, r_increment, work_dir, rdf_file_name='rdf_integral.csv'):
 
   '''
   rdf: get rdf between atom type 1 and atom type 2
 
   Args:
-    distance: 3-d float list, dim = frames_num*(number of atom_1)*(number of atom_2)
+    rdf_hist: 2-d int array, dim = block_num*data_num
+      rdf_hist is the number of pairs in each bin summed over frames of each block.
+    frames_num: 1-d int array, dim = block_num
+      frames_num is the number of analyzed frames in each block.
+    atom_1_num: int
+      atom_1_num is the number of atom_1.
+    atom_2_num: int
+      atom_2_num is the number of atom_2 around one atom_1.
     a_vec: 1-d float list, dim = 3
       a_vec is the cell vector a.
       Example: [12.42, 0.0, 0.0]
@@ -131,26 +326,42 @@ def rdf(distance, a_vec, b_vec, c_vec, r_increment, work_dir):
       r_increment is the increment of r.
     work_dir: string
       work_dir is the working directory of CP2K_kit.
+    rdf_file_name: string
+      rdf_file_name is the name of rdf file.
   Returns:
     rdf_file: string
       rdf_file contains rdf information.
   '''
 
-  vec = a_vec+b_vec+c_vec
-  r_max = np.sqrt(np.dot(vec, vec))/2.0
-  #vol = 4.0/3.0*np.pi*r_max**3
+  #Same as geometry_mod.rdf, the counts are averaged over frames and atom_1,
+  #and the integral is the running sum of averaged counts.
   vol = np.dot(a_vec, np.cross(b_vec, c_vec))
-  data_num = int(r_max/r_increment)
-
-  rdf_value, integral_value = \
-  geometry_mod.geometry.rdf(distance, r_increment, vol, data_num)
-
-  rdf_file = ''.join((work_dir, '/rdf_integral.csv'))
+  density = atom_2_num/vol
+  block_num, data_num = np.shape(rdf_hist)
+  r_value = r_increment*np.arange(1, data_num)
+  count = np.sum(rdf_hist, axis=0)/(np.sum(frames_num)*atom_1_num)
+  rdf_value = count[1:]/(4.0*np.pi*density*r_value**2*r_increment)
+  integral_value = np.cumsum(count[1:])
+
+  #The standard error is from the spread of the results of blocks.
+  if ( block_num > 1 ):
+    count_block = rdf_hist/(np.array(frames_num)[:,np.newaxis]*atom_1_num)
+    rdf_block = count_block[:,1:]/(4.0*np.pi*density*r_value**2*r_increment)
+    integral_block = np.cumsum(count_block[:,1:], axis=1)
+    rdf_err = np.std(rdf_block, axis=0, ddof=1)/np.sqrt(block_num)
+    integral_err = np.std(integral_block, axis=0, ddof=1)/np.sqrt(block_num)
+
+  rdf_file = ''.join((work_dir, '/', rdf_file_name))
   with open(rdf_file ,'w') as csvfile:
     writer = csv.writer(csvfile)
-    writer.writerow(['distance(Ang)', 'rdf', 'int'])
-    for i in range(data_num-1):
-      writer.writerow([r_increment*(i+1), rdf_value[i], integral_value[i]])
+    if ( block_num > 1 ):
+      writer.writerow(['distance(Ang)', 'rdf', 'int', 'rdf_err', 'int_err'])
+      for i in range(data_num-1):
+        writer.writerow([r_value[i], rdf_value[i], integral_value[i], rdf_err[i], integral_err[i]])
+    else:
+      writer.writerow(['distance(Ang)', 'rdf', 'int'])
+      for i in range(data_num-1):
+        writer.writerow([r_value[i], rdf_value[i], integral_value[i]])
 
   return rdf_file
 
@@ -176,24 +387,23 @@ def rdf_run(rdf_param, work_dir):
 
   log_info.log_traj_info(atoms_num, frames_num, each, start_frame_id, end_frame_id, time_step)
 
-  atom_type_pair = rdf_param['atom_type_pair']
-  atom_1 = atom_type_pair[0]
-  atom_2 = atom_type_pair[1]
-
-  atoms = []
-  for i in range(atoms_num):
-    line_i = linecache.getline(traj_coord_file, pre_base_block+pre_base+i+1)
-    line_i_split = data_op.split_str(line_i, ' ', '\n')
-    atoms.append(line_i_split[0])
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
   atom_type = data_op.list_replicate(atoms)
 
-  if atom_1 not in atom_type:
-    log_info.log_error('Input error: %s atom type is not in the system' %(atom_1))
-    exit()
+  #all means every pair of atom types, and A-B is same as B-A.
+  if ( rdf_param['atom_type_pair'] == 'all' ):
+    atom_type_pair = []
+    for i in range(len(atom_type)):
+      for j in range(i, len(atom_type)):
+        atom_type_pair.append([atom_type[i], atom_type[j]])
+  else:
+    atom_type_pair = rdf_param['atom_type_pair']
 
-  if atom_2 not in atom_type:
-    log_info.log_error('Input error: %s atom type is not in the system' %(atom_2))
-    exit()
+  for atom_type_i in data_op.list_replicate(sum(atom_type_pair, [])):
+    if atom_type_i not in atom_type:
+      log_info.log_error('Input error: %s atom type is not in the system' %(atom_type_i))
+      exit()
 
   a_vec = rdf_param['box']['A']
   b_vec = rdf_param['box']['B']
@@ -204,10 +414,32 @@ def rdf_run(rdf_param, work_dir):
   r_increment = rdf_param['r_increment']
 
   print ('RDF'.center(80, '*'), flush=True)
-  print ('Analyze radial distribution function between %s and %s' %(atom_1, atom_2), flush=True)
-  dist, atom_id_1, atom_id_2 = distance(atoms_num, pre_base_block, end_base_block, pre_base, start_frame_id, frames_num, each, \
-                                        init_step, end_step, atom_1, atom_2, a_vec, b_vec, c_vec, traj_coord_file, work_dir)
-
-  rdf_file = rdf(dist, a_vec, b_vec, c_vec, r_increment, work_dir)
-  str_print = 'The rdf file is written in %s' %(rdf_file)
-  print (data_op.str_wrap(str_print, 80), flush=True)
+  for i in range(len(atom_type_pair)):
+    print ('Analyze radial distribution function between %s and %s' %(atom_type_pair[i][0], atom_type_pair[i][1]), flush=True)
+
+  #With r_cut, the bins end at r_cut and pairs are searched by cell list, the
+  #cost of each frame is linear with the number of atoms.
+  if ( 'r_cut' in rdf_param.keys() ):
+    r_max = rdf_param['r_cut']
+    cell_list = True
+  else:
+    vec = np.array(a_vec)+np.array(b_vec)+np.array(c_vec)
+    r_max = np.sqrt(np.dot(vec, vec))/2.0
+    cell_list = False
+  data_num = int(r_max/r_increment)
+  block_num = rdf_param['block_num']
+  rdf_hist, rdf_frames_num, atom_1_num, atom_2_num = \
+  rdf_count(init_step, end_step, atom_type_pair, a_vec, b_vec, c_vec, r_increment, data_num, traj_coord_file, \
+            cell_list, block_num)
+
+  #One rdf file for each type pair, and the name of the file of a single type
+  #pair is not changed.
+  for i in range(len(atom_type_pair)):
+    if ( len(atom_type_pair) == 1 ):
+      rdf_file_name = 'rdf_integral.csv'
+    else:
+      rdf_file_name = ''.join(('rdf_integral_', atom_type_pair[i][0], '_', atom_type_pair[i][1], '.csv'))
+    rdf_file = rdf(rdf_hist[i], rdf_frames_num, atom_1_num[i], atom_2_num[i], a_vec, b_vec, c_vec, \
+                   r_increment, work_dir, rdf_file_name)
+    str_print = 'The rdf file is written in %s' %(rdf_file)
+    print (data_op.str_wrap(str_print, 80), flush=True)
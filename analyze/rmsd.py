@@ -2,19 +2,94 @@
 
 import os
 import csv
-import linecache
 import numpy as np
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.tools import data_op
 from CP2K_kit.analyze import check_analyze
-from CP2K_kit.lib import rmsd_mod
-from CP2K_kit.lib import statistic_mod
 
-def rmsd(atoms_num, pre_base_block, end_base_block, pre_base, each, atom_id, start_frame_id, ref_frame, comp_frame_list, traj_coord_file):
+def get_rmsd_quart(coord_comp, coord_ref):
 
   #Reference literature: J. Comput. Chem. 2004, 25, 1849-1857.
 
+  '''
+  get_rmsd_quart: get rmsd and rotation matrix of frames by quaternion method.
+
+  Args:
+    coord_comp: 3-d float array, dim = (number of frames)*(number of atoms)*3
+      coord_comp is the coordinates of comparing frames.
+    coord_ref: 2-d float array, dim = (number of atoms)*3
+      coord_ref is the coordinates of reference frame.
+  Returns:
+    rmsd_value: 1-d float array, dim = number of frames
+      rmsd_value is the minimal rmsd of each comparing frame.
+    rot_matrix: 3-d float array, dim = (number of frames)*3*3
+      rot_matrix is the rotation matrix of each comparing frame, coord_comp (centered)
+      rotated to coord_ref (centered) is np.dot(coord_comp, rot_matrix.T).
+  '''
+
+  coord_comp = np.array(coord_comp, dtype='float64')
+  coord_ref = np.array(coord_ref, dtype='float64')
+  atoms_num = coord_ref.shape[0]
+
+  coord_comp_d = coord_comp-np.mean(coord_comp, axis=1, keepdims=True)
+  coord_ref_d = coord_ref-np.mean(coord_ref, axis=0)
+
+  #cov_matrix[i,j] = sum_k coord_comp_d[k,i]*coord_ref_d[k,j]
+  cov = np.einsum('fki,kj->fij', coord_comp_d, coord_ref_d)
+  s_xx = cov[:,0,0]
+  s_xy = cov[:,0,1]
+  s_xz = cov[:,0,2]
+  s_yx = cov[:,1,0]
+  s_yy = cov[:,1,1]
+  s_yz = cov[:,1,2]
+  s_zx = cov[:,2,0]
+  s_zy = cov[:,2,1]
+  s_zz = cov[:,2,2]
+
+  quart_matrix = np.zeros((len(cov), 4, 4))
+  quart_matrix[:,0,0] = s_xx+s_yy+s_zz
+  quart_matrix[:,0,1] = s_yz-s_zy
+  quart_matrix[:,0,2] = s_zx-s_xz
+  quart_matrix[:,0,3] = s_xy-s_yx
+  quart_matrix[:,1,1] = s_xx-s_yy-s_zz
+  quart_matrix[:,1,2] = s_xy+s_yx
+  quart_matrix[:,1,3] = s_xz+s_zx
+  quart_matrix[:,2,2] = -s_xx+s_yy-s_zz
+  quart_matrix[:,2,3] = s_yz+s_zy
+  quart_matrix[:,3,3] = -s_xx-s_yy+s_zz
+  quart_matrix[:,1,0] = quart_matrix[:,0,1]
+  quart_matrix[:,2,0] = quart_matrix[:,0,2]
+  quart_matrix[:,3,0] = quart_matrix[:,0,3]
+  quart_matrix[:,2,1] = quart_matrix[:,1,2]
+  quart_matrix[:,3,1] = quart_matrix[:,1,3]
+  quart_matrix[:,3,2] = quart_matrix[:,2,3]
+
+  #Eigenvalues of eigh are in ascending order, the eigenvectors are columns.
+  eigen_value, eigen_vector = np.linalg.eigh(quart_matrix)
+  eigen_max = eigen_value[:,3]
+  q = eigen_vector[:,:,3]
+
+  sum_value = np.sum(coord_comp_d**2, axis=(1,2))+np.sum(coord_ref_d**2)
+  rmsd_value = np.sqrt(np.maximum(sum_value-2.0*eigen_max, 0.0)/atoms_num)
+
+  rot_matrix = np.zeros((len(cov), 3, 3))
+  rot_matrix[:,0,0] = q[:,0]**2+q[:,1]**2-q[:,2]**2-q[:,3]**2
+  rot_matrix[:,0,1] = 2.0*(q[:,1]*q[:,2]-q[:,0]*q[:,3])
+  rot_matrix[:,0,2] = 2.0*(q[:,1]*q[:,3]+q[:,0]*q[:,2])
+  rot_matrix[:,1,0] = 2.0*(q[:,1]*q[:,2]+q[:,0]*q[:,3])
+  rot_matrix[:,1,1] = q[:,0]**2-q[:,1]**2+q[:,2]**2-q[:,3]**2
+  rot_matrix[:,1,2] = 2.0*(q[:,2]*q[:,3]-q[:,0]*q[:,1])
+  rot_matrix[:,2,0] = 2.0*(q[:,1]*q[:,3]-q[:,0]*q[:,2])
+  rot_matrix[:,2,1] = 2.0*(q[:,2]*q[:,3]+q[:,0]*q[:,1])
+  rot_matrix[:,2,2] = q[:,0]**2-q[:,1]**2-q[:,2]**2+q[:,3]**2
+
+  return rmsd_value, rot_matrix
+
+def rmsd(atoms_num, pre_base_block, end_base_block, pre_base, each, atom_id, start_frame_id, ref_frame, comp_frame_list, traj_coord_file, rotate=False):
+
   '''
   rmsd: get rmsd of choosed atoms in md trajectory.
 
@@ -40,63 +115,30 @@ def rmsd(atoms_num, pre_base_block, end_base_block, pre_base, each, atom_id, sta
       comp_frame_list is comparring frames.
     traj_coord_file: string
       traj_coord_file is the name of coordination trajectory file.
+    rotate: bool
+      rotate is whether to return rotation matrices.
   Returns:
     rmsd_value_list: 1-d float list
       rmsd_value_list is the list of rmsd value.
+    rot_matrix: 3-d float array, dim = (number of comparing frames)*3*3
+      rot_matrix is the rotation matrices, only returned if rotate is True.
   '''
 
-  coord_ref = np.asfortranarray(np.zeros((len(atom_id),3)),dtype='float32')
-  coord_comp = np.asfortranarray(np.zeros((len(atom_id),3)),dtype='float32')
-
-  for i in range(len(atom_id)):
-    line_i_num = int((ref_frame-start_frame_id)/each)*(pre_base_block+atoms_num+end_base_block)+atom_id[i]+pre_base_block+pre_base
-    line_i = linecache.getline(traj_coord_file, line_i_num)
-    line_i_split = data_op.split_str(line_i, ' ', '\n')
-    coord_ref[i,0] = float(line_i_split[1])
-    coord_ref[i,1] = float(line_i_split[2])
-    coord_ref[i,2] = float(line_i_split[3])
-
-  coord_ref_center = np.asfortranarray(np.zeros(3),dtype='float32')
-  for i in range(3):
-    value_avg, sigma = statistic_mod.statistic.numerical_average(coord_ref[:,i],len(atom_id))
-    coord_ref_center[i] = value_avg
-
-  rmsd_value_list = []
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  ref_frame_num = int((ref_frame-start_frame_id)/each)
+  coord_ref = traj_reader.read_frames(traj_coord_file, frame_index, [ref_frame_num], atom_id)[0]
 
+  comp_frame_num = []
   for m in range(len(comp_frame_list)):
-    for i in range(len(atom_id)):
-      line_mi_num = int((comp_frame_list[m]-start_frame_id)/each)*(pre_base_block+atoms_num+end_base_block)+atom_id[i]+pre_base_block+pre_base
-      line_mi = linecache.getline(traj_coord_file, line_mi_num)
-      line_mi_split = data_op.split_str(line_mi, ' ', '\n')
-      coord_comp[i,0] = float(line_mi_split[1])
-      coord_comp[i,1] = float(line_mi_split[2])
-      coord_comp[i,2] = float(line_mi_split[3])
-
-    coord_comp_center = np.asfortranarray(np.zeros(3),dtype='float32')
-
-    for i in range(3):
-      value_avg, sigma = statistic_mod.statistic.numerical_average(coord_comp[:,i],len(atom_id))
-      coord_comp_center[i] = value_avg
-
-    cov_matrix = rmsd_mod.rmsd.get_cov_matrix(coord_comp,coord_ref,coord_comp_center,coord_ref_center)
-    quart_matrix = rmsd_mod.rmsd.quarternion_rotate(cov_matrix)
-
-    eigen = np.linalg.eig(quart_matrix)
-    eigen_value = eigen[0]
-    eigen_vector = eigen[1]
-    eigen_max = max(eigen_value)
-    max_index = list(eigen_value).index(max(eigen_value))
-    quart_vec = eigen_vector[max_index]
+    comp_frame_num.append(int((comp_frame_list[m]-start_frame_id)/each))
+  coord_comp = traj_reader.read_frames_parallel(traj_coord_file, frame_index, comp_frame_num, atom_id)
 
-    #If you need rotate matrix, you could print it or return it
+  rmsd_value, rot_matrix = get_rmsd_quart(coord_comp, coord_ref)
 
-    rotate_max = rmsd_mod.rmsd.quart_to_rot(quart_vec)
-    rmsd_value = rmsd_mod.rmsd.get_rmsd(coord_comp,coord_ref,coord_comp_center,coord_ref_center,eigen_max)
-    rmsd_value_list.append(rmsd_value)
-
-  linecache.clearcache()
-
-  return rmsd_value_list
+  if rotate:
+    return rmsd_value.tolist(), rot_matrix
+  else:
+    return rmsd_value.tolist()
 
 def rmsd_run(rmsd_param, work_dir):
 
@@ -123,11 +165,13 @@ def rmsd_run(rmsd_param, work_dir):
   atom_id = rmsd_param['atom_id']
   ref_frame = rmsd_param['ref_frame']
   compare_frame = rmsd_param['compare_frame']
+  rotate_matrix = rmsd_param['rotate_matrix']
 
   print ('RMSD'.center(80, '*'), flush=True)
   print ('Calculate root mean square deviation based on reference frame %d' %(ref_frame), flush=True)
 
-  rmsd_value = rmsd(atoms_num, pre_base_block, end_base_block, pre_base, each, atom_id, start_frame_id, ref_frame, compare_frame, traj_coord_file)
+  rmsd_value, rot_matrix = rmsd(atoms_num, pre_base_block, end_base_block, pre_base, each, atom_id, start_frame_id, \
+                                ref_frame, compare_frame, traj_coord_file, True)
 
   rmsd_file = ''.join((work_dir, '/rmsd.csv'))
   with open(rmsd_file, 'w') as csvfile:
@@ -139,3 +183,14 @@ def rmsd_run(rmsd_param, work_dir):
   str_print = 'The rmsd vs time is written in %s' %(rmsd_file)
   print (data_op.str_wrap(str_print, 80), flush=True)
 
+  if rotate_matrix:
+    rot_file = ''.join((work_dir, '/rotate_matrix.csv'))
+    with open(rot_file, 'w') as csvfile:
+      writer = csv.writer(csvfile)
+      writer.writerow(['time', 'r11', 'r12', 'r13', 'r21', 'r22', 'r23', 'r31', 'r32', 'r33'])
+      for i in range(len(rot_matrix)):
+        writer.writerow([i*time_step*each]+rot_matrix[i].flatten().tolist())
+
+    str_print = 'The rotation matrix vs time is written in %s' %(rot_file)
+    print (data_op.str_wrap(str_print, 80), flush=True)
+
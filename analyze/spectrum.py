@@ -15,8 +15,108 @@ from CP2K_kit.lib import statistic_mod
 
 #The unit of velocity is CP2K trajectory is Bohr/au_t
 
+def get_window(window, data_num):
+
+  '''
+  get_window: get the window function for the one-sided time correlation function.
+
+  Args:
+    window: string
+      window is the type of window, none, hann, blackman or gauss.
+    data_num: int
+      data_num is the number of time points.
+  Returns:
+    window_value: 1-d float array, dim = data_num
+      window_value is 1 at time 0 and decays to the end of time correlation function.
+  '''
+
+  x = np.arange(data_num)/data_num
+  if ( window == 'hann' ):
+    window_value = 0.5+0.5*np.cos(np.pi*x)
+  elif ( window == 'blackman' ):
+    window_value = 0.42+0.5*np.cos(np.pi*x)+0.08*np.cos(2.0*np.pi*x)
+  elif ( window == 'gauss' ):
+    #Standard deviation is 1/3 of the correlation time.
+    window_value = np.exp(-0.5*(3.0*x)**2)
+  else:
+    window_value = np.ones(data_num)
+
+  return window_value
+
+def fourier_transform_fft(data_tcf, time_interval, wave_num, time_step):
+
+  '''
+  fourier_transform_fft: cosine transform of time correlation function by fast fourier transform.
+
+  Args:
+    data_tcf: 1-d float array
+      data_tcf is the time correlation function.
+    time_interval: float
+      time_interval is the time between two points of data_tcf. Its unit is fs.
+    wave_num: 1-d float array
+      wave_num is the wave numbers (cm^-1) to get intensity.
+    time_step: float
+      time_step is the factor of the integration, the same as statistic_mod.statistic.fourier_transform.
+  Returns:
+    intensity: 1-d float array
+      intensity is the intensity for each wave number.
+  '''
+
+  wave_num_to_hz = 29979245800.0
+  data_num = len(data_tcf)
+  #Period of the transform in wave number, intensity is even and periodic in wave number.
+  wave_period = 1.0/(time_interval*1.0E-15*wave_num_to_hz)
+
+  #Zero padding makes the spacing of fft wave numbers not larger than 1/4 increment of
+  #wave_num and 1/4 resolution of data_tcf, so the linear interpolation is accurate.
+  if ( len(wave_num) > 1 ):
+    wave_increment = np.min(np.abs(np.diff(wave_num)))
+  else:
+    wave_increment = wave_period
+  fft_num = 1
+  while ( fft_num < 8*data_num or 4.0*wave_period/fft_num > wave_increment ):
+    fft_num = fft_num*2
+
+  intensity_fft = np.real(np.fft.rfft(np.array(data_tcf, dtype='float64'), n=fft_num))*time_step
+  wave_fft = np.arange(len(intensity_fft))*wave_period/fft_num
+
+  wave_fold = np.mod(np.array(wave_num, dtype='float64'), wave_period)
+  wave_fold = np.where(wave_fold > wave_period/2.0, wave_period-wave_fold, wave_fold)
+
+  return np.interp(wave_fold, wave_fft, intensity_fft)
+
+def get_intensity(data_tcf, time, wave_num, time_step, window='none', engine='fft'):
+
+  '''
+  get_intensity: get intensity of spectrum from time correlation function with choosed engine.
+
+  Args:
+    data_tcf: 1-d float array
+      data_tcf is the time correlation function.
+    time: 1-d float array
+      time is the time of each point of data_tcf. Its unit is fs.
+    wave_num: 1-d float array
+      wave_num is the wave numbers (cm^-1) to get intensity.
+    time_step: float
+      time_step is the factor of the integration.
+    window: string
+      window is the type of window, none, hann, blackman or gauss.
+    engine: string
+      engine is the method of fourier transform, fft or direct.
+  Returns:
+    intensity: 1-d float array
+      intensity is the intensity for each wave number.
+  '''
+
+  data_tcf_window = np.asfortranarray(data_tcf*get_window(window, len(data_tcf)), dtype='float32')
+
+  if ( engine == 'fft' and len(time) > 1 ):
+    return fourier_transform_fft(data_tcf_window, time[1]-time[0], wave_num, time_step)
+  else:
+    return statistic_mod.statistic.fourier_transform(data_tcf_window, time, wave_num, time_step)
+
 def power_spectrum(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, end_step, \
-                   max_frame_corr, lower_wave, upper_wave, increment_wave, atom_id, traj_vel_file, normalize, work_dir):
+                   max_frame_corr, lower_wave, upper_wave, increment_wave, atom_id, traj_vel_file, normalize, work_dir, engine='fft', window='none'):
 
   '''
   power_spectrum: calculate power_spectrum of the system
@@ -57,6 +157,10 @@ def power_spectrum(atoms_num, pre_base_block, end_base_block, pre_base, each, st
       0 means not using normalize, 1 means using normalize.
     work_dir: string
       work_dir is the working directory of CP2K_kit.
+    engine: string
+      engine is the method to correlate frames and fourier transform, fft or direct.
+    window: string
+      window is the window function applied to time correlation function, none, hann, blackman or gauss.
   Returns :
     wave_num: 1-d float list
       wave_num is the list of wave number.
@@ -68,7 +172,7 @@ def power_spectrum(atoms_num, pre_base_block, end_base_block, pre_base, each, st
 
   print ('Calculate velocity-velocity auto correlation function at first', flush=True)
   vel_tcf, tcf_file = time_correlation.time_corr_func(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, \
-                      time_step, init_step, end_step, max_frame_corr, atom_id, traj_vel_file, work_dir, 'tcf.csv', normalize)
+                      time_step, init_step, end_step, max_frame_corr, atom_id, traj_vel_file, work_dir, 'tcf.csv', normalize, engine)
   str_print = 'The velocity-velocity auto correlation function is written in %s' %(tcf_file)
   print (data_op.str_wrap(str_print, 80), flush=True)
 
@@ -85,15 +189,14 @@ def power_spectrum(atoms_num, pre_base_block, end_base_block, pre_base, each, st
   if (normalize == 0):
     time_step = time_step*1E-15
 
-  intensity = \
-  statistic_mod.statistic.fourier_transform(vel_tcf, time, wave_num, time_step)
+  intensity = get_intensity(vel_tcf, time, wave_num, time_step, window, engine)
 
   intensity_fit = numeric.savitzky_golay(intensity,201,3)
 
   return wave_num, intensity, intensity_fit
 
 def power_spectrum_mode(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, end_step, max_frame_corr, \
-                        cluster_group_id, lower_wave, upper_wave, increment_wave, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, normalize, work_dir):
+                        cluster_group_id, lower_wave, upper_wave, increment_wave, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, normalize, work_dir, engine='fft', window='none'):
 
   #Reference literature: Chem. Phys. 1986, 106, 205-212.
 
@@ -147,6 +250,10 @@ def power_spectrum_mode(atoms_num, pre_base_block, end_base_block, pre_base, eac
       0 means not using normalize, 1 means using normalize.
     work_dir: string
       work_dir is the working directory of CP2K_kit.
+    engine: string
+      engine is the method to correlate frames and fourier transform, fft or direct.
+    window: string
+      window is the window function applied to time correlation function, none, hann, blackman or gauss.
   Returns :
     wave_num: 1-d float list
       wave_num is the list of wave number.
@@ -167,7 +274,7 @@ def power_spectrum_mode(atoms_num, pre_base_block, end_base_block, pre_base, eac
   print ('Calculate velocity-velocity auto correlation function at first', flush=True)
   Q1_vel_tcf, Q2_vel_tcf, Q3_vel_tcf, tcf_q1_file, tcf_q2_file, tcf_q3_file = \
   time_correlation.time_corr_mode_func(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, end_step, \
-                                       max_frame_corr, cluster_group_id, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, work_dir, normalize)
+                                       max_frame_corr, cluster_group_id, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, work_dir, normalize, engine)
 
   str_print = 'The velocity-velocity auto correlation function of mode 1 (symmetric strech) is written in %s' %(tcf_q1_file)
   print (data_op.str_wrap(str_print, 80), flush=True)
@@ -189,16 +296,13 @@ def power_spectrum_mode(atoms_num, pre_base_block, end_base_block, pre_base, eac
   if (normalize == 0):
     time_step = time_step*1E-15
 
-  Q1_intensity = \
-  statistic_mod.statistic.fourier_transform(Q1_vel_tcf, time, wave_num, time_step)
+  Q1_intensity = get_intensity(Q1_vel_tcf, time, wave_num, time_step, window, engine)
   Q1_intensity_fit = numeric.savitzky_golay(Q1_intensity,201,3)
 
-  Q2_intensity = \
-  statistic_mod.statistic.fourier_transform(Q2_vel_tcf, time, wave_num, time_step)
+  Q2_intensity = get_intensity(Q2_vel_tcf, time, wave_num, time_step, window, engine)
   Q2_intensity_fit = numeric.savitzky_golay(Q2_intensity,201,3)
 
-  Q3_intensity = \
-  statistic_mod.statistic.fourier_transform(Q3_vel_tcf, time, wave_num, time_step)
+  Q3_intensity = get_intensity(Q3_vel_tcf, time, wave_num, time_step, window, engine)
   Q3_intensity_fit = numeric.savitzky_golay(Q3_intensity,201,3)
 
   return wave_num, Q1_intensity, Q1_intensity_fit, Q2_intensity, Q2_intensity_fit, Q3_intensity, Q3_intensity_fit
@@ -232,6 +336,8 @@ def power_spectrum_run(spectrum_param, work_dir):
   end_wave = float(spectrum_param['end_wave'])
   increment_wave = float(spectrum_param['increment_wave'])
   normalize = int(spectrum_param['normalize'])
+  engine = spectrum_param['engine']
+  window = spectrum_param['window']
 
   if ( spec_type == 'general' ):
     atom_id = spectrum_param['atom_id']
@@ -244,7 +350,7 @@ def power_spectrum_run(spectrum_param, work_dir):
     print ('POWER_SPECTRUM'.center(80, '*'), flush=True)
     print ('Analyze the power spectrum for the choosed system', flush=True)
     wave_num, intensity, intensity_fit = power_spectrum(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, \
-                                         end_step, max_frame_corr, start_wave, end_wave, increment_wave, atom_id, traj_vel_file, normalize, work_dir)
+                                         end_step, max_frame_corr, start_wave, end_wave, increment_wave, atom_id, traj_vel_file, normalize, work_dir, engine, window)
 
     freq_int_file = ''.join((work_dir, '/freq_intensity.csv'))
     with open(freq_int_file, 'w') as csvfile:
@@ -321,7 +427,7 @@ def power_spectrum_run(spectrum_param, work_dir):
       print ('Analyze power spectrum of water with three modes of water', flush=True)
       wave_num, q1_int, q1_int_fit, q2_int, q2_int_fit, q3_int, q3_int_fit = \
       power_spectrum_mode(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, end_step, max_frame_corr, \
-                          cluster_id, start_wave, end_wave, increment_wave, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, normalize, work_dir)
+                          cluster_id, start_wave, end_wave, increment_wave, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, normalize, work_dir, engine, window)
 
     elif ( spec_type == 'hydration_mode' ):
       if (start_frame_id_v > start_frame_id_p):
@@ -363,7 +469,7 @@ def power_spectrum_run(spectrum_param, work_dir):
 
       wave_num, q1_int, q1_int_fit, q2_int, q2_int_fit, q3_int, q3_int_fit = \
       power_spectrum_mode(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, end_step, max_frame_corr, \
-                          cluster_id, start_wave, end_wave, increment_wave, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, normalize, work_dir)
+                          cluster_id, start_wave, end_wave, increment_wave, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, normalize, work_dir, engine, window)
 
     freq_int_q1_file = ''.join((work_dir, '/freq_intensity_q1.csv'))
     with open(freq_int_q1_file, 'w') as csvfile:
@@ -2,12 +2,14 @@
 
 import os
 import csv
-import linecache
 import numpy as np
 from CP2K_kit.tools import atom
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.tools import correlator
 from CP2K_kit.lib import statistic_mod
 from CP2K_kit.lib import dynamic_mod
 from CP2K_kit.analyze import check_analyze
@@ -16,8 +18,123 @@ from CP2K_kit.analyze import check_analyze
 #We transfer velocity in cm/s
 #The unit of intensity is cm^2/s
 
+def get_tcf_fft(data, max_frame_corr, normalize, atoms_block=0):
+
+  '''
+  get_tcf_fft: get time correlation function by fast fourier transform.
+
+  Args:
+    data: 3-d float array, dim = (number of frames)*(number of atoms)*3
+      data is the physical quantity of choosed atoms, such as velocity.
+    max_frame_corr: int
+      max_frame_corr is the max number of correlation frames.
+    normalize: int
+      normalize is whether to use normalize. There are two choices: 0 and 1.
+      0 means not using normalize, 1 means using normalize.
+    atoms_block: int
+      atoms_block is the number of atoms transformed together, 0 means auto.
+  Returns:
+    data_tcf: 1-d float array, dim = max_frame_corr
+      data_tcf is the time correlation function, the same as dynamic_mod.dynamic.time_correlation.
+  '''
+
+  #By Wiener-Khinchin theorem, the autocorrelation is the inverse fft of the power
+  #of the fft. The data are zero padded to 2*frames, so it is not circular.
+  frames_num = data.shape[0]
+  atoms_num = data.shape[1]
+  fft_num = 2*frames_num
+  if ( atoms_block == 0 ):
+    atoms_block = max(int(2**24/(fft_num*3)), 1)
+
+  lag = np.arange(max_frame_corr)
+  sum_nume = np.zeros(max_frame_corr)
+  sum_deno = np.zeros(max_frame_corr)
+  for i in range(0, atoms_num, atoms_block):
+    x = np.array(data[:,i:i+atoms_block,:], dtype='float64')
+    if ( normalize == 0 ):
+      #The velocity in CP2K is bohr/fs, we transfer it to cm/s.
+      x = x*100.0*0.5291772489940979*(1.0E-10)/(2.4188843265857*1.0E-17)
+    x_fft = np.fft.rfft(x, n=fft_num, axis=0)
+    sum_nume = sum_nume+np.sum(np.fft.irfft(x_fft*np.conj(x_fft), n=fft_num, axis=0)[0:max_frame_corr], axis=(1,2))
+    if ( normalize == 1 ):
+      #The denominator only sums the time origins used at each lag.
+      x_sq_cum = np.concatenate(([0.0], np.cumsum(np.sum(x**2, axis=(1,2)))))
+      sum_deno = sum_deno+x_sq_cum[frames_num-lag]
+
+  if ( normalize == 1 ):
+    return sum_nume/sum_deno
+  else:
+    return sum_nume/((frames_num-lag)*atoms_num)
+
+def get_tcf_multi_tau(traj_vel_file, init_step, end_step, max_frame_corr, atom_id, normalize):
+
+  '''
+  get_tcf_multi_tau: get time correlation function by multiple-tau correlator, frames
+                     are read from trajectory file chunk by chunk.
+
+  Args:
+    traj_vel_file: string
+      traj_vel_file is the name of velocity trajectory file.
+    init_step: int
+      init_step is the initial step frame id.
+    end_step: int
+      end_step is the ending step frame id.
+    max_frame_corr: int
+      max_frame_corr is the max number of correlation frames.
+    atom_id: 1-d int list
+      atom_id is the id of atoms.
+    normalize: int
+      normalize is whether to use normalize. There are two choices: 0 and 1.
+      0 means not using normalize, 1 means using normalize.
+  Returns:
+    lag: 1-d int array
+      lag contains the lags (in frames) of the time correlation function.
+    data_tcf: 1-d float array
+      data_tcf is the time correlation function at lag.
+  '''
+
+  corr = correlator.init_multi_tau((len(atom_id), 3), max_frame_corr, 'corr')
+  for element, data, cell, step, time in traj_reader.iter_chunks(traj_vel_file, 'vel', init_step, end_step, 1, atom_id):
+    for i in range(len(step)):
+      if ( normalize == 0 ):
+        #The velocity in CP2K is bohr/fs, we transfer it to cm/s.
+        correlator.add_multi_tau(corr, data[i]*(100.0*0.5291772489940979*(1.0E-10)/(2.4188843265857*1.0E-17)))
+      else:
+        correlator.add_multi_tau(corr, data[i])
+
+  lag, data_tcf = correlator.get_multi_tau(corr, max_frame_corr)
+  if ( normalize == 1 ):
+    return lag, data_tcf/data_tcf[0]
+  else:
+    return lag, data_tcf/len(atom_id)
+
+def get_tcf(data, max_frame_corr, normalize, engine='fft'):
+
+  '''
+  get_tcf: get time correlation function with choosed engine.
+
+  Args:
+    data: 3-d float array, dim = (number of frames)*(number of atoms)*3
+      data is the physical quantity of choosed atoms, such as velocity.
+    max_frame_corr: int
+      max_frame_corr is the max number of correlation frames.
+    normalize: int
+      normalize is whether to use normalize. There are two choices: 0 and 1.
+      0 means not using normalize, 1 means using normalize.
+    engine: string
+      engine is the method to correlate frames, fft or direct.
+  Returns:
+    data_tcf: 1-d float array, dim = max_frame_corr
+      data_tcf is the time correlation function.
+  '''
+
+  if ( engine == 'fft' ):
+    return get_tcf_fft(data, max_frame_corr, normalize)
+  else:
+    return dynamic_mod.dynamic.time_correlation(data, max_frame_corr, normalize)
+
 def time_corr_func(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, \
-                   init_step, end_step, max_frame_corr, atom_id, traj_vel_file, work_dir, file_name, normalize):
+                   init_step, end_step, max_frame_corr, atom_id, traj_vel_file, work_dir, file_name, normalize, engine='fft'):
 
   '''
   time_corr_func: calculate time correlation function.
@@ -54,6 +171,8 @@ def time_corr_func(atoms_num, pre_base_block, end_base_block, pre_base, each, st
     normalize: int
       normalize is whether to use normalize. There are two choices: 0 and 1.
       0 means not using normalize, 1 means using normalize.
+    engine: string
+      engine is the method to correlate frames, fft, direct or multi_tau.
   Returns:
     data_tcf: 1-d float array
       data_tcf is the time correlation function for a physical quantity.
@@ -61,20 +180,15 @@ def time_corr_func(atoms_num, pre_base_block, end_base_block, pre_base, each, st
       tcf_file is the generated time correlation file
   '''
 
-  frame_num_stat = int((end_step-init_step)/each+1)
-  data = np.asfortranarray(np.zeros((frame_num_stat,len(atom_id),3)),dtype='float32')
-  for i in range(frame_num_stat):
-    for j in range(len(atom_id)):
-      line_ij_num = (pre_base_block+atoms_num+end_base_block)*(int((init_step-start_frame_id)/each)+i)+pre_base_block+pre_base+atom_id[j]
-      line_ij = linecache.getline(traj_vel_file, line_ij_num)
-      line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-      data[i,j,0] = float(line_ij_split[1])
-      data[i,j,1] = float(line_ij_split[2])
-      data[i,j,2] = float(line_ij_split[3])
-
-  linecache.clearcache()
+  if ( engine == 'multi_tau' ):
+    lag, data_tcf = get_tcf_multi_tau(traj_vel_file, init_step, end_step, max_frame_corr, atom_id, normalize)
+  else:
+    frame_index = traj_index.get_frame_index(traj_vel_file, 'vel')
+    frame_list = traj_reader.get_frame_list(frame_index, init_step, end_step)
+    data = traj_reader.read_frames_parallel(traj_vel_file, frame_index, frame_list, atom_id)
 
-  data_tcf = dynamic_mod.dynamic.time_correlation(data, max_frame_corr, normalize)
+    data_tcf = get_tcf(data, max_frame_corr, normalize, engine)
+    lag = np.arange(len(data_tcf))
 
   tcf_file = ''.join((work_dir, '/', file_name))
   with open(tcf_file, 'w') as csvfile:
@@ -84,12 +198,12 @@ def time_corr_func(atoms_num, pre_base_block, end_base_block, pre_base, each, st
     elif ( normalize == 1 ):
       writer.writerow(['time(fs)', 'acf'])
     for i in range(len(data_tcf)):
-      writer.writerow([i*time_step*each,data_tcf[i]])
+      writer.writerow([lag[i]*time_step*each,data_tcf[i]])
 
   return data_tcf, tcf_file
 
 def time_corr_mode_func(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, init_step, end_step, \
-                        max_frame_corr, cluster_group_id, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, work_dir, normalize=1):
+                        max_frame_corr, cluster_group_id, traj_coord_file, traj_vel_file, a_vec, b_vec, c_vec, work_dir, normalize=1, engine='fft'):
 
   '''
   time_corr_mode_func: calculate mode time correlation function.
@@ -135,6 +249,8 @@ def time_corr_mode_func(atoms_num, pre_base_block, end_base_block, pre_base, eac
     normalize: int
       normalize is whether to use normalize. There are two choices: 0 and 1.
       0 means not using normalize, 1 means using normalize.
+    engine: string
+      engine is the method to correlate frames, fft or direct.
   Returns :
     data_q1_tcf: 1-d float array
       data_q1_tcf is the time correlation function for a physical quantity of q1 mode.
@@ -156,29 +272,17 @@ def time_corr_mode_func(atoms_num, pre_base_block, end_base_block, pre_base, eac
   Q2_data = np.asfortranarray(np.zeros((frame_num_stat,len(cluster_group_id[0]),3)),dtype='float32')
   Q3_data = np.asfortranarray(np.zeros((frame_num_stat,len(cluster_group_id[0]),3)),dtype='float32')
 
-  for i in range(frame_num_stat):
+  coord_frames = traj_reader.iter_frames(traj_coord_file, 'coord_xyz', init_step, end_step)
+  vel_frames = traj_reader.iter_frames(traj_vel_file, 'vel', init_step, end_step)
+  i = 0
+  for (element, coord, cell, step, time), (element_vel, vel, cell_vel, step_vel, time_vel) in zip(coord_frames, vel_frames):
     for j in range(len(cluster_group_id[i])):
-      pos_data = np.asfortranarray(np.zeros((len(cluster_group_id[i][j]),3)),dtype='float32')
-      vel_data = np.asfortranarray(np.zeros((len(cluster_group_id[i][j]),3)),dtype='float32')
-      element = []
-      for k in range(len(cluster_group_id[i][j])):
-        #Dump coordinate
-        line_k_num = (pre_base_block+atoms_num+end_base_block)*(int((init_step-start_frame_id)/each)+i)+cluster_group_id[i][j][k]+pre_base_block+pre_base
-        line_k = linecache.getline(traj_coord_file, line_k_num)
-        line_k_split = data_op.split_str(line_k, ' ', '\n')
-        element.append(line_k_split[0])
-        pos_data[k,0] = float(line_k_split[1])
-        pos_data[k,1] = float(line_k_split[2])
-        pos_data[k,2] = float(line_k_split[3])
-
-        #Dump velocity
-        line_k = linecache.getline(traj_vel_file, line_k_num)
-        line_k_split = data_op.split_str(line_k, ' ', '\n')
-        vel_data[k,0] = float(line_k_split[1])
-        vel_data[k,1] = float(line_k_split[2])
-        vel_data[k,2] = float(line_k_split[3])
-
-      atom_number, atom_mass = atom.get_atom_mass(element)
+      group_index = np.array(cluster_group_id[i][j], dtype='int64')-1
+      pos_data = np.asfortranarray(coord[group_index,:], dtype='float32')
+      vel_data = np.asfortranarray(vel[group_index,:], dtype='float32')
+      group_element = [element[k] for k in group_index]
+
+      atom_number, atom_mass = atom.get_atom_mass(group_element)
       mass_array = np.asfortranarray(atom_mass, dtype='float32')
       q1, q2, q3 = statistic_mod.statistic.data_mode(pos_data,vel_data,a_vec,b_vec,c_vec,mass_array)
       Q1_data[i,j,0] = q1[0]
@@ -190,12 +294,11 @@ def time_corr_mode_func(atoms_num, pre_base_block, end_base_block, pre_base, eac
       Q3_data[i,j,0] = q3[0]
       Q3_data[i,j,1] = q3[1]
       Q3_data[i,j,2] = q3[2]
+    i = i+1
 
-  linecache.clearcache()
-
-  data_q1_tcf = dynamic_mod.dynamic.time_correlation(Q1_data, max_frame_corr, normalize)
-  data_q2_tcf = dynamic_mod.dynamic.time_correlation(Q2_data, max_frame_corr, normalize)
-  data_q3_tcf = dynamic_mod.dynamic.time_correlation(Q3_data, max_frame_corr, normalize)
+  data_q1_tcf = get_tcf(Q1_data, max_frame_corr, normalize, engine)
+  data_q2_tcf = get_tcf(Q2_data, max_frame_corr, normalize, engine)
+  data_q3_tcf = get_tcf(Q3_data, max_frame_corr, normalize, engine)
 
   tcf_q1_file = ''.join((work_dir, '/tcf_q1.csv'))
   with open(tcf_q1_file, 'w') as csvfile:
@@ -250,11 +353,12 @@ def time_corr_run(time_corr_param, work_dir):
   init_step = time_corr_param['init_step']
   end_step = time_corr_param['end_step']
   normalize = time_corr_param['normalize']
+  engine = time_corr_param['engine']
 
   print ('TIME_CORRELATION'.center(80, '*'))
   print ('Calculate time correlation function', flush=True)
   data_tcf, tcf_file = time_corr_func(atoms_num, pre_base_block, end_base_block, pre_base, each, start_frame_id, time_step, \
-                       init_step, end_step, max_frame_corr, atom_id, traj_file, work_dir, 'tcf.csv', normalize)
+                       init_step, end_step, max_frame_corr, atom_id, traj_file, work_dir, 'tcf.csv', normalize, engine)
 
   str_print = 'The time correlation function is written in %s' %(tcf_file)
   print (data_op.str_wrap(str_print, 80), flush=True)
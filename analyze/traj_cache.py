@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+
+from CP2K_kit.tools import log_info
+from CP2K_kit.tools import data_op
+from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.tools import traj_cache
+from CP2K_kit.analyze import check_analyze
+
+def dump_traj_cache(file_name, file_type, chunk_size, box={}):
+
+  '''
+  dump_traj_cache: convert a trajectory file to binary cache.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    file_type: string
+      file_type is the type of trajectory file. Supported types are coord_xyz,
+      vel, frc, cell and ener.
+    chunk_size: int
+      chunk_size is the number of frames in a chunk.
+    box: dictionary
+      box contains cell vectors A, B and C.
+      Example: {'A': [12.42, 0.0, 0.0], 'B': [0.0, 12.42, 0.0], 'C': [0.0, 0.0, 12.42]}
+  Returns:
+    cache_dir: string
+      cache_dir is the name of cache directory.
+  '''
+
+  #Duplicate frames are removed and incomplete frame is checked in get_traj_info.
+  if ( file_type == 'cell' ):
+    traj_summary = traj_info.get_traj_summary(file_name, file_type)
+    if ( traj_summary['incomplete'] or traj_summary['duplicate_num'] != 0 ):
+      log_info.log_error('File error: there are incomplete or duplicate frames in %s, please check' %(file_name))
+      exit()
+  else:
+    traj_info.get_traj_info(file_name, file_type)
+  frame_index = traj_index.get_frame_index(file_name, file_type)
+
+  cache_header = {}
+  cache_header['file_type'] = file_type
+  cache_header['step'] = [int(x) for x in frame_index['step']]
+  cache_header['time'] = [float(x) for x in frame_index['time']]
+  if ( box != {} ):
+    cache_header['cell'] = [box['A'], box['B'], box['C']]
+
+  if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
+    cache_header['element'] = traj_reader.read_elements(file_name, frame_index, 0)
+    read_chunk = lambda frame_list: traj_reader.read_frames(file_name, frame_index, frame_list)
+  else:
+    read_chunk = lambda frame_list: traj_reader.read_lines_data(file_name, frame_index, frame_list)
+
+  cache_dir = traj_cache.dump_cache(file_name, cache_header, read_chunk, chunk_size)
+
+  return cache_dir
+
+def traj_cache_run(traj_cache_param, work_dir):
+
+  '''
+  traj_cache_run: the kernel function to run traj_cache function.
+
+  Args:
+    traj_cache_param: dictionary
+      traj_cache_param contains keywords used in traj_cache functions.
+    work_dir: string
+      work_dir is the working directory of CP2K_kit.
+  Returns:
+    none
+  '''
+
+  traj_cache_param = check_analyze.check_traj_cache_inp(traj_cache_param)
+
+  chunk_size = traj_cache_param['chunk_size']
+  box = traj_cache_param['box']
+
+  print ('TRAJ_CACHE'.center(80, '*'), flush=True)
+
+  file_key = ['traj_coord_file', 'traj_vel_file', 'traj_frc_file', 'traj_cell_file', 'traj_ener_file']
+  file_type = ['coord_xyz', 'vel', 'frc', 'cell', 'ener']
+  for i in range(len(file_key)):
+    if ( file_key[i] in traj_cache_param.keys() ):
+      file_name = traj_cache_param[file_key[i]]
+      print (data_op.str_wrap('Convert %s to binary cache' %(file_name), 80), flush=True)
+      cache_dir = dump_traj_cache(file_name, file_type[i], chunk_size, box)
+      print (data_op.str_wrap('The binary cache is written in %s' %(cache_dir), 80), flush=True)
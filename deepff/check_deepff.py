@@ -297,7 +297,7 @@ def check_deepmd_model(deepmd_dic):
           else:
             log_info.log_error('Input error: no force trajectory file, please check deepff/deepmd_model/training/system/traj_frc_file')
             exit()
-          line_num = file_tools.grep_line_num("'PDB file'", traj_coord_file, os.getcwd())
+          line_num = file_tools.grep_line_num('PDB file', traj_coord_file, os.getcwd())
           if ( line_num == 0 ):
             coord_file_type = 'coord_xyz'
           else:
@@ -9,8 +9,9 @@ from CP2K_kit.tools import call
 from CP2K_kit.tools import numeric
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.tools import log_info
-from CP2K_kit.tools import get_cell
 from CP2K_kit.tools import file_tools
 
 hartree_to_ev = 2.72113838565563E+01
@@ -209,7 +210,7 @@ def load_data_from_dir(traj_coord_file_name, traj_frc_file_name, traj_cell_file_
     none
   '''
 
-  line_num = file_tools.grep_line_num("'PDB file'", traj_coord_file_name, work_dir)
+  line_num = file_tools.grep_line_num('PDB file', traj_coord_file_name, work_dir)
   if ( line_num == 0 ):
     coord_file_type = 'coord_xyz'
   else:
@@ -259,41 +260,29 @@ def load_data_from_dir(traj_coord_file_name, traj_frc_file_name, traj_cell_file_
       box_file.write(frame_str)
     linecache.clearcache()
   else:
+    #The pdb frames are found by frame index, and the cell is read from CRYST1 record.
+    frame_index = traj_index.get_frame_index(traj_coord_file_name, coord_file_type)
+    frame_list = [int((choosed_index[i]-start_id)/each) for i in range(len(choosed_index))]
+    pdb_cell = traj_reader.read_cells(traj_coord_file_name, frame_index, frame_list)
     for i in range(len(choosed_index)):
-      line_i_num = int((choosed_index[i]-start_id)/each)*(pre_base_block+atoms_num+end_base_block)+pre_base+2
-      line_i = linecache.getline(traj_coord_file_name, line_i_num)
-      line_i_split = data_op.split_str(line_i, ' ', '\n')
-      a = float(line_i_split[1])
-      b = float(line_i_split[2])
-      c = float(line_i_split[3])
-      alpha = float(line_i_split[4])/180.0*np.pi
-      beta = float(line_i_split[4])/180.0*np.pi
-      gamma = float(line_i_split[4])/180.0*np.pi
-      cell_a, cell_b, cell_c = get_cell.get_triclinic_cell(a, b, c, alpha, beta, gamma)
-      vol.append(np.linalg.det(np.array([cell_a, cell_b, cell_c])))
-      frame_str = ''
-      for cell in [cell_a, cell_b, cell_c]:
-        for i in cell:
-          frame_str = ' '.join((frame_str, str(i)))
-      frame_str = frame_str.strip(' ')
+      vol.append(np.linalg.det(pdb_cell[i]))
+      frame_str = ' '.join([str(x) for x in pdb_cell[i].flatten()])
       frame_str = ''.join((frame_str, '\n'))
       box_file.write(frame_str)
-    linecache.clearcache()
 
   box_file.close()
 
   #Dump element information
   type_file = open(''.join((save_dir, '/type.raw')), 'w')
-  atoms = []
-  for i in range(atoms_num):
-    line_i = linecache.getline(traj_coord_file_name, pre_base_block+pre_base+i+1)
-    line_i_split = data_op.split_str(line_i, ' ', '\n')
-    if ( coord_file_type == 'coord_xyz' ):
+  if ( coord_file_type == 'coord_xyz' ):
+    atoms = []
+    for i in range(atoms_num):
+      line_i = linecache.getline(traj_coord_file_name, pre_base_block+pre_base+i+1)
+      line_i_split = data_op.split_str(line_i, ' ', '\n')
       atoms.append(line_i_split[0])
-    elif ( coord_file_type == 'coord_pdb' ):
-      atoms.append(line_i_split[len(line_i_split)-1])
-
-  linecache.clearcache()
+    linecache.clearcache()
+  elif ( coord_file_type == 'coord_pdb' ):
+    atoms = traj_reader.read_elements(traj_coord_file_name, frame_index, 0)
 
   for i in range(atoms_num):
     atom_type_index = tot_atoms_type_dic[atoms[i]]
@@ -301,25 +290,27 @@ def load_data_from_dir(traj_coord_file_name, traj_frc_file_name, traj_cell_file_
 
   #Dump coordination information
   coord_file = open(''.join((save_dir, '/coord.raw')), 'w')
-  for i in range(len(choosed_index)):
-    frame_str = ''
-    for j in range(atoms_num):
-      line_ij_num = int((choosed_index[i]-start_id)/each)*(pre_base_block+atoms_num+end_base_block)+pre_base+pre_base_block+j+1
-      line_ij = linecache.getline(traj_coord_file_name, line_ij_num)
-      line_ij_split = data_op.split_str(line_ij, ' ', '\n')
-      if ( coord_file_type == 'coord_xyz' ):
+  if ( coord_file_type == 'coord_pdb' ):
+    #The coordinates in pdb have 3 decimals, so float32 values are rounded back.
+    coord = np.round(np.array(traj_reader.read_frames(traj_coord_file_name, frame_index, frame_list), dtype='float64'), 3)
+    for i in range(len(choosed_index)):
+      frame_str = ' '.join([str(x) for x in coord[i].flatten()])
+      frame_str = ''.join((frame_str, '\n'))
+      coord_file.write(frame_str)
+  else:
+    for i in range(len(choosed_index)):
+      frame_str = ''
+      for j in range(atoms_num):
+        line_ij_num = int((choosed_index[i]-start_id)/each)*(pre_base_block+atoms_num+end_base_block)+pre_base+pre_base_block+j+1
+        line_ij = linecache.getline(traj_coord_file_name, line_ij_num)
+        line_ij_split = data_op.split_str(line_ij, ' ', '\n')
         if (j==0):
           frame_str = ' '.join((line_ij_split[1], line_ij_split[2], line_ij_split[3]))
         else:
           frame_str = ' '.join((frame_str, line_ij_split[1], line_ij_split[2], line_ij_split[3]))
-      if ( coord_file_type == 'coord_pdb' ):
-        if (j==0):
-          frame_str = ' '.join((line_ij_split[3], line_ij_split[4], line_ij_split[5]))
-        else:
-          frame_str = ' '.join((frame_str, line_ij_split[3], line_ij_split[4], line_ij_split[5]))
 
-    frame_str = ''.join((frame_str, '\n'))
-    coord_file.write(frame_str)
+      frame_str = ''.join((frame_str, '\n'))
+      coord_file.write(frame_str)
 
   linecache.clearcache()
   coord_file.close()
@@ -9,6 +9,8 @@ from CP2K_kit.tools import data_op
 from CP2K_kit.tools import file_tools
 from CP2K_kit.tools import read_input
 from CP2K_kit.tools import traj_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
 from CP2K_kit.deepff import load_data
 from CP2K_kit.deepff import gen_lammps_task
 
@@ -180,7 +182,7 @@ def get_atoms_type(deepmd_dic):
       traj_type = train_dic[key]['traj_type']
       if ( traj_type == 'md' ):
         traj_coord_file = train_dic[key]['traj_coord_file']
-        line_num = file_tools.grep_line_num("'PDB file'", traj_coord_file, os.getcwd())
+        line_num = file_tools.grep_line_num('PDB file', traj_coord_file, os.getcwd())
         if ( line_num == 0 ):
           coord_file_type = 'coord_xyz'
         else:
@@ -188,15 +190,16 @@ def get_atoms_type(deepmd_dic):
 
         atoms_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_id, end_id, time_step = \
         traj_info.get_traj_info(traj_coord_file, coord_file_type)
-        atoms = []
-        for i in range(atoms_num):
-          line_i = linecache.getline(traj_coord_file, pre_base+pre_base_block+i+1)
-          line_i_split = data_op.split_str(line_i, ' ', '\n')
-          if ( coord_file_type == 'coord_xyz' ):
+        if ( coord_file_type == 'coord_xyz' ):
+          atoms = []
+          for i in range(atoms_num):
+            line_i = linecache.getline(traj_coord_file, pre_base+pre_base_block+i+1)
+            line_i_split = data_op.split_str(line_i, ' ', '\n')
             atoms.append(line_i_split[0])
-          elif ( coord_file_type == 'coord_pdb' ):
-            atoms.append(line_i_split[len(line_i_split)-1])
-        linecache.clearcache()
+          linecache.clearcache()
+        elif ( coord_file_type == 'coord_pdb' ):
+          frame_index = traj_index.get_frame_index(traj_coord_file, coord_file_type)
+          atoms = traj_reader.read_elements(traj_coord_file, frame_index, 0)
       elif ( traj_type == 'mtd' ):
         data_dir = train_dic[key]['data_dir']
         task_dir_prefix = train_dic[key]['task_dir_prefix']
@@ -6,6 +6,9 @@ from CP2K_kit.tools import numeric
 from CP2K_kit.tools import read_input
 from CP2K_kit.tools import traj_info
 from CP2K_kit.tools import traj_tools
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+from CP2K_kit.tools import traj_cache
 from CP2K_kit.tools import read_lmp
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import file_tools
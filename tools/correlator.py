@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+#Multiple-tau correlator (J. Chem. Phys. 2010, 133, 154103). Frames are added one by
+#one, level 0 keeps the last block_len frames, and every block_avg frames of a level
+#give one frame of the next level. So level k correlates lags j*block_avg^k with
+#block_len frames, and the memory only depends on the number of levels, which grows
+#with log(max_lag), but not on the length of the trajectory.
+#The frame of next level is the last frame (sample) or the average (average) of the
+#block_avg frames. Averaging smooths out the fast motions (such as vibrations) at
+#long lags, so sample is used by default, which is exact with fewer time origins.
+
+def init_multi_tau(shape, max_lag, corr_type='corr', block_len=16, block_avg=2, block_type='sample'):
+
+  '''
+  init_multi_tau: initialize a multiple-tau correlator.
+
+  Args:
+    shape: tuple
+      shape is the shape of data in one frame, such as (number of atoms, 3).
+    max_lag: int
+      max_lag is the max lag (in frames) to correlate.
+    corr_type: string
+      corr_type is the type of correlation, corr means sum of x(t)*x(t+lag),
+      and msd means sum of (x(t+lag)-x(t))^2.
+    block_len: int
+      block_len is the number of frames kept in each level.
+    block_avg: int
+      block_avg is the number of frames to one frame of the next level, block_len
+      should be divisible by block_avg.
+    block_type: string
+      block_type is how to get the frame of next level, sample or average.
+  Returns:
+    corr: dictionary
+      corr contains the state of correlator.
+  '''
+
+  levels_num = 1
+  while ( (block_len-1)*block_avg**(levels_num-1) < max_lag ):
+    levels_num = levels_num+1
+
+  corr = {}
+  corr['corr_type'] = corr_type
+  corr['block_len'] = block_len
+  corr['block_avg'] = block_avg
+  corr['block_type'] = block_type
+  corr['levels_num'] = levels_num
+  corr['buffer'] = np.zeros((levels_num, block_len)+tuple(shape))
+  corr['buffer_num'] = np.zeros(levels_num, dtype='int64')
+  corr['acc'] = np.zeros((levels_num,)+tuple(shape))
+  corr['acc_num'] = np.zeros(levels_num, dtype='int64')
+  corr['corr_sum'] = np.zeros((levels_num, block_len))
+  corr['corr_num'] = np.zeros((levels_num, block_len), dtype='int64')
+
+  return corr
+
+def add_multi_tau(corr, data):
+
+  '''
+  add_multi_tau: add one frame into the multiple-tau correlator.
+
+  Args:
+    corr: dictionary
+      corr contains the state of correlator, it is updated in place.
+    data: float array
+      data is the data of one frame, its shape is the shape in init_multi_tau.
+  Returns:
+    none
+  '''
+
+  block_len = corr['block_len']
+  block_avg = corr['block_avg']
+  buffer = corr['buffer']
+  x = np.array(data, dtype='float64')
+
+  for level in range(corr['levels_num']):
+    buffer_num = corr['buffer_num'][level]
+    buffer[level, buffer_num%block_len] = x
+    buffer_num = buffer_num+1
+    corr['buffer_num'][level] = buffer_num
+
+    #The short lags of higher level are already got in lower level.
+    if ( level == 0 ):
+      lag_start = 0
+    else:
+      lag_start = int(block_len/block_avg)
+    lag = np.arange(lag_start, min(buffer_num, block_len))
+    if ( len(lag) != 0 ):
+      x_lag = buffer[level, (buffer_num-1-lag)%block_len]
+      if ( corr['corr_type'] == 'msd' ):
+        value = np.sum(((x_lag-x)**2).reshape(len(lag), -1), axis=1)
+      else:
+        value = np.sum((x_lag*x).reshape(len(lag), -1), axis=1)
+      corr['corr_sum'][level, lag] = corr['corr_sum'][level, lag]+value
+      corr['corr_num'][level, lag] = corr['corr_num'][level, lag]+1
+
+    if ( corr['block_type'] == 'average' ):
+      corr['acc'][level] = corr['acc'][level]+x
+    corr['acc_num'][level] = corr['acc_num'][level]+1
+    if ( corr['acc_num'][level] < block_avg ):
+      break
+    if ( corr['block_type'] == 'average' ):
+      x = corr['acc'][level]/block_avg
+      corr['acc'][level] = 0.0
+    corr['acc_num'][level] = 0
+
+def get_multi_tau(corr, max_lag):
+
+  '''
+  get_multi_tau: get correlation from the multiple-tau correlator.
+
+  Args:
+    corr: dictionary
+      corr contains the state of correlator.
+    max_lag: int
+      max_lag is the max lag (in frames) to output.
+  Returns:
+    lag: 1-d int array
+      lag contains the lags (in frames) in ascending order.
+    value: 1-d float array
+      value is the correlation averaged over time origins for each lag.
+  '''
+
+  block_len = corr['block_len']
+  block_avg = corr['block_avg']
+
+  lag = []
+  value = []
+  for level in range(corr['levels_num']):
+    if ( level == 0 ):
+      lag_start = 0
+    else:
+      lag_start = int(block_len/block_avg)
+    for i in range(lag_start, block_len):
+      lag_i = i*block_avg**level
+      if ( lag_i < max_lag and corr['corr_num'][level, i] != 0 ):
+        lag.append(lag_i)
+        value.append(corr['corr_sum'][level, i]/corr['corr_num'][level, i])
+
+  return np.array(lag, dtype='int64'), np.array(value)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python
+
+import numpy as np
+
+#Neighbor search with cell list (linked cell). Atoms are wrapped into the box and
+#put into bins along a, b and c in fractional coordinates. The bin is not shorter
+#than the cutoff along the normal of each cell plane, so the neighbors of an atom
+#are only in the adjacent bins, and the cost is linear with the number of atoms.
+#The bins work for triclinic cells, and every periodic image of an atom in the
+#adjacent bins is a different neighbor, so small cells are also correct.
+
+def get_cell_height(cell):
+
+  '''
+  get_cell_height: get the distances between opposite faces of the cell.
+
+  Args:
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+  Returns:
+    height: 1-d float array, dim = 3
+      height is the distance between the two bc, ca and ab faces.
+  '''
+
+  cell = np.array(cell, dtype='float64')
+  vol = abs(np.linalg.det(cell))
+  area = np.array([np.linalg.norm(np.cross(cell[1], cell[2])), \
+                   np.linalg.norm(np.cross(cell[2], cell[0])), \
+                   np.linalg.norm(np.cross(cell[0], cell[1]))])
+
+  return vol/area
+
+def get_bin(frac, bins_num):
+
+  '''
+  get_bin: get the bin of atoms from fractional coordinates.
+
+  Args:
+    frac: 2-d float array, dim = (number of atoms)*3
+      frac is the wrapped fractional coordinates, in [0, 1).
+    bins_num: 1-d int array, dim = 3
+      bins_num is the number of bins along a, b and c.
+  Returns:
+    bin_id: 2-d int array, dim = (number of atoms)*3
+      bin_id is the bin of atoms along a, b and c.
+  '''
+
+  bin_id = np.floor(frac*bins_num).astype('int64')
+
+  return np.minimum(np.maximum(bin_id, 0), bins_num-1)
+
+def get_neighbor_pair(coord, cell, r_cut, atom_id_1, atom_id_2):
+
+  '''
+  get_neighbor_pair: get pairs between atom_1 and atom_2 within cutoff by cell list.
+
+  Args:
+    coord: 2-d float array, dim = (number of atoms)*3
+      coord is the coordinates of one frame.
+    cell: 2-d float array, dim = 3*3
+      cell contains cell vectors a, b and c as rows.
+    r_cut: float
+      r_cut is the cutoff, pairs with distance not larger than r_cut are returned.
+    atom_id_1: 1-d int array
+      atom_id_1 contains atom id (starting from 1) of atom_1.
+    atom_id_2: 1-d int array
+      atom_id_2 contains atom id (starting from 1) of atom_2.
+  Returns:
+    pair_1: 1-d int array
+      pair_1 contains the index of atom_1 in atom_id_1 for each pair.
+    pair_2: 1-d int array
+      pair_2 contains the index of atom_2 in atom_id_2 for each pair.
+    dist: 1-d float array
+      dist contains the distance of each pair. An atom is not paired with itself.
+  '''
+
+  cell = np.array(cell, dtype='float64')
+  atom_id_1 = np.array(atom_id_1, dtype='int64')
+  atom_id_2 = np.array(atom_id_2, dtype='int64')
+
+  #Wrap atoms into the box, so the image shift of a bin is also the image shift
+  #of the atoms in it.
+  frac = np.dot(np.array(coord, dtype='float64'), np.linalg.inv(cell))
+  frac = frac-np.floor(frac)
+  frac_1 = frac[atom_id_1-1]
+  frac_2 = frac[atom_id_2-1]
+  coord_1 = np.dot(frac_1, cell)
+  coord_2 = np.dot(frac_2, cell)
+
+  height = get_cell_height(cell)
+  bins_num = np.maximum(np.floor(height/r_cut).astype('int64'), 1)
+  stencil = np.ceil(r_cut*bins_num/height-1.0e-12).astype('int64')
+
+  bin_1 = get_bin(frac_1, bins_num)
+  bin_2 = get_bin(frac_2, bins_num)
+  bin_2_lin = (bin_2[:,0]*bins_num[1]+bin_2[:,1])*bins_num[2]+bin_2[:,2]
+
+  #Atom_2 sorted by bin, the atoms in one bin are order[start[k]:start[k]+count[k]].
+  order = np.argsort(bin_2_lin, kind='stable')
+  count = np.bincount(bin_2_lin, minlength=np.prod(bins_num))
+  start = np.cumsum(count)-count
+
+  pair_1 = []
+  pair_2 = []
+  dist = []
+  for i in range(-stencil[0], stencil[0]+1):
+    for j in range(-stencil[1], stencil[1]+1):
+      for k in range(-stencil[2], stencil[2]+1):
+        bin_nb = bin_1+np.array([i, j, k])
+        shift = np.floor_divide(bin_nb, bins_num)
+        bin_nb = bin_nb-shift*bins_num
+        bin_nb_lin = (bin_nb[:,0]*bins_num[1]+bin_nb[:,1])*bins_num[2]+bin_nb[:,2]
+        count_nb = count[bin_nb_lin]
+        pair_num = np.sum(count_nb)
+        if ( pair_num == 0 ):
+          continue
+        pair_1_ijk = np.repeat(np.arange(len(atom_id_1)), count_nb)
+        pair_start = np.repeat(np.cumsum(count_nb)-count_nb, count_nb)
+        pair_2_ijk = order[np.repeat(start[bin_nb_lin], count_nb)+np.arange(pair_num)-pair_start]
+        vec = coord_2[pair_2_ijk]+np.dot(shift, cell)[pair_1_ijk]-coord_1[pair_1_ijk]
+        dist_ijk = np.sqrt(np.sum(vec**2, axis=1))
+        self_pair = (atom_id_1[pair_1_ijk] == atom_id_2[pair_2_ijk]) & np.all(shift[pair_1_ijk] == 0, axis=1)
+        within = (dist_ijk <= r_cut) & (~self_pair)
+        pair_1.append(pair_1_ijk[within])
+        pair_2.append(pair_2_ijk[within])
+        dist.append(dist_ijk[within])
+
+  if ( len(dist) == 0 ):
+    return np.zeros(0, dtype='int64'), np.zeros(0, dtype='int64'), np.zeros(0)
+
+  return np.concatenate(pair_1), np.concatenate(pair_2), np.concatenate(dist)
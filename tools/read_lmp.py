@@ -6,6 +6,47 @@ from CP2K_kit.tools import call
 from CP2K_kit.tools import get_cell
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import file_tools
+from CP2K_kit.tools import log_info
+from CP2K_kit.tools import traj_index
+
+def read_traj_lines(lmp_traj_file):
+
+  '''
+  read_traj_lines: read all lines of lammps trajectory file, the compressed file
+                   (.gz, .bz2 and .xz) is decompressed as a stream.
+
+  Args:
+    lmp_traj_file: string
+      lmp_traj_file is the lammps trajectory file.
+  Returns:
+    traj_lines: 1-d string list
+      traj_lines contains all lines of the file.
+  '''
+
+  with traj_index.open_traj(lmp_traj_file, 'rt') as traj_file:
+    traj_lines = traj_file.readlines()
+
+  return traj_lines
+
+def get_line(lines, line_num):
+
+  '''
+  get_line: get a line by line number (starting from 1), it is same as linecache.getline.
+
+  Args:
+    lines: 1-d string list
+      lines contains all lines of a file.
+    line_num: int
+      line_num is the line number.
+  Returns:
+    line: string
+      If line_num is out of range, empty string is returned.
+  '''
+
+  if ( line_num >= 1 and line_num <= len(lines) ):
+    return lines[line_num-1]
+  else:
+    return ''
 
 def lmp_traj_info(lmp_traj_file, lmp_log_file, return_frames_num_fic=False):
 
@@ -30,7 +71,8 @@ def lmp_traj_info(lmp_traj_file, lmp_log_file, return_frames_num_fic=False):
       each is the increment.
   '''
 
-  line = linecache.getline(lmp_traj_file, 4)
+  traj_lines = read_traj_lines(lmp_traj_file)
+  line = get_line(traj_lines, 4)
   if ( data_op.eval_str(line.strip('\n')) == 1 ):
     atoms_num = int(line.strip('\n'))
   else:
@@ -88,7 +130,7 @@ def lmp_traj_info(lmp_traj_file, lmp_log_file, return_frames_num_fic=False):
 
   linecache.clearcache()
 
-  whole_line_num = len(open(os.path.abspath(lmp_traj_file), 'r').readlines())
+  whole_line_num = len(traj_lines)
   frames_num_2 = int(whole_line_num/(atoms_num+9))
 
   frames_num = min(frames_num, frames_num_2)
@@ -138,7 +180,8 @@ def read_lmp_log_traj(lmp_traj_file, lmp_log_file, atom_label={}, frames=[], ene
       cell is the cell vector along with the trajectory.
   '''
 
-  line = linecache.getline(lmp_traj_file, 9)
+  traj_lines = read_traj_lines(lmp_traj_file)
+  line = get_line(traj_lines, 9)
   line_split = data_op.split_str(line, ' ', '\n')
   line_split[len(line_split)-1] = line_split[len(line_split)-1]
 
@@ -220,11 +263,11 @@ def read_lmp_log_traj(lmp_traj_file, lmp_log_file, atom_label={}, frames=[], ene
 
   for i in frames:
     if cell_return:
-      line_1 = linecache.getline(lmp_traj_file, (atoms_num+9)*int((i-start_id)/each)+6)
+      line_1 = get_line(traj_lines, (atoms_num+9)*int((i-start_id)/each)+6)
       line_1_split = data_op.split_str(line_1, ' ', '\n')
-      line_2 = linecache.getline(lmp_traj_file, (atoms_num+9)*int((i-start_id)/each)+7)
+      line_2 = get_line(traj_lines, (atoms_num+9)*int((i-start_id)/each)+7)
       line_2_split = data_op.split_str(line_2, ' ', '\n')
-      line_3 = linecache.getline(lmp_traj_file, (atoms_num+9)*int((i-start_id)/each)+8)
+      line_3 = get_line(traj_lines, (atoms_num+9)*int((i-start_id)/each)+8)
       line_3_split = data_op.split_str(line_3, ' ', '\n')
       Lx = float(line_1_split[1]) - float(line_1_split[0])
       Ly = float(line_2_split[1]) - float(line_2_split[0])
@@ -242,7 +285,7 @@ def read_lmp_log_traj(lmp_traj_file, lmp_log_file, atom_label={}, frames=[], ene
     vel_i = []
 
     for j in range(atoms_num):
-      line_ij = linecache.getline(lmp_traj_file, (atoms_num+9)*int((i-start_id)/each)+j+1+9)
+      line_ij = get_line(traj_lines, (atoms_num+9)*int((i-start_id)/each)+j+1+9)
       line_ij_split = data_op.split_str(line_ij, ' ', '\n')
       line_ij_split[len(line_ij_split)-1] = line_ij_split[len(line_ij_split)-1]
       atom_id = int(line_ij_split[atom_id_id])
@@ -0,0 +1,172 @@
+#!/usr/bin/env python
+
+import os
+import json
+import shutil
+import numpy as np
+
+#The trajectory cache is a hidden directory next to the trajectory file. It contains
+#a json header (element list, step ids, time and cell) and the data of frames in
+#npy chunks, so the text trajectory is parsed once and later read as binary.
+#It is keyed on the size and the modification time of the trajectory file.
+
+cache_version = 1
+
+#Loaded headers are kept in memory, as they are used for every read.
+cache_header_memo = {}
+
+def get_cache_dir(file_name):
+
+  '''
+  get_cache_dir: get the name of cache directory of a trajectory file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+  Returns:
+    cache_dir: string
+      cache_dir is the name of cache directory.
+  '''
+
+  dir_name, base_name = os.path.split(os.path.abspath(file_name))
+  cache_dir = ''.join((dir_name, '/.', base_name, '.cache'))
+
+  return cache_dir
+
+def get_chunk_file(cache_dir, chunk_num):
+
+  '''
+  get_chunk_file: get the name of npy file of a chunk.
+
+  Args:
+    cache_dir: string
+      cache_dir is the name of cache directory.
+    chunk_num: int
+      chunk_num is the serial number of the chunk.
+  Returns:
+    chunk_file: string
+  '''
+
+  return ''.join((cache_dir, '/data_', str(chunk_num), '.npy'))
+
+def load_cache_header(file_name):
+
+  '''
+  load_cache_header: load the cache header if the cache is up to date.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+  Returns:
+    cache_header: dictionary or None
+      If there is no cache or it is out of date, None is returned.
+  '''
+
+  #A trajectory of several files has no cache.
+  if not os.path.isfile(file_name):
+    return None
+
+  header_file = ''.join((get_cache_dir(file_name), '/header.json'))
+  if not os.path.exists(header_file):
+    return None
+
+  stat = os.stat(file_name)
+  key = [cache_version, stat.st_size, stat.st_mtime_ns, os.stat(header_file).st_mtime_ns]
+  abs_file_name = os.path.abspath(file_name)
+  if ( abs_file_name in cache_header_memo and cache_header_memo[abs_file_name][0] == key ):
+    return cache_header_memo[abs_file_name][1]
+
+  try:
+    with open(header_file, 'r') as f:
+      cache_header = json.load(f)
+  except (OSError, ValueError):
+    return None
+
+  if ( cache_header.get('version') != cache_version or cache_header.get('size') != stat.st_size or \
+       cache_header.get('mtime_ns') != stat.st_mtime_ns ):
+    return None
+
+  cache_header_memo[abs_file_name] = [key, cache_header]
+
+  return cache_header
+
+def dump_cache(file_name, cache_header, read_chunk, chunk_size):
+
+  '''
+  dump_cache: write the cache of a trajectory file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    cache_header: dictionary
+      cache_header contains file_type, element, step, time and cell of the trajectory.
+    read_chunk: function
+      read_chunk(frame_list) returns the data of frames in frame_list.
+    chunk_size: int
+      chunk_size is the number of frames in a chunk.
+  Returns:
+    cache_dir: string
+      cache_dir is the name of cache directory.
+  '''
+
+  stat = os.stat(file_name)
+  cache_dir = get_cache_dir(file_name)
+  if os.path.exists(cache_dir):
+    shutil.rmtree(cache_dir)
+  os.makedirs(cache_dir)
+
+  frames_num = len(cache_header['step'])
+  chunks_num = int((frames_num+chunk_size-1)/chunk_size)
+  for i in range(chunks_num):
+    frame_list = list(range(i*chunk_size, min((i+1)*chunk_size, frames_num)))
+    np.save(get_chunk_file(cache_dir, i), read_chunk(frame_list))
+
+  cache_header['version'] = cache_version
+  cache_header['size'] = stat.st_size
+  cache_header['mtime_ns'] = stat.st_mtime_ns
+  cache_header['chunk_size'] = chunk_size
+  cache_header['chunks_num'] = chunks_num
+
+  #The header is written at last, so an unfinished cache is never used.
+  header_file = ''.join((cache_dir, '/header.json'))
+  header_file_tmp = ''.join((header_file, '.', str(os.getpid())))
+  with open(header_file_tmp, 'w') as f:
+    json.dump(cache_header, f)
+  os.replace(header_file_tmp, header_file)
+
+  return cache_dir
+
+def read_cache(file_name, cache_header, frame_list):
+
+  '''
+  read_cache: read the data of frames from the cache.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    cache_header: dictionary
+      cache_header is the header of the cache.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+  Returns:
+    data: numpy array
+      data is the data of frames, the first dimension is len(frame_list).
+  '''
+
+  cache_dir = get_cache_dir(file_name)
+  chunk_size = cache_header['chunk_size']
+  frame_array = np.array(frame_list, dtype='int64')
+  chunk_id = frame_array//chunk_size
+
+  data = None
+  for i in np.unique(chunk_id):
+    chunk = np.load(get_chunk_file(cache_dir, int(i)), mmap_mode='r')
+    if ( data is None ):
+      data = np.empty((len(frame_array),)+chunk.shape[1:], dtype=chunk.dtype)
+    choose = np.nonzero(chunk_id == i)[0]
+    data[choose] = chunk[frame_array[choose]-i*chunk_size]
+
+  if ( data is None ):
+    data = np.empty((0,), dtype='float64')
+
+  return data
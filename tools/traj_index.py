@@ -0,0 +1,1061 @@
+#!/usr/bin/env python
+
+import io
+import os
+import re
+import bz2
+import glob
+import gzip
+import lzma
+import zlib
+import bisect
+import numpy as np
+from CP2K_kit.tools import data_op
+from CP2K_kit.tools import log_info
+
+#The frame index is a small sidecar file next to the trajectory file. It stores the
+#byte offset, step id and time of every frame, so one frame could be read with one
+#seek and one read. It is keyed on the size and the modification time of the file.
+#Compressed trajectories (.gz, .bz2 and .xz) are indexed by the offsets in the
+#decompressed stream. The decompressor of the last read is kept open, so reading
+#frames forward continues the stream instead of decompressing from the beginning.
+#While a compressed file is decompressed (by the scan or by reads), checkpoints are
+#kept in memory: copies of the zlib decompressor every checkpoint_bytes of output
+#for gzip, and the starts of streams (gzip members, bz2 and xz streams written by
+#parallel compressors) for all formats. Seeking backward restarts from the nearest
+#checkpoint instead of the beginning of the file.
+#A trajectory name could also be a list of files (separated by space) or a glob,
+#such as restart segments of one md. They are presented as one trajectory by a
+#merged index: frames are ordered by step, and for a repeated step the frame in
+#the later file is kept. Each frame records its file and its offset in the file.
+#A pdb frame is ended by an END or ENDMDL record, and the index of pdb file also
+#stores the offset of the first ATOM (HETATM) record from the start of each frame.
+
+index_version = 2
+
+compress_open = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+
+#The open decompressed stream and the last read span of compressed files.
+compress_stream_memo = {}
+
+#The checkpoints of compressed files, keyed on the file, its size and modification time.
+compress_checkpoint = {}
+checkpoint_bytes = 32*1024**2
+
+def is_compressed(file_name):
+
+  '''
+  is_compressed: check whether a trajectory file is compressed.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+  Returns:
+    compressed: bool
+  '''
+
+  return ( os.path.splitext(file_name)[1] in compress_open )
+
+def get_file_list(file_name):
+
+  '''
+  get_file_list: get the files of a trajectory name.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory. It could be a file, files separated
+      by space or glob patterns.
+      Example: '/home/md/run*/WATER-pos-1.xyz'
+  Returns:
+    file_list: 1-d string list
+      Matched files of a glob are sorted by name, and numbers in names are
+      compared as numbers, so run2 is before run10.
+  '''
+
+  if os.path.exists(file_name):
+    return [file_name]
+
+  natural_key = lambda name: [int(x) if x.isdigit() else x for x in re.split('([0-9]+)', name)]
+  file_list = []
+  for name in file_name.split():
+    if glob.has_magic(name):
+      file_list = file_list+sorted(glob.glob(name), key=natural_key)
+    else:
+      file_list.append(name)
+
+  return file_list
+
+def is_virtual(file_name):
+
+  '''
+  is_virtual: check whether a trajectory name is made of several files.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory.
+  Returns:
+    virtual: bool
+  '''
+
+  return ( not os.path.exists(file_name) and ( glob.has_magic(file_name) or len(file_name.split()) > 1 ) )
+
+def get_traj_path(traj_file):
+
+  '''
+  get_traj_path: get the absolute trajectory name from input.
+
+  Args:
+    traj_file: string or 1-d string list
+      traj_file is the trajectory in input, a list means several files.
+  Returns:
+    traj_path: string
+      traj_path is the trajectory name with absolute paths.
+  '''
+
+  if isinstance(traj_file, list):
+    name_list = traj_file
+  elif os.path.exists(os.path.expanduser(traj_file)):
+    name_list = [traj_file]
+  else:
+    name_list = traj_file.split()
+
+  return ' '.join([os.path.abspath(os.path.expanduser(name)) for name in name_list])
+
+def traj_exists(traj_file):
+
+  '''
+  traj_exists: check whether all files of a trajectory in input exist.
+
+  Args:
+    traj_file: string or 1-d string list
+      traj_file is the trajectory in input.
+  Returns:
+    exist: bool
+  '''
+
+  file_list = get_file_list(get_traj_path(traj_file))
+
+  return ( len(file_list) != 0 and all(os.path.isfile(name) for name in file_list) )
+
+def new_decompressor(suffix):
+
+  '''
+  new_decompressor: get a decompressor of one stream of compressed file.
+
+  Args:
+    suffix: string
+      suffix is the suffix of compressed file, .gz, .bz2 or .xz.
+  Returns:
+    decompressor: decompressor object
+  '''
+
+  if ( suffix == '.gz' ):
+    return zlib.decompressobj(16+zlib.MAX_WBITS)
+  elif ( suffix == '.bz2' ):
+    return bz2.BZ2Decompressor()
+  else:
+    return lzma.LZMADecompressor()
+
+#io.BufferedReader needs a raw file object, so this reader is a class. Its
+#position is the offset in the decompressed stream.
+class CompressReader(io.RawIOBase):
+
+  def __init__(self, file_name, chunk_bytes=1024**2):
+
+    stat = os.stat(file_name)
+    key = (os.path.abspath(file_name), stat.st_size, stat.st_mtime_ns)
+    if key not in compress_checkpoint:
+      compress_checkpoint[key] = {'out': [0], 'state': [(0, None)]}
+    self.checkpoint = compress_checkpoint[key]
+    self.suffix = os.path.splitext(file_name)[1]
+    self.raw_file = open(file_name, 'rb')
+    self.chunk_bytes = chunk_bytes
+    self.pos = 0
+    self.restore(0)
+
+  def restore(self, index):
+
+    #Restart the decompressor at a checkpoint.
+    out, state = self.checkpoint['out'][index], self.checkpoint['state'][index]
+    self.in_pos = state[0]
+    if ( state[1] is None ):
+      self.decompressor = None
+    else:
+      self.decompressor = state[1].copy()
+    self.data_start = out
+    self.data = b''
+    self.eof = False
+
+  def add_checkpoint(self, state):
+
+    out = self.data_start+len(self.data)
+    index = bisect.bisect_right(self.checkpoint['out'], out)
+    if ( self.checkpoint['out'][index-1] != out ):
+      self.checkpoint['out'].insert(index, out)
+      self.checkpoint['state'].insert(index, state)
+
+  def decompress_chunk(self):
+
+    #Decompress the next chunk, and the data is the output of this chunk.
+    self.data_start = self.data_start+len(self.data)
+    self.data = b''
+    self.raw_file.seek(self.in_pos)
+    chunk = self.raw_file.read(self.chunk_bytes)
+    #A truncated file (such as a file being written) ends at the last complete output.
+    if ( len(chunk) == 0 ):
+      self.eof = True
+      return
+    if ( self.decompressor is None ):
+      #Streams could be padded with null bytes.
+      chunk_strip = chunk.lstrip(b'\x00')
+      self.in_pos = self.in_pos+len(chunk)-len(chunk_strip)
+      chunk = chunk_strip
+      if ( len(chunk) == 0 ):
+        return
+      self.add_checkpoint((self.in_pos, None))
+      self.decompressor = new_decompressor(self.suffix)
+
+    self.data = self.decompressor.decompress(chunk)
+    self.in_pos = self.in_pos+len(chunk)
+    if self.decompressor.eof:
+      self.in_pos = self.in_pos-len(self.decompressor.unused_data)
+      self.decompressor = None
+    elif ( self.suffix == '.gz' ):
+      data_end = self.data_start+len(self.data)
+      index = bisect.bisect_right(self.checkpoint['out'], data_end)-1
+      if ( data_end-self.checkpoint['out'][index] >= checkpoint_bytes ):
+        self.add_checkpoint((self.in_pos, self.decompressor.copy()))
+
+  def readinto(self, buffer):
+
+    data_end = self.data_start+len(self.data)
+    if ( self.pos < self.data_start or self.pos > data_end ):
+      index = bisect.bisect_right(self.checkpoint['out'], self.pos)-1
+      if ( self.pos < self.data_start or self.checkpoint['out'][index] > data_end ):
+        self.restore(index)
+    while ( self.pos >= self.data_start+len(self.data) and not self.eof ):
+      self.decompress_chunk()
+    if self.eof:
+      return 0
+
+    start = self.pos-self.data_start
+    size = min(len(buffer), len(self.data)-start)
+    buffer[0:size] = self.data[start:start+size]
+    self.pos = self.pos+size
+
+    return size
+
+  def seek(self, offset, whence=0):
+
+    if ( whence == 0 ):
+      self.pos = offset
+    elif ( whence == 1 ):
+      self.pos = self.pos+offset
+    else:
+      #The size of decompressed stream is known only at the end.
+      buffer = bytearray(self.chunk_bytes)
+      while ( self.readinto(buffer) != 0 ):
+        pass
+      self.pos = self.data_start+len(self.data)+offset
+
+    return self.pos
+
+  def tell(self):
+
+    return self.pos
+
+  def readable(self):
+
+    return True
+
+  def seekable(self):
+
+    return True
+
+  def close(self):
+
+    self.raw_file.close()
+    super().close()
+
+def open_traj(file_name, mode='rb'):
+
+  '''
+  open_traj: open a trajectory file, compressed file is decompressed as a stream.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    mode: string
+      mode is the mode of open, such as 'rb', 'wb' and 'rt'.
+  Returns:
+    traj_file: file object
+  '''
+
+  suffix = os.path.splitext(file_name)[1]
+  if ( suffix in compress_open and mode == 'rb' ):
+    return io.BufferedReader(CompressReader(file_name))
+  elif ( suffix in compress_open and mode == 'rt' ):
+    return io.TextIOWrapper(io.BufferedReader(CompressReader(file_name)))
+  elif ( suffix in compress_open ):
+    return compress_open[suffix](file_name, mode)
+  else:
+    return open(file_name, mode)
+
+def read_traj_bytes(file_name, start, end):
+
+  '''
+  read_traj_bytes: read the bytes between start and end of a trajectory file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    start: int
+      start is the starting offset (in decompressed stream for compressed file).
+    end: int
+      end is the ending offset.
+  Returns:
+    data: bytes
+  '''
+
+  if not is_compressed(file_name):
+    with open(file_name, 'rb') as traj_file:
+      traj_file.seek(start)
+      return traj_file.read(end-start)
+
+  stat = os.stat(file_name)
+  key = [stat.st_size, stat.st_mtime_ns]
+  abs_file_name = os.path.abspath(file_name)
+  memo = compress_stream_memo.get(abs_file_name)
+  if ( memo is not None and memo['key'] != key ):
+    memo['stream'].close()
+    memo = None
+  if ( memo is None ):
+    memo = {'key': key, 'stream': open_traj(file_name, 'rb'), 'start': 0, 'data': b''}
+    compress_stream_memo[abs_file_name] = memo
+
+  #The last span is kept, as the headers and the bodies of same frames are often
+  #read one after another. Seeking backward restarts from the nearest checkpoint.
+  if ( start >= memo['start'] and end <= memo['start']+len(memo['data']) ):
+    return memo['data'][start-memo['start']:end-memo['start']]
+  memo['stream'].seek(start)
+  data = memo['stream'].read(end-start)
+  memo['start'] = start
+  memo['data'] = data
+
+  return data
+
+def get_index_file(file_name):
+
+  '''
+  get_index_file: get the name of frame index file of a trajectory file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+  Returns:
+    index_file: string
+      index_file is the name of frame index file.
+  '''
+
+  dir_name, base_name = os.path.split(os.path.abspath(file_name))
+  index_file = ''.join((dir_name, '/.', base_name, '.idx'))
+
+  return index_file
+
+def parse_xyz_header(line, frame_num):
+
+  '''
+  parse_xyz_header: get step id and time from the comment line of a xyz frame.
+
+  Args:
+    line: string
+      line is the second line of a xyz frame.
+      Example: ' i =        0, time =        0.000, E =       -14.9507520345'
+    frame_num: int
+      frame_num is the serial number of the frame in the file.
+  Returns:
+    step: int
+      step is the step id of the frame, if there is no step, frame_num is used.
+    time: float
+      time is the time of the frame, if there is no time, 0.0 is used.
+  '''
+
+  line_split = data_op.split_str(line, ' ', '\n')
+  if ( len(line_split) > 5 and data_op.eval_str(line_split[2].strip(',')) == 1 ):
+    step = int(line_split[2].strip(','))
+    time = float(line_split[5].strip(','))
+  else:
+    step = frame_num
+    time = 0.0
+
+  return step, time
+
+def scan_xyz(file_name, frame_index=None):
+
+  '''
+  scan_xyz: scan a xyz-like trajectory file (coord_xyz, vel, frc) in one pass.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the old frame index of a growing file. If it is not empty,
+      the scan starts from the end of the old index.
+  Returns:
+    frame_index: dictionary
+      frame_index contains the offset, step, time and atoms number of each complete frame.
+  '''
+
+  if ( frame_index is None ):
+    frame_index = {}
+
+  if ( len(frame_index) != 0 and len(frame_index['step']) != 0 ):
+    offset = frame_index['offset'][0:-1].tolist()
+    step = frame_index['step'].tolist()
+    time = frame_index['time'].tolist()
+    atoms = frame_index['atoms_num'].tolist()
+  else:
+    offset = []
+    step = []
+    time = []
+    atoms = []
+  line_len = 0
+
+  #Each frame is validated when it is indexed: the atom number, the header and
+  #the element column must be same as the first frame. The scan stops at the first
+  #broken frame, so the end of the index is the breakpoint of the file.
+  first_atoms_num = -1
+  first_has_step = False
+  first_element = []
+  element_len = 0
+  first_element_bytes = b''
+
+  #The new frames of a growing file are validated against the first frame.
+  if ( len(offset) != 0 ):
+    first_lines = read_frame_lines(file_name, frame_index, 0)
+    first_atoms_num = atoms[0]
+    first_has_step = ( len(data_op.split_str(first_lines[1], ' ', '\n')) > 5 )
+    first_element = [line.split()[0] for line in first_lines[2:]]
+
+  traj_file = open_traj(file_name, 'rb')
+  frame_start = 0
+  if ( len(offset) != 0 ):
+    frame_start = int(frame_index['offset'][-1])
+    traj_file.seek(frame_start)
+  while True:
+    line_1 = traj_file.readline()
+    if ( line_1.strip() == b'' ):
+      break
+    line_2 = traj_file.readline()
+    if ( not line_2.endswith(b'\n') or data_op.eval_str(line_1.decode().strip()) != 1 ):
+      break
+    atoms_num = int(line_1)
+    if ( first_atoms_num != -1 and atoms_num != first_atoms_num ):
+      break
+    frame_step, frame_time = parse_xyz_header(line_2.decode(), len(offset))
+    has_step = ( len(data_op.split_str(line_2.decode(), ' ', '\n')) > 5 )
+    if ( first_atoms_num != -1 and has_step != first_has_step ):
+      break
+    body_start = frame_start+len(line_1)+len(line_2)
+
+    #CP2K writes atom lines with fixed width, so the whole frame body is read at once
+    #and checked by counting lines and comparing the element column. Otherwise we
+    #read it line by line.
+    complete = False
+    if ( line_len != 0 ):
+      body = traj_file.read(atoms_num*line_len)
+      if ( len(body) == atoms_num*line_len and body.count(b'\n') == atoms_num and body.endswith(b'\n') ):
+        body_array = np.frombuffer(body, dtype='uint8').reshape(atoms_num, line_len)
+        complete = ( body_array[:,0:element_len].tobytes() == first_element_bytes )
+      if not complete:
+        traj_file.seek(body_start)
+    if not complete:
+      lines_num = 0
+      lines = []
+      body_len = []
+      element = []
+      for i in range(atoms_num):
+        line = traj_file.readline()
+        if not line.endswith(b'\n'):
+          break
+        line_split = line.decode(errors='replace').split()
+        if ( len(line_split) < 4 ):
+          break
+        if ( first_atoms_num != -1 and line_split[0] != first_element[i] ):
+          break
+        element.append(line_split[0])
+        lines.append(line)
+        body_len.append(len(line))
+        lines_num = lines_num+1
+      complete = ( lines_num == atoms_num )
+      if ( complete and first_atoms_num == -1 ):
+        first_element = element
+      if ( complete and len(set(body_len)) == 1 ):
+        #Fixed-width frame, the fast path could be used for next frames.
+        line_len = body_len[0]
+        body = b''.join(lines)
+        first_line = body[0:line_len]
+        element_len = len(first_line)-len(first_line.lstrip())+len(first_line.split()[0])
+        body_array = np.frombuffer(body, dtype='uint8').reshape(atoms_num, line_len)
+        first_element_bytes = body_array[:,0:element_len].tobytes()
+      else:
+        line_len = 0
+    if not complete:
+      break
+
+    if ( first_atoms_num == -1 ):
+      first_atoms_num = atoms_num
+      first_has_step = has_step
+    offset.append(frame_start)
+    step.append(frame_step)
+    time.append(frame_time)
+    atoms.append(atoms_num)
+    frame_start = traj_file.tell()
+
+  data_size = traj_file.seek(0, 2)
+  traj_file.close()
+
+  frame_index = {}
+  frame_index['offset'] = np.array(offset+[frame_start], dtype='int64')
+  frame_index['step'] = np.array(step, dtype='int64')
+  frame_index['time'] = np.array(time, dtype='float64')
+  frame_index['atoms_num'] = np.array(atoms, dtype='int64')
+  frame_index['size'] = np.array(data_size, dtype='int64')
+
+  return frame_index
+
+def parse_pdb_header(header, frame_num):
+
+  '''
+  parse_pdb_header: get step id and time from the records before atoms of a pdb frame.
+
+  Args:
+    header: bytes
+      header is the records before the first ATOM record of a pdb frame.
+      Example: b'TITLE     Step 0, time = 0.000, E = -34.2318\nCRYST1    9.860 ...\n'
+    frame_num: int
+      frame_num is the serial number of the frame in the file.
+  Returns:
+    step: int
+      step is the step id of the frame. If there is no step, the serial number of
+      MODEL record is used, otherwise frame_num is used.
+    time: float
+      time is the time of the frame, if there is no time, 0.0 is used.
+  '''
+
+  step_match = re.search(rb'Step\s+(-?[0-9]+)', header)
+  model_match = re.search(rb'(?m)^MODEL\s+(-?[0-9]+)', header)
+  if ( step_match is not None ):
+    step = int(step_match.group(1))
+  elif ( model_match is not None ):
+    step = int(model_match.group(1))
+  else:
+    step = frame_num
+
+  time_match = re.search(rb'time\s*=\s*([-+0-9.Ee]+?),?\s', header)
+  if ( time_match is not None and data_op.eval_str(time_match.group(1).decode()) != 0 ):
+    time = float(time_match.group(1))
+  else:
+    time = 0.0
+
+  return step, time
+
+def find_pdb_atom(traj_data, start, end):
+
+  '''
+  find_pdb_atom: find the first ATOM (HETATM) record in a range of pdb data.
+
+  Args:
+    traj_data: bytes
+      traj_data is the content of pdb file.
+    start: int
+      start is the offset of a line start in traj_data.
+    end: int
+      end is the end of the range.
+  Returns:
+    atom_start: int
+      atom_start is the offset of the first ATOM record, -1 if there is no atom.
+  '''
+
+  atom_start = -1
+  for record in [b'ATOM  ', b'HETATM']:
+    if traj_data.startswith(record, start):
+      return start
+    record_start = traj_data.find(b'\n'+record, start, end)
+    if ( record_start != -1 and ( atom_start == -1 or record_start+1 < atom_start ) ):
+      atom_start = record_start+1
+
+  return atom_start
+
+def scan_pdb(file_name, frame_index=None, chunk_bytes=16*1024**2):
+
+  '''
+  scan_pdb: scan a pdb trajectory file (coord_pdb) in one pass.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the old frame index of a growing file. If it is not empty,
+      the scan starts from the end of the old index.
+    chunk_bytes: int
+      chunk_bytes is the size of data read at once.
+  Returns:
+    frame_index: dictionary
+      frame_index contains the offset, step, time, atoms number and the offset of
+      the first atom of each complete frame.
+  '''
+
+  if ( frame_index is None ):
+    frame_index = {}
+
+  if ( len(frame_index) != 0 and len(frame_index['step']) != 0 ):
+    offset = frame_index['offset'][0:-1].tolist()
+    step = frame_index['step'].tolist()
+    time = frame_index['time'].tolist()
+    atoms = frame_index['atoms_num'].tolist()
+    atom_offset = frame_index['atom_offset'].tolist()
+    frame_start = int(frame_index['offset'][-1])
+  else:
+    offset = []
+    step = []
+    time = []
+    atoms = []
+    atom_offset = []
+    frame_start = 0
+
+  #The file is read in chunks and records are searched by bytes.find, so a frame is
+  #never split into lines. A block without atom (such as the END after the last
+  #ENDMDL) belongs to the previous frame. The scan stops at the first frame whose
+  #atom number is different from the first frame, or which is not ended.
+  traj_file = open_traj(file_name, 'rb')
+  traj_file.seek(frame_start)
+  traj_data = b''
+  data_start = frame_start
+  pos = 0
+  eof = False
+  while True:
+    if traj_data.startswith(b'END', pos):
+      end_start = pos
+    else:
+      end_start = traj_data.find(b'\nEND', pos)
+      if ( end_start != -1 ):
+        end_start = end_start+1
+    end = -1
+    if ( end_start != -1 ):
+      end = traj_data.find(b'\n', end_start)
+    if ( end == -1 ):
+      if eof:
+        break
+      chunk = traj_file.read(chunk_bytes)
+      eof = ( len(chunk) == 0 )
+      traj_data = b''.join((traj_data[pos:], chunk))
+      data_start = data_start+pos
+      pos = 0
+      continue
+    end = end+1
+
+    atom_start = find_pdb_atom(traj_data, pos, end_start)
+    if ( atom_start != -1 ):
+      atoms_num = traj_data.count(b'\nATOM  ', atom_start-1, end_start)+ \
+                  traj_data.count(b'\nHETATM', atom_start-1, end_start)
+      if ( atom_start == 0 ):
+        atoms_num = atoms_num+1
+      if ( len(atoms) != 0 and atoms_num != atoms[0] ):
+        break
+      frame_step, frame_time = parse_pdb_header(traj_data[pos:atom_start], len(offset))
+      offset.append(data_start+pos)
+      step.append(frame_step)
+      time.append(frame_time)
+      atoms.append(atoms_num)
+      atom_offset.append(atom_start-pos)
+    #The records before the first frame are not a part of any frame.
+    pos = end
+    if ( len(offset) != 0 ):
+      frame_start = data_start+pos
+
+  data_size = traj_file.seek(0, 2)
+  traj_file.close()
+
+  frame_index = {}
+  frame_index['offset'] = np.array(offset+[frame_start], dtype='int64')
+  frame_index['step'] = np.array(step, dtype='int64')
+  frame_index['time'] = np.array(time, dtype='float64')
+  frame_index['atoms_num'] = np.array(atoms, dtype='int64')
+  frame_index['atom_offset'] = np.array(atom_offset, dtype='int64')
+  frame_index['size'] = np.array(data_size, dtype='int64')
+
+  return frame_index
+
+def scan_lines(file_name, file_type, frame_index=None):
+
+  '''
+  scan_lines: scan a trajectory file whose frames are lines (ener, cell, mix_ener, lagrange) in one pass.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    file_type: string
+      file_type is the type of file.
+    frame_index: dictionary
+      frame_index is the old frame index of a growing file. If it is not empty,
+      the scan starts from the end of the old index.
+  Returns:
+    frame_index: dictionary
+      frame_index contains the offset, step, time and lines number of each complete frame.
+  '''
+
+  if ( frame_index is None ):
+    frame_index = {}
+
+  if ( file_type == 'lagrange' ):
+    block_num = 2
+  else:
+    block_num = 1
+
+  traj_file = open_traj(file_name, 'rb')
+  if ( len(frame_index) != 0 and len(frame_index['step']) != 0 ):
+    offset = frame_index['offset'][0:-1].tolist()
+    step = frame_index['step'].tolist()
+    time = frame_index['time'].tolist()
+    frame_start = int(frame_index['offset'][-1])
+    traj_file.seek(frame_start)
+  else:
+    offset = []
+    step = []
+    time = []
+    frame_start = 0
+    if ( file_type == 'ener' or file_type == 'cell' ):
+      frame_start = len(traj_file.readline())
+
+  while True:
+    block = []
+    for i in range(block_num):
+      line = traj_file.readline()
+      if not line.endswith(b'\n'):
+        break
+      block.append(line)
+    if ( len(block) != block_num ):
+      break
+    if ( file_type == 'lagrange' ):
+      frame_step = len(offset)
+      frame_time = 0.0
+    else:
+      line_split = data_op.split_str(block[0].decode(), ' ', '\n')
+      if ( len(line_split) < 2 or data_op.eval_str(line_split[0]) != 1 ):
+        break
+      frame_step = int(line_split[0])
+      frame_time = float(line_split[1])
+    offset.append(frame_start)
+    step.append(frame_step)
+    time.append(frame_time)
+    frame_start = frame_start+sum(len(line) for line in block)
+
+  data_size = traj_file.seek(0, 2)
+  traj_file.close()
+
+  frame_index = {}
+  frame_index['offset'] = np.array(offset+[frame_start], dtype='int64')
+  frame_index['step'] = np.array(step, dtype='int64')
+  frame_index['time'] = np.array(time, dtype='float64')
+  frame_index['atoms_num'] = np.full(len(step), block_num, dtype='int64')
+  frame_index['size'] = np.array(data_size, dtype='int64')
+
+  return frame_index
+
+def load_frame_index(file_name, check_file=True):
+
+  '''
+  load_frame_index: load the frame index if it is still up to date.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    check_file: bool
+      check_file is whether to check the size and the modification time of the file.
+  Returns:
+    frame_index: dictionary or None
+      If the index file does not exist or it is out of date, None is returned.
+  '''
+
+  index_file = get_index_file(file_name)
+  if not os.path.exists(index_file):
+    return None
+
+  stat = os.stat(file_name)
+  try:
+    index_data = np.load(index_file)
+    key = index_data['key']
+    if ( int(key[0]) != index_version ):
+      return None
+    if ( check_file and ( int(key[1]) != stat.st_size or int(key[2]) != stat.st_mtime_ns ) ):
+      return None
+    frame_index = {}
+    for name in index_data.files:
+      if ( name != 'key' ):
+        frame_index[name] = index_data[name]
+  except (OSError, ValueError, KeyError):
+    return None
+
+  return frame_index
+
+def dump_frame_index(file_name, frame_index):
+
+  '''
+  dump_frame_index: write the frame index file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+  Returns:
+    none
+  '''
+
+  #If the directory is read-only, we just do not keep the index.
+  stat = os.stat(file_name)
+  index_file = get_index_file(file_name)
+  index_file_tmp = ''.join((index_file, '.', str(os.getpid())))
+  key = np.array([index_version, stat.st_size, stat.st_mtime_ns], dtype='int64')
+  try:
+    with open(index_file_tmp, 'wb') as f:
+      np.savez(f, key=key, **frame_index)
+    os.replace(index_file_tmp, index_file)
+  except OSError:
+    if os.path.exists(index_file_tmp):
+      os.remove(index_file_tmp)
+
+def get_merged_index(file_name, file_type):
+
+  '''
+  get_merged_index: get the merged frame index of a trajectory made of several files.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory, it contains several files.
+    file_type: string
+      file_type is the type of file.
+  Returns:
+    frame_index: dictionary
+      frame_index['offset'] is the offset in the virtual concatenation of the
+      choosed frames. Besides the keys of get_frame_index, it contains:
+      frame_index['file_list']: 1-d string array, the files of trajectory.
+      frame_index['file_id']: 1-d int array, the file of each frame.
+      frame_index['file_offset']: 1-d int array, the offset of each frame in its file.
+  '''
+
+  #The index of each file is updated instead of scanned again, so the segment
+  #written by a running md is cheap to merge.
+  file_list = get_file_list(file_name)
+  step = []
+  time = []
+  atoms = []
+  file_id = []
+  file_offset = []
+  frame_len = []
+  atom_offset = []
+  for i in range(len(file_list)):
+    frame_index_i = update_frame_index(file_list[i], file_type)
+    step.append(frame_index_i['step'])
+    time.append(frame_index_i['time'])
+    atoms.append(frame_index_i['atoms_num'])
+    file_id.append(np.full(len(frame_index_i['step']), i, dtype='int64'))
+    file_offset.append(frame_index_i['offset'][0:-1])
+    frame_len.append(np.diff(frame_index_i['offset']))
+    if ( 'atom_offset' in frame_index_i ):
+      atom_offset.append(frame_index_i['atom_offset'])
+
+  if ( len(file_list) == 0 ):
+    log_info.log_error('File error: no trajectory file matches %s, please check' %(file_name))
+    exit()
+
+  step = np.concatenate(step)
+  frames_num = len(step)
+  #np.unique gives the first occurrence of each step in the reversed array, that
+  #is the last occurrence, and the steps are sorted.
+  step_unique, reverse_id = np.unique(step[::-1], return_index=True)
+  choose = frames_num-1-reverse_id
+
+  frame_len = np.concatenate(frame_len)[choose]
+  frame_index = {}
+  frame_index['offset'] = np.concatenate((np.zeros(1, dtype='int64'), np.cumsum(frame_len, dtype='int64')))
+  frame_index['step'] = step[choose]
+  frame_index['time'] = np.concatenate(time)[choose]
+  frame_index['atoms_num'] = np.concatenate(atoms)[choose]
+  frame_index['size'] = np.array(frame_index['offset'][-1], dtype='int64')
+  frame_index['file_list'] = np.array(file_list)
+  frame_index['file_id'] = np.concatenate(file_id)[choose]
+  frame_index['file_offset'] = np.concatenate(file_offset)[choose]
+  if ( len(atom_offset) != 0 ):
+    frame_index['atom_offset'] = np.concatenate(atom_offset)[choose]
+
+  return frame_index
+
+def get_frame_index(file_name, file_type):
+
+  '''
+  get_frame_index: get the frame index of a trajectory file. The index is built
+                   at the first time and reused later.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    file_type: string
+      file_type is the type of file. Supported types are coord_xyz, coord_pdb, vel,
+      frc, ener, cell, mix_ener and lagrange.
+  Returns:
+    frame_index: dictionary
+      frame_index['offset']: 1-d int array, dim = frames_num+1
+        byte offset of each frame, the last one is the end of last complete frame.
+      frame_index['step']: 1-d int array, dim = frames_num
+      frame_index['time']: 1-d float array, dim = frames_num
+      frame_index['atoms_num']: 1-d int array, dim = frames_num
+        for ener, cell, mix_ener and lagrange, it is the number of lines in a frame.
+      frame_index['size']: int
+        the size of the file (of the decompressed stream for compressed file).
+      frame_index['atom_offset']: 1-d int array, dim = frames_num
+        only for coord_pdb, the offset of the first atom from the start of frame.
+  '''
+
+  if ( file_type not in ['coord_xyz', 'coord_pdb', 'vel', 'frc', 'ener', 'cell', 'mix_ener', 'lagrange'] ):
+    log_info.log_error('Internal error: frame index does not support %s file type' %(file_type))
+    exit()
+
+  if is_virtual(file_name):
+    return get_merged_index(file_name, file_type)
+
+  frame_index = load_frame_index(file_name)
+  if ( frame_index is None ):
+    if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
+      frame_index = scan_xyz(file_name)
+    elif ( file_type == 'coord_pdb' ):
+      frame_index = scan_pdb(file_name)
+    else:
+      frame_index = scan_lines(file_name, file_type)
+    dump_frame_index(file_name, frame_index)
+
+  return frame_index
+
+def check_frame(file_name, file_type, frame_index, frame_num):
+
+  '''
+  check_frame: check whether a frame in the frame index is still same in the file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    file_type: string
+      file_type is the type of file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_num: int
+      frame_num is the serial number (starting from 0) of the frame in the file.
+  Returns:
+    same: bool
+  '''
+
+  lines = read_frame_lines(file_name, frame_index, frame_num)
+  if ( len(lines) == 0 or not lines[-1].endswith('\n') ):
+    return False
+
+  if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
+    if ( len(lines) != int(frame_index['atoms_num'][frame_num])+2 or data_op.eval_str(lines[0].strip()) != 1 ):
+      return False
+    frame_step, frame_time = parse_xyz_header(lines[1], frame_num)
+  elif ( file_type == 'coord_pdb' ):
+    if not ( lines[-1].startswith('END') ):
+      return False
+    atom_offset = int(frame_index['atom_offset'][frame_num])
+    frame_str = ''.join(lines)
+    atoms_num = sum(1 for line in lines if line.startswith('ATOM  ') or line.startswith('HETATM'))
+    if ( atoms_num != int(frame_index['atoms_num'][frame_num]) or not frame_str[atom_offset:].startswith(('ATOM  ', 'HETATM')) ):
+      return False
+    frame_step, frame_time = parse_pdb_header(frame_str[0:atom_offset].encode(), frame_num)
+  elif ( file_type == 'lagrange' ):
+    frame_step = frame_num
+  else:
+    line_split = data_op.split_str(lines[0], ' ', '\n')
+    if ( len(line_split) < 2 or data_op.eval_str(line_split[0]) != 1 ):
+      return False
+    frame_step = int(line_split[0])
+
+  return ( frame_step == int(frame_index['step'][frame_num]) )
+
+def update_frame_index(file_name, file_type, frame_index=None):
+
+  '''
+  update_frame_index: update the frame index of a trajectory file which is still
+                      written by a running md. Only the new frames are scanned.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    file_type: string
+      file_type is the type of file.
+    frame_index: dictionary
+      frame_index is the old frame index. If it is empty, the index on disk is used.
+  Returns:
+    frame_index: dictionary
+      frame_index is the updated frame index.
+  '''
+
+  if ( frame_index is None ):
+    frame_index = {}
+
+  if is_virtual(file_name):
+    return get_merged_index(file_name, file_type)
+
+  new_frame_index = load_frame_index(file_name)
+  if ( new_frame_index is not None ):
+    return new_frame_index
+
+  if ( len(frame_index) == 0 ):
+    frame_index = load_frame_index(file_name, False)
+
+  #The old frames are kept only if the file is appended: it is not shorter than
+  #the old one, and the first and the last old frames are still there.
+  append = False
+  if ( frame_index is not None and 'size' in frame_index and len(frame_index['step']) != 0 and \
+       not is_compressed(file_name) and os.path.getsize(file_name) >= int(frame_index['size']) ):
+    append = all(check_frame(file_name, file_type, frame_index, i) for i in [0, len(frame_index['step'])-1])
+  if not append:
+    frame_index = {}
+
+  if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
+    new_frame_index = scan_xyz(file_name, frame_index)
+  elif ( file_type == 'coord_pdb' ):
+    new_frame_index = scan_pdb(file_name, frame_index)
+  else:
+    new_frame_index = scan_lines(file_name, file_type, frame_index)
+  dump_frame_index(file_name, new_frame_index)
+
+  return new_frame_index
+
+def read_frame_lines(file_name, frame_index, frame_num):
+
+  '''
+  read_frame_lines: read one frame from trajectory file by frame index.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_num: int
+      frame_num is the serial number (starting from 0) of the frame in the file.
+  Returns:
+    lines: 1-d string list
+      lines contains all lines of the frame, including the header lines.
+  '''
+
+  start = int(frame_index['offset'][frame_num])
+  end = int(frame_index['offset'][frame_num+1])
+  if ( 'file_id' in frame_index ):
+    file_name = str(frame_index['file_list'][frame_index['file_id'][frame_num]])
+    end = end-start+int(frame_index['file_offset'][frame_num])
+    start = int(frame_index['file_offset'][frame_num])
+
+  frame_str = read_traj_bytes(file_name, start, end).decode()
+
+  return frame_str.splitlines(True)
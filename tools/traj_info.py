@@ -3,11 +3,73 @@
 import os
 import sys
 import math
-import linecache
+import numpy as np
+from collections import OrderedDict
 from CP2K_kit.tools import atom
 from CP2K_kit.tools import data_op
 from CP2K_kit.tools import log_info
 from CP2K_kit.tools import traj_tools
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+
+def get_traj_summary(file_name, file_type):
+
+  '''
+  get_traj_summary: get the information and diagnostics of a trajectory file in one streaming pass.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file used to analyze.
+    file_type: string
+      file_type is the type of file. Supported types are coord_xyz, coord_pdb, vel,
+      frc, ener, cell, mix_ener and lagrange.
+  Returns:
+    traj_summary: dictionary
+      traj_summary['atoms_num']: int, the number of atoms (lines for ener files) in one frame.
+      traj_summary['frames_num']: int, the number of complete frames.
+      traj_summary['each']: int, printing frequency of md.
+      traj_summary['start_frame_id']: int, the starting frame id.
+      traj_summary['end_frame_id']: int, the endding frame id.
+      traj_summary['time_step']: float, time step of md. Its unit is fs in CP2K_kit.
+      traj_summary['incomplete']: bool, whether there is an incomplete frame at the end.
+      traj_summary['break_frame_id']: int, the frame id of the incomplete frame.
+      traj_summary['duplicate_num']: int, the number of duplicate frames.
+      traj_summary['duplicate_step']: 1-d int list, the step ids which appear more than once.
+      traj_summary['frame_index']: dictionary, the frame index of the file.
+  '''
+
+  frame_index = traj_index.get_frame_index(file_name, file_type)
+  step = frame_index['step']
+  time = frame_index['time']
+  frames_num = len(step)
+
+  if ( frames_num == 0 ):
+    log_info.log_error('File error: there is no complete frame in %s, please check' %(file_name))
+    exit()
+
+  traj_summary = OrderedDict()
+  traj_summary['atoms_num'] = int(frame_index['atoms_num'][0])
+  traj_summary['frames_num'] = frames_num
+  traj_summary['start_frame_id'] = int(step[0])
+  traj_summary['end_frame_id'] = int(step[frames_num-1])
+
+  if ( frames_num > 1 and step[1] != step[0] ):
+    each = int(step[1]-step[0])
+    traj_summary['each'] = each
+    traj_summary['time_step'] = float((time[1]-time[0])/each)
+  else:
+    traj_summary['each'] = 1
+    traj_summary['time_step'] = 0.0
+
+  traj_summary['incomplete'] = ( int(frame_index['offset'][-1]) != int(frame_index['size']) )
+  traj_summary['break_frame_id'] = traj_summary['end_frame_id']+traj_summary['each']
+
+  step_unique, step_count = np.unique(step, return_counts=True)
+  traj_summary['duplicate_num'] = int(frames_num-len(step_unique))
+  traj_summary['duplicate_step'] = [int(i) for i in step_unique[step_count > 1]]
+  traj_summary['frame_index'] = frame_index
+
+  return traj_summary
 
 def get_traj_info(file_name, file_type, group=[[]], atom_id=[[]], return_group=False):
 
@@ -51,95 +113,35 @@ def get_traj_info(file_name, file_type, group=[[]], atom_id=[[]], return_group=F
 
   blocks_num, pre_base, pre_base_block, end_base_block, frame_start = traj_tools.get_block_base(file_name, file_type)
 
-  whole_line_num_1 = len(open(file_name).readlines())
+  #One streaming pass gives all the information, the memory is bounded by one frame.
+  traj_summary = get_traj_summary(file_name, file_type)
 
-  if ((whole_line_num_1-pre_base)%(pre_base_block+blocks_num+end_base_block) != 0):
-    break_frame = traj_tools.find_breakpoint(file_name, file_type)
-    log_info.log_error('There is incomplete frame in %s. The incomplete frame id is %d.' %(file_name, break_frame))
+  if traj_summary['incomplete']:
+    log_info.log_error('There is incomplete frame in %s. The incomplete frame id is %d, it starts at byte %d. Please set truncate in traj_info to cut the file.' \
+                       %(file_name, traj_summary['break_frame_id'], traj_summary['frame_index']['offset'][-1]))
     exit()
-  else:
-    frames_num_1 = int((whole_line_num_1-pre_base)/(pre_base_block+blocks_num+end_base_block))
 
+  if ( traj_summary['duplicate_num'] != 0 ):
+    drop_step = traj_tools.delete_duplicate(file_name, file_type)
+    str_print = 'Delete %d duplicate frames between step %d and %d in %s' \
+                %(len(drop_step), min(drop_step), max(drop_step), file_name)
+    print (data_op.str_wrap(str_print, 80), flush=True)
+    traj_summary = get_traj_summary(file_name, file_type)
+
+  frame_index = traj_summary['frame_index']
+  frames_num = traj_summary['frames_num']
+  each = traj_summary['each']
+  start_frame_id = traj_summary['start_frame_id']
+  end_frame_id = traj_summary['end_frame_id']
+  time_step = traj_summary['time_step']
   if ( file_type == 'coord_xyz' or file_type == 'coord_pdb' or file_type == 'vel' or file_type == 'frc' ):
-    if ( file_type == 'coord_pdb' ):
-      a = linecache.getline(file_name, pre_base+1)
-    else:
-      a = linecache.getline(file_name, pre_base+2)
-    b = data_op.split_str(a, ' ')
-    if ( len(b) > 5 ):
-      start_frame_id = int(b[2].strip(','))
-      start_time = float(b[5].strip(','))
-    else:
-      start_frame_id = 0
-      start_frame_time = 0.0
-
-    if ( whole_line_num_1 > pre_base_block+blocks_num+end_base_block+pre_base ):
-      if ( file_type == 'coord_pdb' ):
-        a = linecache.getline(file_name, (pre_base_block+blocks_num+end_base_block)*1+pre_base+1)
-      else:
-        a = linecache.getline(file_name, (pre_base_block+blocks_num+end_base_block)*1+pre_base+2)
-      b = data_op.split_str(a, ' ', '\n')
-      if ( len(b) > 5 ):
-        second_frame_id = int(b[2].strip(','))
-        second_time = float(b[5].strip(','))
-      else:
-        second_frame_id = 0
-        second_time = 0.0
-
-      if ( file_type == 'coord_pdb' ):
-        a = linecache.getline(file_name, (frames_num_1-1)*(pre_base_block+blocks_num+end_base_block)+pre_base+1)
-      else:
-        a = linecache.getline(file_name, (frames_num_1-1)*(pre_base_block+blocks_num+end_base_block)+pre_base+2)
-      b = data_op.split_str(a, ' ', '\n')
-      if ( len(b) > 5 ):
-        end_frame_id = int(b[2].strip(','))
-    else:
-      start_frame_id = 0
-      end_frame_id = 0
-
-  if ( file_type == 'ener' or file_type == 'mix_ener' ):
-
-    a = linecache.getline(file_name, pre_base+1)
-    b = data_op.split_str(a, ' ')
-    start_frame_id = int(b[0])
-    start_time = float(b[1])
-
-    if ( whole_line_num_1 > pre_base_block+blocks_num+end_base_block+pre_base+1 ):
-      a = linecache.getline(file_name, (pre_base_block+blocks_num+end_base_block)*1+pre_base+1)
-      b = data_op.split_str(a, ' ')
-      second_frame_id = int(b[0])
-      second_time = float(b[1])
-
-      a = linecache.getline(file_name, whole_line_num_1)
-      b = data_op.split_str(a, ' ')
-      end_frame_id = int(b[0])
-    else:
-      end_frame_id = start_frame_id
-
-  if ( whole_line_num_1 > pre_base_block+blocks_num+end_base_block+pre_base+1 ):
-    each = second_frame_id-start_frame_id
-    time_step = (second_time-start_time)/each
-    frames_num_2 = (end_frame_id-start_frame_id)/each+1
-  else:
-    frames_num_2 = 1
-    time_step = 0.0
-    each = 1
-
-  if (frames_num_1 != frames_num_2):
-    traj_tools.delete_duplicate(file_name, file_type)
-
-  whole_line_num = len(open(file_name).readlines())
-  frames_num = int((whole_line_num-pre_base)/(pre_base_block+blocks_num+end_base_block))
+    blocks_num = traj_summary['atoms_num']
 
   #For groups, we will consider the connectivity.
   if return_group:
-    if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
+    if ( file_type == 'coord_xyz' or file_type == 'coord_pdb' or file_type == 'vel' or file_type == 'frc' ):
 
-      element = []
-      for i in range(blocks_num):
-        line_i = linecache.getline(file_name, i+pre_base+pre_base_block+1)
-        line_i_split = data_op.split_str(line_i, ' ')
-        element.append(line_i_split[0])
+      element = traj_reader.read_elements(file_name, frame_index, 0)
 
       group_atom_1_id = []
       group_atoms_mass = []
@@ -158,8 +160,6 @@ def get_traj_info(file_name, file_type, group=[[]], atom_id=[[]], return_group=F
             group_i_atom_1_id.append(j+1)
         group_atom_1_id.append(group_i_atom_1_id)
 
-  linecache.clearcache()
-
   if ( file_type == 'coord_xyz' or file_type == 'coord_pdb' or file_type == 'vel' or file_type == 'frc' ):
     if return_group:
       return blocks_num, pre_base_block, end_base_block, pre_base, frames_num, each, start_frame_id, \
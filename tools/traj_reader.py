@@ -0,0 +1,776 @@
+#!/usr/bin/env python
+
+import mmap
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from CP2K_kit.tools import data_op
+from CP2K_kit.tools import log_info
+from CP2K_kit.tools import get_cell
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_cache
+
+#CP2K writes -pos-1.xyz, -vel-1.xyz and -frc-1.xyz with fixed column widths,
+#so the atom lines of one frame could be viewed as a numpy record array and
+#decoded column by column. If the rows are not fixed-width, we tokenize them.
+#If the trajectory has an up-to-date binary cache, frames are read from the cache.
+#iter_chunks and iter_frames read a trajectory lazily in bounded-size chunks, so
+#analyze modules do not need to address lines of the trajectory file.
+#read_frames_parallel splits a long frame range across a process pool, and each
+#process writes its block into one shared memory array.
+#Compressed trajectories are decompressed in bounded spans by iter_traj_buffer.
+#For pdb files, ATOM records are decoded by their fixed columns (x in 31-38,
+#y in 39-46 and z in 47-54), it is chosen by the atom_offset of frame index.
+
+#The shared memory array of workers, it is set in init_shared_frames.
+shared_frames = {}
+
+def open_traj_buffer(file_name):
+
+  '''
+  open_traj_buffer: open a trajectory file as a read-only buffer.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+  Returns:
+    traj_buffer: mmap or bytes
+      traj_buffer is the content of the file.
+  '''
+
+  with open(file_name, 'rb') as traj_file:
+    try:
+      traj_buffer = mmap.mmap(traj_file.fileno(), 0, access=mmap.ACCESS_READ)
+    except ValueError:
+      #Empty file could not be mapped.
+      traj_buffer = traj_file.read()
+
+  return traj_buffer
+
+def iter_traj_buffer(file_name, frame_index, frame_list, span_bytes=64*1024**2):
+
+  '''
+  iter_traj_buffer: get the content of frames in frame_list as buffers.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory, it could contain several files.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the trajectory.
+    span_bytes: int
+      span_bytes is the upper bound of a span read from compressed file.
+  Returns:
+    traj_buffer: mmap or bytes
+      traj_buffer is the content of the file, or a span of compressed file.
+    base: int
+      base is the offset of traj_buffer in the trajectory, the frame at offset
+      frame_index['offset'][i] starts at offset[i]-base in traj_buffer.
+    frame_list_i: 1-d int list
+      frame_list_i contains the frames in traj_buffer.
+  '''
+
+  #For a trajectory of several files, frames are grouped by file, and base maps
+  #the offset in the merged index to the offset in traj_buffer.
+  offset = frame_index['offset']
+  if ( 'file_id' in frame_index ):
+    file_list = [str(name) for name in frame_index['file_list']]
+    frame_file = frame_index['file_id'][frame_list]
+    frame_shift = offset[frame_list]-frame_index['file_offset'][frame_list]
+  else:
+    file_list = [file_name]
+    frame_file = np.zeros(len(frame_list), dtype='int64')
+    frame_shift = np.zeros(len(frame_list), dtype='int64')
+
+  #Compressed file could not be mapped, so frames are decompressed in spans,
+  #a new span is started when it is too long or the frames go backward.
+  buffer_dic = {}
+  try:
+    i_start = 0
+    for i in range(1, len(frame_list)+1):
+      if ( i < len(frame_list) and frame_file[i] == frame_file[i_start] and frame_shift[i] == frame_shift[i_start] ):
+        if not traj_index.is_compressed(file_list[frame_file[i_start]]):
+          continue
+        if ( frame_list[i] >= frame_list[i-1] and \
+             offset[frame_list[i]+1]-offset[frame_list[i_start]] <= span_bytes ):
+          continue
+      traj_file = file_list[frame_file[i_start]]
+      shift = int(frame_shift[i_start])
+      if traj_index.is_compressed(traj_file):
+        start = int(offset[frame_list[i_start]])-shift
+        end = int(offset[frame_list[i-1]+1])-shift
+        yield traj_index.read_traj_bytes(traj_file, start, end), start+shift, frame_list[i_start:i]
+      else:
+        if ( traj_file not in buffer_dic ):
+          buffer_dic[traj_file] = open_traj_buffer(traj_file)
+        yield buffer_dic[traj_file], shift, frame_list[i_start:i]
+      i_start = i
+  finally:
+    for traj_buffer in buffer_dic.values():
+      if isinstance(traj_buffer, mmap.mmap):
+        traj_buffer.close()
+
+def get_body_offset(traj_buffer, frame_start):
+
+  '''
+  get_body_offset: get the offset of the first atom line of a xyz frame.
+
+  Args:
+    traj_buffer: mmap or bytes
+      traj_buffer is the content of the trajectory file.
+    frame_start: int
+      frame_start is the offset of the frame.
+  Returns:
+    body_start: int
+      body_start is the offset of the first atom line.
+  '''
+
+  line_1_end = traj_buffer.find(b'\n', frame_start)
+  line_2_end = traj_buffer.find(b'\n', line_1_end+1)
+
+  return line_2_end+1
+
+def get_line_dtype(line):
+
+  '''
+  get_line_dtype: get the record type of fixed-width atom lines from the first line.
+
+  Args:
+    line: bytes
+      line is the first atom line of a frame, including the newline.
+      Example: b'  O         6.2867287480        2.6534917545        0.4360200785\n'
+  Returns:
+    line_dtype: numpy dtype or None
+      line_dtype contains element, x, y, z and the rest of the line. If the line
+      does not have 4 columns, None is returned.
+  '''
+
+  #Columns are ended at the end of each token, so the spaces before a token belong to it.
+  token_end = []
+  in_token = False
+  for i in range(len(line)):
+    is_space = line[i:i+1] in (b' ', b'\t', b'\n', b'\r')
+    if ( in_token and is_space ):
+      token_end.append(i)
+    in_token = not is_space
+
+  if ( len(token_end) < 4 ):
+    return None
+
+  names = ['element', 'x', 'y', 'z', 'rest']
+  bounds = [0]+token_end[0:4]+[len(line)]
+  formats = []
+  for i in range(5):
+    formats.append(''.join(('S', str(bounds[i+1]-bounds[i]))))
+
+  return np.dtype({'names': names, 'formats': formats})
+
+def check_fixed_width(body, line_dtype, atoms_num):
+
+  '''
+  check_fixed_width: check whether atom lines in a frame body are fixed-width.
+
+  Args:
+    body: bytes-like
+      body is the atom lines of a frame.
+    line_dtype: numpy dtype
+      line_dtype is the record type of atom lines.
+    atoms_num: int
+      atoms_num is the number of atoms in the frame.
+  Returns:
+    fixed: bool
+  '''
+
+  line_len = line_dtype.itemsize
+  if ( len(body) != line_len*atoms_num ):
+    return False
+
+  body_array = np.frombuffer(body, dtype='uint8').reshape(atoms_num, line_len)
+  if not np.all(body_array[:,line_len-1] == ord('\n')):
+    return False
+
+  #The first character of y, z columns must be space and the last character
+  #of each value column must not be space in every line.
+  for name in ['x', 'y', 'z']:
+    col_start = line_dtype.fields[name][1]
+    col_end = col_start+line_dtype.fields[name][0].itemsize
+    if not np.all(body_array[:,col_start] == ord(' ')):
+      return False
+    if np.any(body_array[:,col_end-1] == ord(' ')):
+      return False
+
+  return True
+
+def decode_body_fixed(body, line_dtype, atoms_num, atom_index):
+
+  '''
+  decode_body_fixed: decode coordinates of fixed-width atom lines.
+
+  Args:
+    body: bytes-like
+      body is the atom lines of a frame.
+    line_dtype: numpy dtype
+      line_dtype is the record type of atom lines.
+    atoms_num: int
+      atoms_num is the number of atoms in the frame.
+    atom_index: 1-d int array
+      atom_index is the index (starting from 0) of choosed atoms.
+  Returns:
+    coord: 2-d float array, dim = len(atom_index)*3
+  '''
+
+  records = np.frombuffer(body, dtype=line_dtype, count=atoms_num)[atom_index]
+  coord = np.empty((len(atom_index), 3), dtype='float64')
+  coord[:,0] = records['x'].astype('float64')
+  coord[:,1] = records['y'].astype('float64')
+  coord[:,2] = records['z'].astype('float64')
+
+  return coord
+
+def decode_body_token(body, atoms_num, atom_index):
+
+  '''
+  decode_body_token: decode coordinates of atom lines by splitting tokens.
+
+  Args:
+    body: bytes-like
+      body is the atom lines of a frame.
+    atoms_num: int
+      atoms_num is the number of atoms in the frame.
+    atom_index: 1-d int array
+      atom_index is the index (starting from 0) of choosed atoms.
+  Returns:
+    coord: 2-d float array, dim = len(atom_index)*3
+  '''
+
+  lines = bytes(body).decode().splitlines()
+  coord = np.empty((len(atom_index), 3), dtype='float64')
+  for i in range(len(atom_index)):
+    line_split = data_op.split_str(lines[atom_index[i]], ' ')
+    coord[i,0] = float(line_split[1])
+    coord[i,1] = float(line_split[2])
+    coord[i,2] = float(line_split[3])
+
+  return coord
+
+def get_pdb_dtype(line_len):
+
+  '''
+  get_pdb_dtype: get the record type of fixed-width ATOM records.
+
+  Args:
+    line_len: int
+      line_len is the length of ATOM record, including the newline.
+  Returns:
+    line_dtype: numpy dtype
+      line_dtype contains record name, columns before coordinates, x, y, z and the rest.
+  '''
+
+  names = ['record', 'name', 'x', 'y', 'z', 'rest']
+  formats = ['S6', 'S24', 'S8', 'S8', 'S8', ''.join(('S', str(line_len-54)))]
+
+  return np.dtype({'names': names, 'formats': formats})
+
+def is_atom_record(line):
+
+  '''
+  is_atom_record: check whether a line of pdb file is an ATOM or HETATM record.
+
+  Args:
+    line: string
+      line is a line of pdb file.
+  Returns:
+    atom_record: bool
+  '''
+
+  return ( line.startswith('ATOM  ') or line.startswith('HETATM') )
+
+def decode_pdb_body(body, atoms_num, atom_index):
+
+  '''
+  decode_pdb_body: decode coordinates of ATOM records in a pdb frame.
+
+  Args:
+    body: bytes-like
+      body is the content of frame from the first ATOM record to the end of frame.
+    atoms_num: int
+      atoms_num is the number of atoms in the frame.
+    atom_index: 1-d int array
+      atom_index is the index (starting from 0) of choosed atoms.
+  Returns:
+    coord: 2-d float array, dim = len(atom_index)*3
+  '''
+
+  #CP2K writes ATOM records continuously with same width, then they are viewed as
+  #a record array. Otherwise (such as TER records between chains), we slice lines.
+  line_len = bytes(body[0:1024]).find(b'\n')+1
+  if ( line_len > 54 and atoms_num*line_len <= len(body) ):
+    body_array = np.frombuffer(body, dtype='uint8', count=atoms_num*line_len).reshape(atoms_num, line_len)
+    record = body_array[:,0:6]
+    atom_record = np.all(record == np.frombuffer(b'ATOM  ', dtype='uint8'), axis=1) | \
+                  np.all(record == np.frombuffer(b'HETATM', dtype='uint8'), axis=1)
+    if ( np.all(atom_record) and np.all(body_array[:,line_len-1] == ord('\n')) ):
+      try:
+        records = np.frombuffer(body, dtype=get_pdb_dtype(line_len), count=atoms_num)[atom_index]
+        coord = np.empty((len(atom_index), 3), dtype='float64')
+        coord[:,0] = records['x'].astype('float64')
+        coord[:,1] = records['y'].astype('float64')
+        coord[:,2] = records['z'].astype('float64')
+        return coord
+      except ValueError:
+        pass
+
+  lines = [line for line in bytes(body).decode().splitlines() if is_atom_record(line)]
+  coord = np.empty((len(atom_index), 3), dtype='float64')
+  for i in range(len(atom_index)):
+    line = lines[atom_index[i]]
+    coord[i,0] = float(line[30:38])
+    coord[i,1] = float(line[38:46])
+    coord[i,2] = float(line[46:54])
+
+  return coord
+
+def get_frame_list(frame_index, init_step, end_step):
+
+  '''
+  get_frame_list: get serial numbers of frames whose step ids are between init_step and end_step.
+
+  Args:
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    init_step: int
+      init_step is the initial step frame id.
+    end_step: int
+      end_step is the ending step frame id.
+  Returns:
+    frame_list: 1-d int array
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+  '''
+
+  step = frame_index['step']
+  frame_list = np.nonzero((step >= init_step) & (step <= end_step))[0]
+
+  return frame_list
+
+def read_frames(file_name, frame_index, frame_list, atom_id=[]):
+
+  '''
+  read_frames: read coordinates (or velocities, forces) of a block of frames.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+    atom_id: 1-d int list
+      atom_id is the id (starting from 1) of choosed atoms. If it is empty, all atoms are read.
+  Returns:
+    coord: 3-d float array, dim = len(frame_list)*len(atom_id)*3
+      coord is Fortran-ordered float32 array.
+  '''
+
+  cache_header = traj_cache.load_cache_header(file_name)
+  if ( cache_header is not None and len(frame_list) > 0 ):
+    coord = traj_cache.read_cache(file_name, cache_header, frame_list)
+    if ( len(atom_id) != 0 ):
+      coord = coord[:,np.array(atom_id, dtype='int64')-1,:]
+    return np.asfortranarray(coord, dtype='float32')
+
+  atoms_num_first = int(frame_index['atoms_num'][frame_list[0]]) if len(frame_list) > 0 else 0
+  if ( len(atom_id) == 0 ):
+    atom_index = np.arange(atoms_num_first)
+  else:
+    atom_index = np.array(atom_id, dtype='int64')-1
+
+  coord = np.asfortranarray(np.zeros((len(frame_list), len(atom_index), 3)), dtype='float32')
+
+  line_dtype = None
+  i = 0
+  for traj_buffer, base, frame_list_i in iter_traj_buffer(file_name, frame_index, frame_list):
+    for frame_num in frame_list_i:
+      frame_num = int(frame_num)
+      atoms_num = int(frame_index['atoms_num'][frame_num])
+      if ( 'atom_offset' in frame_index ):
+        body_start = int(frame_index['offset'][frame_num])-base+int(frame_index['atom_offset'][frame_num])
+        body_end = int(frame_index['offset'][frame_num+1])-base
+        body = memoryview(traj_buffer)[body_start:body_end]
+        coord[i,:,:] = decode_pdb_body(body, atoms_num, atom_index)
+        body.release()
+        i = i+1
+        continue
+      body_start = get_body_offset(traj_buffer, int(frame_index['offset'][frame_num])-base)
+      body_end = int(frame_index['offset'][frame_num+1])-base
+      body = memoryview(traj_buffer)[body_start:body_end]
+
+      if ( line_dtype is None ):
+        first_line_end = traj_buffer.find(b'\n', body_start)
+        line_dtype = get_line_dtype(bytes(traj_buffer[body_start:first_line_end+1]))
+      if ( line_dtype is not None and check_fixed_width(body, line_dtype, atoms_num) ):
+        try:
+          coord[i,:,:] = decode_body_fixed(body, line_dtype, atoms_num, atom_index)
+        except ValueError:
+          coord[i,:,:] = decode_body_token(body, atoms_num, atom_index)
+      else:
+        coord[i,:,:] = decode_body_token(body, atoms_num, atom_index)
+      body.release()
+      i = i+1
+
+  return coord
+
+def read_elements(file_name, frame_index, frame_num=0):
+
+  '''
+  read_elements: read element names of atoms in one frame.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_num: int
+      frame_num is the serial number (starting from 0) of the frame.
+  Returns:
+    element: 1-d string list
+  '''
+
+  cache_header = traj_cache.load_cache_header(file_name)
+  if ( cache_header is not None and 'element' in cache_header ):
+    return cache_header['element']
+
+  lines = traj_index.read_frame_lines(file_name, frame_index, frame_num)
+  element = []
+  if ( 'atom_offset' in frame_index ):
+    #The element symbol is in columns 77-78, if it is empty, the atom name is used.
+    for line in lines:
+      if is_atom_record(line):
+        element_i = line[76:78].strip()
+        if ( element_i == '' ):
+          element_i = ''.join([x for x in line[12:16] if x.isalpha()])
+        element.append(element_i)
+    return element
+
+  for line in lines[2:]:
+    element.append(data_op.split_str(line, ' ')[0])
+
+  return element
+
+def read_cells(file_name, frame_index, frame_list):
+
+  '''
+  read_cells: read cell vectors of frames from CRYST1 records of pdb file.
+
+  Args:
+    file_name: string
+      file_name is the name of pdb trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+  Returns:
+    cell: 3-d float array, dim = len(frame_list)*3*3
+      cell contains a, b and c vectors of each frame. If a frame has no CRYST1
+      record, its cell is zero.
+  '''
+
+  cell = np.zeros((len(frame_list), 3, 3), dtype='float64')
+  i = 0
+  for traj_buffer, base, frame_list_i in iter_traj_buffer(file_name, frame_index, frame_list):
+    for frame_num in frame_list_i:
+      frame_start = int(frame_index['offset'][frame_num])-base
+      header = bytes(traj_buffer[frame_start:frame_start+int(frame_index['atom_offset'][frame_num])]).decode()
+      for line in header.splitlines():
+        if line.startswith('CRYST1'):
+          a = float(line[6:15])
+          b = float(line[15:24])
+          c = float(line[24:33])
+          alpha = float(line[33:40])/180.0*np.pi
+          beta = float(line[40:47])/180.0*np.pi
+          gamma = float(line[47:54])/180.0*np.pi
+          cell[i,:,:] = get_cell.get_triclinic_cell(a, b, c, alpha, beta, gamma)
+      i = i+1
+
+  return cell
+
+def read_headers(file_name, frame_index, frame_list):
+
+  '''
+  read_headers: read the two header lines of frames (the records before atoms for pdb).
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+  Returns:
+    header: 1-d string list
+      header contains the two header lines (with newlines) of each frame.
+  '''
+
+  header = []
+  for traj_buffer, base, frame_list_i in iter_traj_buffer(file_name, frame_index, frame_list):
+    for frame_num in frame_list_i:
+      frame_start = int(frame_index['offset'][frame_num])-base
+      if ( 'atom_offset' in frame_index ):
+        body_start = frame_start+int(frame_index['atom_offset'][frame_num])
+      else:
+        body_start = get_body_offset(traj_buffer, frame_start)
+      header.append(bytes(traj_buffer[frame_start:body_start]).decode())
+
+  return header
+
+def read_lines_data(file_name, frame_index, frame_list):
+
+  '''
+  read_lines_data: read the values of frames in ener, cell or mix_ener file.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+  Returns:
+    data: 2-d float array, dim = len(frame_list)*(number of columns)
+      Example: for ener file, columns are step, time, kinetic energy, temperature,
+      potential energy, conserved quantity and used time.
+  '''
+
+  cache_header = traj_cache.load_cache_header(file_name)
+  if ( cache_header is not None and len(frame_list) > 0 ):
+    return np.array(traj_cache.read_cache(file_name, cache_header, frame_list), dtype='float64')
+
+  data = []
+  for traj_buffer, base, frame_list_i in iter_traj_buffer(file_name, frame_index, frame_list):
+    for frame_num in frame_list_i:
+      start = int(frame_index['offset'][frame_num])-base
+      end = int(frame_index['offset'][frame_num+1])-base
+      line_split = data_op.split_str(bytes(traj_buffer[start:end]).decode(), ' ', '\n')
+      data.append([float(x) for x in line_split])
+
+  return np.array(data, dtype='float64')
+
+def get_chunk_size(atoms_num, chunk_bytes=64*1024**2):
+
+  '''
+  get_chunk_size: get the number of frames in a chunk whose size is bounded.
+
+  Args:
+    atoms_num: int
+      atoms_num is the number of atoms in one frame.
+    chunk_bytes: int
+      chunk_bytes is the upper bound of memory of coordinates in a chunk.
+  Returns:
+    chunk_size: int
+  '''
+
+  return max(1, int(chunk_bytes/(max(1, atoms_num)*3*4)))
+
+def iter_chunks(file_name, file_type='coord_xyz', init_step=None, end_step=None, stride=1, \
+                atom_id=[], cell=None, chunk_size=0):
+
+  '''
+  iter_chunks: read a xyz-like trajectory lazily, chunk by chunk.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    file_type: string
+      file_type is the type of file. Supported types are coord_xyz, coord_pdb, vel and frc.
+    init_step: int
+      init_step is the initial step frame id. If it is None, it is the first step.
+    end_step: int
+      end_step is the ending step frame id. If it is None, it is the last step.
+    stride: int
+      stride is the interval of frames.
+    atom_id: 1-d int list
+      atom_id is the id (starting from 1) of choosed atoms. If it is empty, all atoms are read.
+    cell: 2-d float list, dim = 3*3
+      cell is the cell vectors. If it is None, the cell in binary cache (or the
+      CRYST1 record in the first frame of pdb file) is used.
+    chunk_size: int
+      chunk_size is the number of frames in a chunk. If it is 0, it is chosen
+      so that the coordinates in a chunk do not exceed 64 MB.
+  Returns:
+    element: 1-d string list
+      element contains element names of choosed atoms.
+    coord: 3-d float array, dim = (frames in chunk)*len(atom_id)*3
+      coord is Fortran-ordered float32 array.
+    cell: 2-d float list or None
+    step: 1-d int array
+      step contains step ids of frames in chunk.
+    time: 1-d float array
+      time contains time of frames in chunk.
+  '''
+
+  frame_index = traj_index.get_frame_index(file_name, file_type)
+  step = frame_index['step']
+  time = frame_index['time']
+  if ( len(step) == 0 ):
+    return
+
+  if ( init_step is None ):
+    init_step = int(step[0])
+  if ( end_step is None ):
+    end_step = int(step[len(step)-1])
+  frame_list = get_frame_list(frame_index, init_step, end_step)[::stride]
+
+  element = read_elements(file_name, frame_index, 0)
+  if ( len(atom_id) != 0 ):
+    element = [element[i-1] for i in atom_id]
+
+  if ( cell is None ):
+    cache_header = traj_cache.load_cache_header(file_name)
+    if ( cache_header is not None and 'cell' in cache_header ):
+      cell = cache_header['cell']
+    elif ( 'atom_offset' in frame_index and len(frame_list) != 0 ):
+      pdb_cell = read_cells(file_name, frame_index, frame_list[0:1])[0]
+      if np.any(pdb_cell != 0.0):
+        cell = pdb_cell.tolist()
+
+  if ( chunk_size == 0 ):
+    chunk_size = get_chunk_size(len(element))
+
+  for i in range(0, len(frame_list), chunk_size):
+    frame_list_i = frame_list[i:i+chunk_size]
+    coord = read_frames(file_name, frame_index, frame_list_i, atom_id)
+    yield element, coord, cell, step[frame_list_i], time[frame_list_i]
+
+def iter_frames(file_name, file_type='coord_xyz', init_step=None, end_step=None, stride=1, \
+                atom_id=[], cell=None, chunk_size=0):
+
+  '''
+  iter_frames: read a xyz-like trajectory lazily, frame by frame. Frames are
+               read from file in chunks, the arguments are same as iter_chunks.
+
+  Returns:
+    element: 1-d string list
+      element contains element names of choosed atoms.
+    coord: 2-d float array, dim = len(atom_id)*3
+      coord is Fortran-ordered float32 array.
+    cell: 2-d float list or None
+    step: int
+      step is the step id of the frame.
+    time: float
+      time is the time of the frame.
+  '''
+
+  for element, coord, cell, step, time in iter_chunks(file_name, file_type, init_step, end_step, stride, \
+                                                      atom_id, cell, chunk_size):
+    for i in range(len(step)):
+      yield element, coord[i], cell, int(step[i]), float(time[i])
+
+def init_shared_frames(file_name, frame_index, atom_id, shared_buffer, shape):
+
+  '''
+  init_shared_frames: initialize a worker process of read_frames_parallel.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    atom_id: 1-d int list
+      atom_id is the id (starting from 1) of choosed atoms.
+    shared_buffer: mmap
+      shared_buffer is the anonymous shared memory of the array.
+    shape: tuple
+      shape is the shape of the array.
+  Returns:
+    none
+  '''
+
+  shared_frames['file_name'] = file_name
+  shared_frames['frame_index'] = frame_index
+  shared_frames['atom_id'] = atom_id
+  shared_frames['coord'] = np.ndarray(shape, dtype='float32', buffer=shared_buffer, order='F')
+
+def read_frames_block(block):
+
+  '''
+  read_frames_block: read a block of frames into the shared memory array.
+
+  Args:
+    block: list
+      block is [start, frame_list], start is the position of the block in the array.
+  Returns:
+    frames_num: int
+      frames_num is the number of frames read.
+  '''
+
+  start, frame_list = block
+  coord = read_frames(shared_frames['file_name'], shared_frames['frame_index'], frame_list, shared_frames['atom_id'])
+  shared_frames['coord'][start:start+len(frame_list)] = coord
+
+  return len(frame_list)
+
+def read_frames_parallel(file_name, frame_index, frame_list, atom_id=[], proc_num=0, parallel_frames_num=2000):
+
+  '''
+  read_frames_parallel: read a long range of frames with a process pool.
+
+  Args:
+    file_name: string
+      file_name is the name of trajectory file.
+    frame_index: dictionary
+      frame_index is the frame index of the trajectory file.
+    frame_list: 1-d int list
+      frame_list contains serial numbers (starting from 0) of frames in the file.
+    atom_id: 1-d int list
+      atom_id is the id (starting from 1) of choosed atoms. If it is empty, all atoms are read.
+    proc_num: int
+      proc_num is the number of processes. If it is 0, all cores are used.
+    parallel_frames_num: int
+      If there are less frames than parallel_frames_num, frames are read in serial.
+  Returns:
+    coord: 3-d float array, dim = len(frame_list)*len(atom_id)*3
+      coord is Fortran-ordered float32 array.
+  '''
+
+  if ( proc_num == 0 ):
+    proc_num = multiprocessing.cpu_count()
+
+  #Workers inherit the shared memory by fork, so we need fork start method.
+  #A compressed file is one decompressed stream, it is read in serial.
+  fork_exist = 'fork' in multiprocessing.get_all_start_methods()
+  if ( proc_num == 1 or len(frame_list) < parallel_frames_num or not fork_exist or \
+       traj_index.is_compressed(file_name) ):
+    return read_frames(file_name, frame_index, frame_list, atom_id)
+
+  if ( len(atom_id) == 0 ):
+    atoms_num = int(frame_index['atoms_num'][frame_list[0]])
+  else:
+    atoms_num = len(atom_id)
+  shape = (len(frame_list), atoms_num, 3)
+
+  #The array is backed by anonymous shared memory, so the blocks written by
+  #workers are assembled in place and the array is returned without copying.
+  shared_buffer = mmap.mmap(-1, len(frame_list)*atoms_num*3*4)
+  coord = np.ndarray(shape, dtype='float32', buffer=shared_buffer, order='F')
+
+  block_list = []
+  start = 0
+  for frame_list_i in np.array_split(np.array(frame_list, dtype='int64'), proc_num*4):
+    if ( len(frame_list_i) != 0 ):
+      block_list.append([start, frame_list_i])
+      start = start+len(frame_list_i)
+
+  #If a worker dies (killed by signal or out of memory), the executor raises
+  #BrokenProcessPool, while multiprocessing.Pool would wait for the lost block.
+  fork_context = multiprocessing.get_context('fork')
+  try:
+    with ProcessPoolExecutor(proc_num, mp_context=fork_context, initializer=init_shared_frames, \
+                             initargs=(file_name, frame_index, atom_id, shared_buffer, shape)) as executor:
+      for frames_num in executor.map(read_frames_block, block_list):
+        pass
+  except BrokenProcessPool:
+    log_info.log_error('Running error: a process reading %s terminated abruptly, please check the memory or the file' %(file_name))
+    exit()
+
+  return coord
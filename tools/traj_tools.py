@@ -1,10 +1,34 @@
 #!/usr/bin/env python
 
 import os
-import math
-import linecache
-from CP2K_kit.tools import call
+import numpy as np
 from CP2K_kit.tools import data_op
+from CP2K_kit.tools import log_info
+from CP2K_kit.tools import traj_index
+from CP2K_kit.tools import traj_reader
+
+def get_head_lines(file_name, lines_num):
+
+  '''
+  get_head_lines: get the first several lines of a file without loading the whole file.
+
+  Args:
+    file_name: string
+      file_name is the name of the file.
+    lines_num: int
+      lines_num is the number of lines needed.
+  Returns:
+    lines: 1-d string list
+      lines contains the first lines_num lines. If the file is shorter, empty strings are appended.
+      For a trajectory of several files, the first file is read.
+  '''
+
+  lines = []
+  with traj_index.open_traj(traj_index.get_file_list(file_name)[0], 'rt') as f:
+    for i in range(lines_num):
+      lines.append(f.readline())
+
+  return lines
 
 def get_block_base(file_name, file_type):
 
@@ -28,14 +52,13 @@ def get_block_base(file_name, file_type):
   '''
 
   if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
-    line = linecache.getline(file_name, 1)
-    block_num = int(line.strip('\n'))
+    line_1, line_2 = get_head_lines(file_name, 2)
+    block_num = int(line_1.strip('\n'))
     pre_base = 0
     pre_base_block = 2
     end_base_block = 0
-    line = linecache.getline(file_name, 2)
-    line_split = data_op.split_str(line, ' ')
-    if ( len(line_split) > 1 ):
+    line_split = data_op.split_str(line_2, ' ')
+    if ( len(line_split) > 2 ):
       if ( data_op.eval_str(line_split[2].strip(',')) == 1 ):
         file_start = int(line_split[2].strip(','))
       else:
@@ -43,65 +66,41 @@ def get_block_base(file_name, file_type):
     else:
       file_start = 0
 
-    linecache.clearcache()
-
   if ( file_type == 'coord_pdb' ):
+    #The line numbers are got from the first frame of frame index, the records
+    #before the first frame are counted in pre_base.
+    frame_index = traj_index.get_frame_index(file_name, file_type)
+    if ( len(frame_index['step']) == 0 ):
+      log_info.log_error('File error: there is no complete frame in %s, please check' %(file_name))
+      exit()
+    frame_lines = traj_index.read_frame_lines(file_name, frame_index, 0)
+    atom_line_id = [i for i in range(len(frame_lines)) if frame_lines[i].startswith(('ATOM  ', 'HETATM'))]
+    block_num = int(frame_index['atoms_num'][0])
+    pre_base_block = atom_line_id[0]
+    end_base_block = len(frame_lines)-atom_line_id[-1]-1
     pre_base = 0
-    while True:
-      line = linecache.getline(file_name, pre_base+1)
-      line_split = data_op.split_str(line, ' ')
-      if ( line_split[0] != 'ATOM' ):
-        pre_base = pre_base+1
-      else:
-        break
-    block_num = 0
-    while True:
-      line = linecache.getline(file_name, pre_base+block_num+1)
-      line_split = data_op.split_str(line, ' ')
-      if ( line_split[0] == 'ATOM' ):
-        block_num = block_num+1
-      else:
-        break
-    end_base_block = 1
-    whole_line_num = len(open(file_name, 'r').readlines())
-    if ( whole_line_num > pre_base+block_num+1 ):
-      pre_base_block = 0
-      while True:
-        line = linecache.getline(file_name, pre_base+block_num+end_base_block+pre_base_block+1)
-        line_split = data_op.split_str(line, ' ')
-        if ( line_split[0] != 'ATOM' ):
-          pre_base_block = pre_base_block+1
-        else:
-          break
-    else:
-      pre_base_block = 0
-    pre_base = pre_base-pre_base_block
-    line = linecache.getline(file_name, pre_base+1)
-    line_split = data_op.split_str(line, ' ')
-    file_start = int(line_split[2].strip(','))
+    if ( int(frame_index['offset'][0]) != 0 and 'file_id' not in frame_index ):
+      pre_base = traj_index.read_traj_bytes(file_name, 0, int(frame_index['offset'][0])).count(b'\n')
+    file_start = int(frame_index['step'][0])
 
   if ( file_type == 'mix_ener' ):
     block_num = 1
     pre_base = 0
     pre_base_block = 0
     end_base_block = 0
-    line = linecache.getline(file_name, 1)
+    line = get_head_lines(file_name, 1)[0]
     line_split = data_op.split_str(line, ' ')
     file_start = int(line_split[0])
 
-    linecache.clearcache()
-
   if ( file_type == 'ener' ):
     block_num = 1
     pre_base = 1
     pre_base_block = 0
     end_base_block = 0
-    line = linecache.getline(file_name, 2)
+    line = get_head_lines(file_name, 2)[1]
     line_split = data_op.split_str(line, ' ')
     file_start = int(line_split[0])
 
-    linecache.clearcache()
-
   if ( file_type == 'lagrange' ):
     block_num = 2
     pre_base = 0
@@ -111,7 +110,7 @@ def get_block_base(file_name, file_type):
 
   return block_num, pre_base, pre_base_block, end_base_block, file_start
 
-def find_breakpoint(file_name, file_type):
+def find_breakpoint(file_name, file_type, truncate=False):
 
   '''
   find_breakpoint: find the incomplete frame in a trajectory file.
@@ -121,47 +120,68 @@ def find_breakpoint(file_name, file_type):
       file_name is the name of trajectory file used to analyze.
     file_type: string
       file_type is the type of file.
+    truncate: bool
+      truncate is whether to cut the file at the incomplete frame.
   Returns:
     breakpoint: int
       breakpoint is the incomplete frame id.
   '''
 
-  blocks_num, pre_base, pre_base_block, end_base_block, frame_start = get_block_base(file_name, file_type)
+  #The frame index stops at the first broken frame, so the breakpoint is the
+  #frame after the last indexed one, and its byte offset is the end of index.
+  frame_index = traj_index.get_frame_index(file_name, file_type)
+  step = frame_index['step']
+  if ( len(step) == 0 ):
+    breakpoint = 0
+  elif ( len(step) > 1 and step[1] != step[0] ):
+    breakpoint = int(step[-1])+int(step[1]-step[0])
+  else:
+    breakpoint = int(step[-1])+1
+
+  if ( truncate and int(frame_index['offset'][-1]) != int(frame_index['size']) ):
+    if traj_index.is_compressed(file_name):
+      log_info.log_error('File error: compressed file %s could not be truncated, please decompress it at first' %(file_name))
+      exit()
+    os.truncate(file_name, int(frame_index['offset'][-1]))
+    frame_index['size'] = frame_index['offset'][-1]
+    traj_index.dump_frame_index(file_name, frame_index)
 
-  work_dir = os.getcwd()
-  cmd = "grep %s %s" % ("'i = '", file_name)
-  frames_num = len(call.call_returns_shell(work_dir, cmd))
+  return breakpoint
 
-  whole_line_num = len(open(file_name).readlines())
+def copy_bytes(src_file, dst_file, start, end, buffer_size=16*1024**2):
 
-  #In general, we think the first frame is always correct.
-  #compare_list is used for comparing. It contains atom names.
-  compare_list = []
-  for i in range(blocks_num):
-    line = linecache.getline(file_name, pre_base+pre_base_block+i+1)
-    line_split = data_op.split_str(line, ' ')
-    compare_list.append(line_split[0])
-
-  breakpoint = frame_start
-  for i in range(frames_num-1):
-    breakpoint = i+frame_start
-    frame_list = []
-    for j in range(blocks_num):
-      line_num = pre_base+(pre_base_block+blocks_num+end_base_block)*i+pre_base_block+j+1
-      line = linecache.getline(file_name,line_num)
-      c = data_op.split_str(line, ' ')
-      frame_list.append(c[0])
-    if (frame_list != compare_list and frame_list != []):
-      break
+  '''
+  copy_bytes: copy the bytes between start and end of a file to another file.
 
-  linecache.clearcache()
+  Args:
+    src_file: file object
+      src_file is the source file opened in binary mode.
+    dst_file: file object
+      dst_file is the destination file opened in binary mode.
+    start: int
+      start is the starting byte offset.
+    end: int
+      end is the ending byte offset.
+    buffer_size: int
+      buffer_size is the size of bytes copied at once.
+  Returns:
+    none
+  '''
 
-  return breakpoint
+  src_file.seek(start)
+  remain = end-start
+  while ( remain > 0 ):
+    data = src_file.read(min(buffer_size, remain))
+    if ( len(data) == 0 ):
+      break
+    dst_file.write(data)
+    remain = remain-len(data)
 
 def delete_duplicate(file_name, file_type):
 
   '''
-  delete_duplicate: delete duplicate frames in a trajectory file.
+  delete_duplicate: delete duplicate frames in a trajectory file. For each step id,
+                    the last frame is kept, as it comes from the restarted run.
 
   Args:
     file_name: string
@@ -169,38 +189,49 @@ def delete_duplicate(file_name, file_type):
     file_type: string
       file_type is the type of file.
   Returns:
-    none
+    drop_step: 1-d int list
+      drop_step contains step ids of deleted frames, one for each deleted frame.
   '''
 
-  blocks_num, pre_base, pre_base_block, end_base_block, frame_start = get_block_base(file_name, file_type)
-
-  whole_line_num = len(open(file_name).readlines())
-  frames_num = math.ceil((whole_line_num-pre_base)/(pre_base_block+blocks_num+end_base_block))
-  total_line = []
-  #Choose the specific line
-  for i in range(frames_num):
-    if ( file_type == 'coord_xyz' or file_type == 'vel' or file_type == 'frc' ):
-      line = linecache.getline(file_name, i*(pre_base_block+blocks_num+end_base_block)+2+pre_base)
-    if ( file_type == 'mix_ener' or file_type == 'ener' ):
-      line = linecache.getline(file_name, i*(pre_base_block+blocks_num+end_base_block)+pre_base+1)
-    total_line.append(line)
-
-  linecache.clearcache()
-
-  duplicate = []
-  for index, line in enumerate(total_line):
-    for i in range(frames_num-index-1):
-      if ( line[0:13] == total_line[index+i+1][0:13] ):
-        duplicate.append(index)
-
-  #delete each duplicate frame
-  #For each delete, the file will change, so (duplicate[i]-i) is the trick.
-  work_dir = os.getcwd()
-  for i in range(len(duplicate)):
-    start_del = (duplicate[i]-i)*(pre_base_block+blocks_num+end_base_block)+pre_base+1
-    end_del = start_del+pre_base_block+blocks_num+end_base_block-1
-    cmd = "sed -ie %s %s" % (''.join((str(start_del), ',', str(end_del), 'd')), file_name)
-    call.call_simple_shell(work_dir, cmd)
+  frame_index = traj_index.get_frame_index(file_name, file_type)
+  offset = frame_index['offset']
+  step = frame_index['step']
+  frames_num = len(step)
+
+  #Go backward with a set, so the last occurrence of each step is kept.
+  keep = [False]*frames_num
+  step_exist = set()
+  for i in range(frames_num-1, -1, -1):
+    step_i = int(step[i])
+    if ( step_i not in step_exist ):
+      keep[i] = True
+      step_exist.add(step_i)
+
+  drop_step = [int(step[i]) for i in range(frames_num) if not keep[i]]
+  if ( len(drop_step) == 0 ):
+    return drop_step
+
+  #Write the cleaned file once, then replace the old file atomically.
+  #Contiguous kept frames are copied together. The temporary file keeps the
+  #suffix, so a compressed file is written with the same compression.
+  dir_name, base_name = os.path.split(os.path.abspath(file_name))
+  file_name_tmp = ''.join((dir_name, '/.', str(os.getpid()), '.', base_name))
+  with traj_index.open_traj(file_name, 'rb') as src_file, traj_index.open_traj(file_name_tmp, 'wb') as dst_file:
+    copy_bytes(src_file, dst_file, 0, int(offset[0]))
+    i = 0
+    while ( i < frames_num ):
+      if keep[i]:
+        j = i
+        while ( j < frames_num and keep[j] ):
+          j = j+1
+        copy_bytes(src_file, dst_file, int(offset[i]), int(offset[j]))
+        i = j
+      else:
+        i = i+1
+    copy_bytes(src_file, dst_file, int(offset[frames_num]), int(frame_index['size']))
+  os.replace(file_name_tmp, file_name)
+
+  return drop_step
 
 def choose_str(atoms_num, pre_base, pre_base_block, end_base_block, each, init_step, end_step, \
                start_frame_id, traj_coord_file, choose_line, work_dir, choose_file_name):
@@ -243,16 +274,17 @@ def choose_str(atoms_num, pre_base, pre_base_block, end_base_block, each, init_s
   for i in range(len(choose_line)):
     choose_num.append(len(choose_line[i]))
 
-  for i in range(int((end_step-init_step)/each+1)):
+  frame_index = traj_index.get_frame_index(traj_coord_file, 'coord_xyz')
+  frame_list = traj_reader.get_frame_list(frame_index, init_step, end_step)
+  for frame_num in frame_list:
+    frame_lines = traj_index.read_frame_lines(traj_coord_file, frame_index, int(frame_num))
     file_md.write(str(sum(choose_num))+'\n')
-    second_line = linecache.getline(traj_coord_file, (init_step-start_frame_id+i)*(pre_base_block+atoms_num+end_base_block)+2+pre_base)
-    file_md.write(second_line)
+    file_md.write(frame_lines[1])
     for j in range(len(choose_line)):
       for k in choose_line[j]:
-        line = linecache.getline(traj_coord_file, (init_step-start_frame_id+i)*(pre_base_block+atoms_num+end_base_block)+k+pre_base+pre_base_block)
-        file_md.write(line)
+        file_md.write(frame_lines[k+pre_base_block-1])
 
-  linecache.clearcache()
+  file_md.close()
 
   return choose_file
 
@@ -289,17 +321,16 @@ def order_traj_file(atoms_num, frames_num, each, init_step, traj_file, file_type
   new_traj_file_name = ''.join((work_dir, '/', file_name))
   new_traj_file = open(new_traj_file_name, 'w')
 
-  for i in range(frames_num):
-    line_i_1 = linecache.getline(traj_file, (pre_base_block+atoms_num+end_base_block)*int((init_step-start_frame_id)/each+i)+1+pre_base)
-    line_i_2 = linecache.getline(traj_file, (pre_base_block+atoms_num+end_base_block)*int((init_step-start_frame_id)/each+i)+2+pre_base)
-    new_traj_file.write(line_i_1)
-    new_traj_file.write(line_i_2)
+  frame_index = traj_index.get_frame_index(traj_file, 'coord_xyz')
+  frame_list = np.nonzero(frame_index['step'] >= init_step)[0][0:frames_num]
+  for frame_num in frame_list:
+    frame_lines = traj_index.read_frame_lines(traj_file, frame_index, int(frame_num))
+    new_traj_file.write(frame_lines[0])
+    new_traj_file.write(frame_lines[1])
     for j in range(len(order_list)):
       for k in order_list[j]:
-        line_ijk = linecache.getline(traj_file, (pre_base_block+atoms_num+end_base_block)*int((init_step-start_frame_id)/each+i)+pre_base_block+k+pre_base)
-        new_traj_file.write(line_ijk)
+        new_traj_file.write(frame_lines[pre_base_block+k-1])
 
-  linecache.clearcache()
   new_traj_file.close()
 
   return new_traj_file_name